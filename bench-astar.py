@@ -0,0 +1,122 @@
+#! /usr/bin/env python
+
+'''Compare pgu.algo.AStar with the old pgu.algo.astar.
+
+This makes random 256x256 maps, asks both for paths between the same
+random pairs of open cells, checks that they're just as long, and prints
+how long each took per path.  Then it times AStar with diagonal moves,
+and pgu.algo.HPAStar, once its clusters have been worked out.
+
+Usage: python bench-astar.py [paths] [--walls PERCENT] [--seed SEED]
+
+'''
+
+import os
+import sys
+import random
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'lib'))
+
+from pgu import algo
+
+SIZE = 256
+
+
+def make_layer(size, walls):
+    """Return a size x size grid with a wall around it, and walls% walls."""
+    layer = []
+    for y in xrange(size):
+        if y == 0 or y == size - 1:
+            layer.append([1] * size)
+        else:
+            layer.append([1] + [int(random.random() * 100 < walls)
+                                for x in xrange(size - 2)] + [1])
+    return layer
+
+
+def open_cell(layer):
+    while True:
+        x = random.randrange(len(layer[0]))
+        y = random.randrange(len(layer))
+        if not layer[y][x]:
+            return x, y
+
+
+def manhattan(a, b):
+    return abs(a[0] - b[0]) + abs(a[1] - b[1])
+
+
+def timed(f, pairs):
+    """Return (paths, seconds per path)."""
+    start = time.time()
+    paths = [f(a, b) for a, b in pairs]
+    return paths, (time.time() - start) / len(pairs)
+
+
+def main_():
+    args = sys.argv[1:]
+    paths = 20
+    walls = 25
+    seed = 0
+    if '--walls' in args:
+        i = args.index('--walls')
+        walls = int(args[i + 1])
+        del args[i:i + 2]
+    if '--seed' in args:
+        i = args.index('--seed')
+        seed = int(args[i + 1])
+        del args[i:i + 2]
+    if args:
+        paths = int(args[0])
+
+    random.seed(seed)
+    layer = make_layer(SIZE, walls)
+    pairs = [(open_cell(layer), open_cell(layer)) for i in xrange(paths)]
+    print 'map:               %dx%d, %d%% walls, %d paths' % (
+        SIZE, SIZE, walls, paths)
+
+    old, old_secs = timed(lambda a, b: algo.astar(a, b, layer, manhattan),
+                          pairs)
+    search = algo.AStar(layer)
+    new, new_secs = timed(search.search, pairs)
+    for (a, b), p, q in zip(pairs, old, new):
+        if len(p) != len(q):
+            print 'DIFFERENT: %s to %s is %d steps, not %d' % (
+                a, b, len(q), len(p))
+            sys.exit(1)
+    found = len([p for p in new if p])
+    print 'paths found:       %d' % found
+    print 'astar:             %.3fms per path' % (old_secs * 1000.0)
+    print 'AStar:             %.3fms per path, %.1fx faster' % (
+        new_secs * 1000.0, old_secs / new_secs)
+    for corners in (0, 1):
+        search = algo.AStar(layer, diagonals=True, corners=corners)
+        diag, secs = timed(search.search, pairs)
+        print 'AStar, diagonals, corners=%d: %.3fms per path' % (
+            corners, secs * 1000.0)
+    hpa = algo.HPAStar(layer)
+    start = time.time()
+    hpa.build()
+    print 'HPAStar clusters:  %.1fms' % ((time.time() - start) * 1000.0)
+    waypoints = []
+    times = []
+    for a, b in pairs:
+        start = time.time()
+        waypoints.append(hpa.search(a, b))
+        times.append(time.time() - start)
+    secs = sum(times) / len(times)
+    hpa_paths, refine_secs = timed(lambda w, x: list(hpa.refine(w)),
+                                   [(w, None) for w in waypoints])
+    print 'HPAStar:           %.3fms per search, %.3fms to refine it, ' \
+          '%.1f%% longer' % (secs * 1000.0, refine_secs * 1000.0,
+                             (sum(map(len, hpa_paths)) * 100.0 /
+                              sum(map(len, new)) - 100.0))
+    print 'HPAStar searches:  slowest %.3fms, %d of %d under 1ms' % (
+        max(times) * 1000.0, len([t for t in times if t < 0.001]),
+        len(times))
+
+
+if __name__ == '__main__':
+    main_()
@@ -0,0 +1,126 @@
+#! /usr/bin/env python
+
+'''Time pgu.isovid.Isovid on a big map.
+
+This makes a random 256x256 isometric map with raised and lowered tiles,
+scatters sprites over the part of it on the screen, and times a frame
+of each way of drawing it: paint, paint with chunks, and update while
+the sprites wander around, with and without chunks.  The tiles and
+sprites are made on the fly, so it doesn't need any data files.
+
+Usage: python bench-isovid.py [frames] [--sprites COUNT] [--seed SEED]
+
+'''
+
+import os
+import sys
+import random
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'lib'))
+
+import pygame
+from pgu import isovid, vid
+
+SIZE = 256
+TILE = 32
+SCREEN = (800, 600)
+
+
+def tile_image(color, tall):
+    """Return a colorkeyed diamond, on a pillar if tall."""
+    img = pygame.Surface((TILE, TILE)).convert()
+    img.fill((255, 0, 255))
+    img.set_colorkey((255, 0, 255))
+    if tall:
+        pygame.draw.rect(img, [c / 2 for c in color],
+                         (TILE / 4, 0, TILE / 2, TILE - TILE / 4))
+    pygame.draw.polygon(img, color, [(0, TILE * 3 / 4), (TILE / 2, TILE / 2),
+                                     (TILE - 1, TILE * 3 / 4),
+                                     (TILE / 2, TILE - 1)])
+    return img
+
+
+def make_vid(sprites):
+    g = isovid.Isovid()
+    g.tile_w, g.tile_h = TILE, TILE
+    g.iso_w, g.iso_h, g.iso_z = TILE, TILE, 1
+    g.base_w, g.base_h = TILE, TILE / 2
+    colors = [(60, 140, 60), (140, 120, 80), (90, 90, 160), (160, 160, 160)]
+    for n, color in enumerate(colors):
+        g.tiles[n + 1] = vid.Tile(tile_image(color, n >= 2))
+    g.resize((SIZE, SIZE))
+    g.blayer = [[1] * SIZE for y in xrange(SIZE)]
+    for y in xrange(SIZE):
+        for x in xrange(SIZE):
+            g.tlayer[y][x] = random.choice([0, 0, 0, 2, 3, 4])
+            g.zlayer[y][x] = random.choice([0, 0, 0, -4, 4])
+    # Center the view on the middle of the map.
+    x, y = g.tile_to_view((SIZE / 2, SIZE / 2))
+    g.view.x, g.view.y = x - SCREEN[0] / 2, y - SCREEN[1] / 2
+    image = pygame.Surface((16, 24)).convert()
+    image.fill((255, 255, 0))
+    for i in xrange(sprites):
+        pos = (random.randrange(SIZE / 2 - 12, SIZE / 2 + 12) * TILE,
+               random.randrange(SIZE / 2 - 12, SIZE / 2 + 12) * TILE)
+        g.sprites.append(vid.Sprite((image, pygame.Rect(8, 20, 1, 1)), pos))
+    return g
+
+
+def wander(g):
+    for s in g.sprites:
+        s.rect.x += random.randint(-2, 2)
+        s.rect.y += random.randint(-2, 2)
+
+
+def timed(screen, g, draw, frames, move):
+    """Return the milliseconds per frame to draw."""
+    draw(screen)
+    start = time.time()
+    for i in xrange(frames):
+        if move:
+            wander(g)
+        draw(screen)
+    return (time.time() - start) * 1000.0 / frames
+
+
+def main_():
+    args = sys.argv[1:]
+    frames = 50
+    sprites = 200
+    seed = 0
+    if '--sprites' in args:
+        i = args.index('--sprites')
+        sprites = int(args[i + 1])
+        del args[i:i + 2]
+    if '--seed' in args:
+        i = args.index('--seed')
+        seed = int(args[i + 1])
+        del args[i:i + 2]
+    if args:
+        frames = int(args[0])
+
+    pygame.display.init()
+    screen = pygame.display.set_mode(SCREEN)
+    print 'map:               %dx%d, %d sprites, %dx%d screen' % (
+        SIZE, SIZE, sprites, SCREEN[0], SCREEN[1])
+    for chunks in (False, True):
+        random.seed(seed)
+        g = make_vid(sprites)
+        name = 'paint'
+        if chunks:
+            g.use_chunks()
+            name = 'paint, chunks'
+        print '%-18s %.3fms per frame' % (
+            name + ':', timed(screen, g, g.paint, frames, False))
+        print '%-18s %.3fms per frame' % (
+            name.replace('paint', 'update') + ':',
+            timed(screen, g, g.update, frames, True))
+    print 'chunks:            %(surfaces)d, %(bytes)d bytes, %(misses)d ' \
+          'rendered' % g.chunks.stats()
+
+
+if __name__ == '__main__':
+    main_()
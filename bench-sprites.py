@@ -0,0 +1,106 @@
+#! /usr/bin/env python
+
+'''Count the allocations the game makes per frame.
+
+This runs the level headless with the space bar held down, so the player
+and the turrets are firing the whole time, and counts how many sprites,
+Rects and Surfaces get made per frame.
+
+Usage: python bench-sprites.py [frames] [--no-pool]
+
+--no-pool turns off sprite recycling so you can see the difference.
+
+'''
+
+import os
+import sys
+import random
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'lib'))
+
+import pygame
+from pygame.locals import *
+import main
+from pgu import timer, vid, tilevid
+
+# These are the C functions that hand back a brand new Surface.
+SURFACE_FUNCS = ('copy', 'rotate', 'subsurface', 'render', 'convert_alpha')
+
+counts = {'rect': 0, 'surface': 0}
+
+RealRect = pygame.Rect
+
+
+class CountingRect(RealRect):
+
+    def __init__(self, *args):
+        counts['rect'] += 1
+        RealRect.__init__(self, *args)
+
+
+def profile(frame, event, arg):
+    if event == 'c_call':
+        name = arg.__name__
+        if name in SURFACE_FUNCS:
+            counts['surface'] += 1
+        elif name == 'get_rect':
+            counts['rect'] += 1
+
+
+class HeldKeys:
+
+    def __getitem__(self, key):
+        return key == K_SPACE
+
+
+def run(frames, profiled):
+    random.seed(0)
+    screen = pygame.display.get_surface()
+    v = main.LevelTilevid(screen, timer.Timer(0))
+    pool = main.Artillery.pool
+    pool.created = pool.recycled = 0
+    counts['rect'] = counts['surface'] = 0
+    start = time.time()
+    if profiled:
+        sys.setprofile(profile)
+    for i in xrange(frames):
+        v.step()
+        if v.next_vid is not None:
+            break
+    sys.setprofile(None)
+    return v.frame, time.time() - start, pool
+
+
+def main_():
+    args = sys.argv[1:]
+    frames = 600
+    if '--no-pool' in args:
+        args.remove('--no-pool')
+        main.Artillery.pool.max_size = 0
+    if args:
+        frames = int(args[0])
+
+    pygame.display.init()
+    pygame.font.init()
+    pygame.display.set_mode((main.SCREEN_WIDTH, main.SCREEN_HEIGHT))
+    pygame.key.get_pressed = HeldKeys
+    main.play_wav = lambda *args: None
+    for module in (pygame, vid, tilevid):
+        module.Rect = CountingRect
+
+    n, secs, pool = run(frames, False)
+    print 'frames:            %d' % n
+    print 'ms per frame:      %.3f' % (secs * 1000.0 / n)
+    n, secs, pool = run(frames, True)
+    print 'shots created:     %d' % pool.created
+    print 'shots recycled:    %d' % pool.recycled
+    print 'Rects per frame:   %.2f' % (counts['rect'] / float(n))
+    print 'Surfaces per frame: %.2f' % (counts['surface'] / float(n))
+
+
+if __name__ == '__main__':
+    main_()
@@ -0,0 +1,104 @@
+#! /usr/bin/env python
+
+'''Helper script for packing the data directory into a single file.
+
+The game reads its data out of data.pack, if there is one, instead of
+opening every file in the data directory.  See lib/data.py.
+
+Usage: python create-pack.py [--compress] [pack filename]
+
+--compress zlib compresses the files that get at least 10% smaller.
+Compressed files can't be read straight out of the memory mapped pack,
+so only use it if the size of the download matters more than how fast
+the game starts.
+
+The script ignores the same files as create-upload.py.
+
+'''
+
+import os
+import struct
+import sys
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'lib'))
+
+import data
+
+ALIGN = 16  # Start each file on a boundary this big.
+
+
+def find_files():
+    '''Return the names of the files to pack, relative to the data dir.'''
+    names = []
+    for dirpath, dirnames, filenames in os.walk(data.data_dir):
+        for name in 'CVS', '.svn':
+            if name in dirnames:
+                dirnames.remove(name)
+        for name in filenames:
+            suffix = os.path.splitext(name)[1]
+            if suffix in ('.pyc', '.pyo'): continue
+            if name[0] == '.': continue
+            path = os.path.join(dirpath, name)
+            names.append(path[len(data.data_dir) + 1:].replace(os.sep, '/'))
+    names.sort()
+    return names
+
+
+def main():
+    args = sys.argv[1:]
+    compress = '--compress' in args
+    if compress:
+        args.remove('--compress')
+    if len(args) > 1:
+        print __doc__
+        sys.exit(1)
+    if args:
+        pack_path = args[0]
+    else:
+        pack_path = data.pack_path
+
+    names = find_files()
+    blobs = []
+    for name in names:
+        f = open(os.path.join(data.data_dir, name), 'rb')
+        try:
+            blob = f.read()
+        finally:
+            f.close()
+        size, flags = len(blob), 0
+        if compress:
+            z = zlib.compress(blob, 9)
+            if len(z) < len(blob) * 0.9:
+                blob, flags = z, data.PACK_ZLIB
+        blobs.append((name, size, flags, blob))
+
+    # The index goes first, so figure out how big it is.
+    pos = struct.calcsize(data.PACK_HEADER)
+    pos += sum([struct.calcsize(data.PACK_ENTRY) + len(name)
+                for name in names])
+    index = [struct.pack(data.PACK_HEADER, data.PACK_MAGIC,
+                         data.PACK_VERSION, len(names))]
+    offsets = []
+    for name, size, flags, blob in blobs:
+        pos += -pos % ALIGN
+        index.append(struct.pack(data.PACK_ENTRY, pos, size, len(blob),
+                                 flags, len(name)) + name)
+        offsets.append(pos)
+        pos += len(blob)
+
+    f = open(pack_path, 'wb')
+    try:
+        f.write(''.join(index))
+        for offset, (name, size, flags, blob) in zip(offsets, blobs):
+            f.write('\0' * (offset - f.tell()))
+            f.write(blob)
+    finally:
+        f.close()
+    print 'Packed %d files into %s (%d bytes).' % (len(names), pack_path,
+                                                   pos)
+
+
+if __name__ == '__main__':
+    main()
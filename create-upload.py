@@ -35,6 +35,9 @@ except RuntimeError:
 for name in 'README.txt run_game.py'.split():
     package.write(name, os.path.join(base, name))
 package.write('run_game.py', os.path.join(base, 'run_game.pyw'))
+if os.path.exists('data.pack'):
+    # Built by create-pack.py.
+    package.write('data.pack', os.path.join(base, 'data.pack'))
 
 # utility for adding subdirectories
 def add_files(generator):
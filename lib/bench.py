@@ -0,0 +1,220 @@
+# Copyright 2007 Adam Ulvi, Shannon Behrens
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""This is a headless benchmark for the game engine.
+
+Run it with ``python run_game.py --benchmark [scenario ...]``.
+
+It plays the level without a window, sound, or a human.  The random
+seed is fixed, the keyboard is scripted, and the timer doesn't wait, so
+every run does exactly the same work as fast as the machine allows.
+For each scenario it prints frames per second and how many milliseconds
+per frame went to each phase of the frame.
+
+The scenarios are:
+
+  level
+    Play the real level with the fire button held down.  The player
+    weaves left and right and can't be killed.
+
+  shots-1000, shots-5000, shots-20000
+    Hold the view still and keep that many shots flying around.  The
+    view is small and shots that leave it are gone, so they are packed
+    in tightly.  shots-20000 takes minutes per frame, so it only runs
+    if you name it.
+
+  turrets-500
+    Hold the view still with 500 turrets firing at the player.
+
+"""
+
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import pygame
+from pygame.locals import *
+
+import main
+from pgu import timer, vid
+
+__docformat__ = 'restructuredtext'
+
+PHASES = ['loop_sprites', 'loop_tilehits', 'loop_spritehits', 'paint']
+SEED = 0
+
+
+class ScriptedKeys:
+
+    """Stand in for pygame.key.get_pressed.
+
+    Fire is always held, and the player drifts left and right.
+
+    """
+
+    def __init__(self, g):
+        self.g = g
+
+    def __call__(self):
+        return self
+
+    def __getitem__(self, key):
+        if key == K_SPACE:
+            return True
+        left = (self.g.frame / 30) % 2
+        if key == K_LEFT:
+            return left
+        if key == K_RIGHT:
+            return not left
+        return False
+
+
+class Shooter:
+
+    """Just enough of a sprite to fire Artillery from."""
+
+    def __init__(self, g, group_name, agroup_name):
+        self.g = g
+        self.default_group_name = group_name
+        self.default_agroup_name = agroup_name
+
+
+class BenchLevelTilevid(main.LevelTilevid):
+
+    """A LevelTilevid that can be told to hold the view still."""
+
+    frozen = False
+
+    def pre_loop(self):
+        if not self.frozen:
+            main.LevelTilevid.pre_loop(self)
+
+
+def timed(times, name, f):
+    """Wrap f so that the time spent in it is added to times[name]."""
+
+    def g(*args):
+        start = time.time()
+        try:
+            return f(*args)
+        finally:
+            times[name] += time.time() - start
+
+    return g
+
+
+# Each setup function gets the vid, and returns None or a function to call
+# before every frame.
+
+def setup_level(v):
+    return None
+
+
+def setup_shots(count):
+
+    def f(v):
+        v.frozen = True
+        shooters = [Shooter(v, 'enemy', 'player'),
+                    Shooter(v, 'player', 'enemy')]
+        view = v.view
+
+        def top_up():
+            # Shots fly off the screen, so keep adding more.
+            for i in xrange(count - len(v.sprites)):
+                pos = (random.randint(view.left, view.right - 8),
+                       random.randint(view.top, view.bottom - 8))
+                main.Artillery.pool.get(random.choice(shooters), pos=pos,
+                                        angle=random.uniform(0, 6.28),
+                                        speed=random.uniform(1, 4))
+
+        return top_up
+
+    return f
+
+
+def setup_turrets(count):
+
+    def f(v):
+        v.frozen = True
+        view = v.view
+        t = vid.Tile()
+        for i in xrange(count):
+            t.tx, t.ty = 0, 0
+            t.rect = pygame.Rect(random.randint(view.left, view.right - 32),
+                                 random.randint(view.top, view.bottom - 32),
+                                 32, 32)
+            main.GunTurret(v, t, None)
+        return None
+
+    return f
+
+
+SCENARIOS = [
+    ('level', setup_level, 1400),  # The level is over after ~1460.
+    ('shots-1000', setup_shots(1000), 20),
+    ('shots-5000', setup_shots(5000), 5),
+    ('shots-20000', setup_shots(20000), 2),
+    ('turrets-500', setup_turrets(500), 40),
+]
+# The scenarios run when none are named.
+DEFAULT_SCENARIOS = ['level', 'shots-1000', 'shots-5000', 'turrets-500']
+
+
+def run_scenario(screen, setup, frames):
+    """Run one scenario, and return (frames, seconds, times)."""
+    random.seed(SEED)
+    v = BenchLevelTilevid(screen, timer.Timer(0))
+    v.get_pressed = ScriptedKeys(v)
+    v.player.set_invincible(True)
+    pre_step = setup(v)
+    times = dict([(name, 0.0) for name in PHASES])
+    for name in PHASES[:-1]:
+        setattr(v, name, timed(times, name, getattr(v, name)))
+    v.paint = timed(times, 'paint', v.paint)
+    v.scroll_update = timed(times, 'paint', v.scroll_update)
+    start = time.time()
+    for i in xrange(frames):
+        pygame.event.pump()
+        if pre_step is not None:
+            pre_step()
+        v.step()
+        v.timer.tick()
+    return frames, time.time() - start, times
+
+
+def main_(args):
+    """Run the scenarios named in args, or the DEFAULT_SCENARIOS."""
+    names = [name for name, setup, frames in SCENARIOS]
+    for arg in args:
+        if arg not in names:
+            print 'Unknown scenario %r.  Try one of: %s' % (
+                arg, ' '.join(names))
+            sys.exit(1)
+    pygame.display.init()
+    pygame.font.init()
+    screen = pygame.display.set_mode((main.SCREEN_WIDTH, main.SCREEN_HEIGHT))
+    print '%-12s %8s %8s' % ('scenario', 'frames', 'fps'),
+    print ' '.join(['%15s' % name for name in PHASES])
+    for name, setup, frames in SCENARIOS:
+        if name not in (args or DEFAULT_SCENARIOS):
+            continue
+        n, secs, times = run_scenario(screen, setup, frames)
+        print '%-12s %8d %8.1f' % (name, n, n / secs),
+        print ' '.join(['%12.3fms' % (times[phase] * 1000.0 / n)
+                        for phase in PHASES])
@@ -17,28 +17,468 @@
 
 Loads data files from the "data" directory shipped with a game.
 
-Enhancing this to handle caching etc. is left as an exercise for the reader.
+Everything loaded through here is kept in a registry, so each file is
+only read, decoded, and converted once, no matter how many Tilevids ask
+for it.  Everyone gets the same object, so don't draw on the images.
+Finding something in the registry doesn't touch the disk, so it's cheap
+enough to do every frame.  That also means a file that changes on disk
+isn't noticed by itself.  Call invalidate_changed to check the files
+everything was loaded from, and forget the ones that have changed, or
+invalidate if you know which file changed.  Either way, it gets loaded
+again the next time someone asks for it.
+
+Images and levels can also be preloaded: a worker thread reads and
+decodes them while the game keeps running, and finish_preloading, called
+from the main loop, converts them for the display a few at a time.
+
+If there's a data.pack next to the data directory (see create-pack.py),
+files are read out of it instead.  It's opened once and memory mapped, so
+starting the game doesn't need to open every file.  A loose file that's
+newer than the pack wins, so you can keep editing files in the data
+directory without rebuilding the pack.
 
 """
 
+import mmap
 import os
+import struct
+import threading
+import zlib
+from collections import deque
+from timeit import default_timer
+
+import pygame
+import pygame.mixer
 
 __docformat__ = 'restructuredtext'
 
 
 data_py = os.path.abspath(os.path.dirname(__file__))
 data_dir = os.path.normpath(os.path.join(data_py, '..', 'data'))
+pack_path = data_dir + '.pack'
+
+PACK_MAGIC = 'HCPK'
+PACK_VERSION = 1
+PACK_HEADER = '<4sBI'       # magic, version, number of entries
+PACK_ENTRY = '<QIIBH'       # offset, size, stored size, flags, name length
+PACK_ZLIB = 1               # The entry's flag for zlib compressed data.
+
+_assets = {}
+_mtimes = {}         # The mtime of the file each asset was loaded from.
+_fonts = {}
+_pack = None
+_steps = deque()     # Preload jobs and tasks for the main thread, in order.
+_jobs = deque()      # Preload jobs for the worker thread.
+_worker = None       # The worker thread, while there's work for it.
+_lock = threading.Lock()
+
+# If set, this gets called with (filename, kind, seconds) every time
+# something actually gets loaded, rather than found in the registry.
+load_hook = None
+
+
+class Blob:
+
+    """A read-only file-like object for part of a memory mapped pack.
+
+    Reads come straight out of the map, without reading the whole thing
+    into a string first.  Each read is still a copy of the bytes asked
+    for: pygame's image and sound loaders want strings from read, and
+    fail on a buffer or memoryview of the map.  mm can also be a string.
+
+    """
+
+    def __init__(self, mm, offset, size, name):
+        self.mm = mm
+        self.offset = offset
+        self.size = size
+        self.name = name
+        self.pos = 0
+
+    def read(self, n=-1):
+        left = self.size - self.pos
+        if n < 0 or n > left:
+            n = left
+        start = self.offset + self.pos
+        self.pos += n
+        return self.mm[start:start + n]
+
+    def seek(self, pos, whence=0):
+        if whence == 1:
+            pos += self.pos
+        elif whence == 2:
+            pos += self.size
+        self.pos = max(0, min(pos, self.size))
+
+    def tell(self):
+        return self.pos
+
+    def close(self):
+        pass
+
+
+class Pack:
+
+    """A data.pack file, memory mapped.
+
+    index maps names, relative to the data directory and using "/", to
+    (offset, size, stored size, flags).
+
+    """
+
+    def __init__(self, path):
+        f = open(path, 'rb')
+        try:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.mtime = os.fstat(f.fileno()).st_mtime
+        finally:
+            f.close()
+        magic, version, count = struct.unpack_from(PACK_HEADER, self.mm, 0)
+        if magic != PACK_MAGIC or version != PACK_VERSION:
+            raise ValueError('%s is not a version %d pack' % (path,
+                                                               PACK_VERSION))
+        pos = struct.calcsize(PACK_HEADER)
+        entry_size = struct.calcsize(PACK_ENTRY)
+        self.index = {}
+        for i in xrange(count):
+            offset, size, stored, flags, n = struct.unpack_from(
+                PACK_ENTRY, self.mm, pos)
+            pos += entry_size
+            self.index[self.mm[pos:pos + n]] = (offset, size, stored, flags)
+            pos += n
+
+    def open(self, name):
+        """Return a file-like object for an entry."""
+        offset, size, stored, flags = self.index[name]
+        if flags & PACK_ZLIB:
+            data = zlib.decompress(self.mm[offset:offset + stored])
+            return Blob(data, 0, size, name)
+        return Blob(self.mm, offset, size, name)
+
+
+def get_pack():
+    """Return the Pack, or None if there isn't one."""
+    global _pack
+    if _pack is None:
+        # The preload worker may get here first.
+        _lock.acquire()
+        try:
+            if _pack is None:
+                pack = False
+                try:
+                    if os.path.exists(pack_path):
+                        pack = Pack(pack_path)
+                finally:
+                    _pack = pack
+        finally:
+            _lock.release()
+    return _pack or None
 
 
 def filepath(filename):
-    """Determine the path to a file in the data directory."""
+    """Determine the path to a file in the data directory.
+
+    If filename is already an absolute path, it's returned as is.
+
+    """
     return os.path.join(data_dir, filename)
 
 
+def _find(filename):
+    """Return (path, mtime, name).
+
+    name is the name in the pack if it should be read from there, or None
+    to read the loose file.
+
+    """
+    path = filepath(filename)
+    pack = get_pack()
+    if pack is not None and path.startswith(data_dir + os.sep):
+        name = path[len(data_dir) + 1:].replace(os.sep, '/')
+        if name in pack.index:
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                return path, pack.mtime, name
+            if mtime <= pack.mtime:
+                return path, pack.mtime, name
+            return path, mtime, None
+    return path, os.path.getmtime(path), None
+
+
 def load(filename, mode='rb'):
     """Open a file in the data directory.
 
-    "mode" is passed as the second arg to open().
+    "mode" is passed as the second arg to open().  Files opened for
+    reading in binary mode may come out of the pack.
 
     """
+    if mode == 'rb':
+        path, mtime, name = _find(filename)
+        if name is not None:
+            return get_pack().open(name)
     return open(os.path.join(data_dir, filename), mode)
+
+
+def load_asset(filename, kind, loader):
+    """Return loader(f) for a file in the data directory.
+
+    f is an open file-like object for the file, with a name attribute
+    that ends with the file's extension.  It gets closed afterwards.
+
+    The result is remembered under the path and kind until it's
+    invalidated.  kind is anything hashable that tells apart the
+    different things you might load from the same file.
+
+    Once it's remembered, the file isn't looked at again, so changing
+    it doesn't change what this returns until invalidate or
+    invalidate_changed is called.
+
+    """
+    key = (filepath(filename), kind)
+    try:
+        return _assets[key]
+    except KeyError:
+        pass
+    path, mtime, name = _find(filename)
+    start = default_timer()
+    if name is not None:
+        f = get_pack().open(name)
+    else:
+        f = open(path, 'rb')
+    try:
+        asset = _assets[key] = loader(f)
+        _mtimes[key] = mtime
+    finally:
+        f.close()
+    if load_hook is not None:
+        load_hook(filename, kind, default_timer() - start)
+    return asset
+
+
+def loaded(filename, kind):
+    """Is the kind of thing load_asset makes from filename loaded yet?"""
+    return (filepath(filename), kind) in _assets
+
+
+def invalidate(filename=None):
+    """Forget everything loaded from filename, or everything at all."""
+    if filename is None:
+        _assets.clear()
+        _mtimes.clear()
+        _fonts.clear()
+        return
+    path = filepath(filename)
+    for key in _assets.keys():
+        if key[0] == path:
+            del _assets[key]
+            _mtimes.pop(key, None)
+
+
+def invalidate_changed():
+    """Forget everything loaded from a file that has changed since.
+
+    This looks at the mtime of every file anything has been loaded
+    from, so call it when files may have changed, like when the game
+    gets the focus back, rather than every frame.  Files that have gone
+    away are left alone.  Return the paths of the files that changed.
+
+    """
+    mtimes = {}
+    changed = set()
+    for key, mtime in _mtimes.items():
+        path = key[0]
+        if path not in mtimes:
+            try:
+                mtimes[path] = _find(path)[1]
+            except OSError:
+                mtimes[path] = None
+        if mtimes[path] is not None and mtimes[path] != mtime:
+            del _assets[key]
+            del _mtimes[key]
+            changed.add(path)
+    return sorted(changed)
+
+
+class PreloadJob:
+
+    """Read and decode a file on the worker thread.
+
+    The main thread finishes it by converting it and putting it in the
+    registry.
+
+    """
+
+    def __init__(self, filename, kind, path, mtime):
+        self.filename = filename
+        self.kind = kind
+        self.path = path
+        self.mtime = mtime
+        self.surface = None
+        self.done = threading.Event()
+
+    def run(self):
+        try:
+            path, mtime, name = _find(self.filename)
+            if mtime == self.mtime:
+                if name is None:
+                    # Given a path, pygame can let go of the GIL while it
+                    # decodes.
+                    self.surface = pygame.image.load(path)
+                else:
+                    f = get_pack().open(name)
+                    self.surface = pygame.image.load(f, f.name)
+        except Exception:
+            # Never mind.  Loading it for real will report the problem.
+            pass
+        self.done.set()
+
+    def finish(self):
+        if self.surface is None:
+            return
+        key = (self.path, self.kind)
+        if key in _assets:
+            return  # Somebody didn't wait for us.
+        start = default_timer()
+        surface = self.surface
+        if self.kind == 'image':
+            surface = surface.convert_alpha()
+        _assets[key] = surface
+        _mtimes[key] = self.mtime
+        if load_hook is not None:
+            load_hook(self.filename, ('preloaded', self.kind),
+                      default_timer() - start)
+
+
+def _work():
+    global _worker
+    while True:
+        _lock.acquire()
+        try:
+            if not _jobs:
+                _worker = None
+                return
+            job = _jobs.popleft()
+        finally:
+            _lock.release()
+        job.run()
+
+
+def preload(filename, kind='image'):
+    """Start reading and decoding a file in the background.
+
+    kind is 'image' or 'level'.  Once finish_preloading has gotten to
+    it, load_image or load_level won't have to wait for it.
+
+    """
+    global _worker
+    if loaded(filename, kind):
+        return
+    path, mtime, name = _find(filename)
+    job = PreloadJob(filename, kind, path, mtime)
+    _steps.append(job)
+    _lock.acquire()
+    try:
+        _jobs.append(job)
+        if _worker is None:
+            _worker = threading.Thread(target=_work, name='preload')
+            _worker.setDaemon(True)
+            _worker.start()
+    finally:
+        _lock.release()
+
+
+def preload_task(f):
+    """Call f on the main thread once what's been preloaded so far is in.
+
+    This is for things like rotating images that have been preloaded.
+
+    """
+    _steps.append(f)
+
+
+def preloading():
+    """Is there anything left for finish_preloading to do?"""
+    return bool(_steps)
+
+
+def finish_preloading(budget=None):
+    """Finish preloads on the main thread, for up to budget seconds.
+
+    It stops early to wait for the worker thread, rather than waiting
+    for it.  If budget is None, it waits, and finishes everything.
+
+    """
+    if budget is not None:
+        end = default_timer() + budget
+    while _steps:
+        step = _steps[0]
+        if isinstance(step, PreloadJob):
+            if not step.done.isSet():
+                if budget is not None:
+                    return
+                step.done.wait()
+            _steps.popleft()
+            step.finish()
+        else:
+            _steps.popleft()
+            step()
+        if budget is not None and default_timer() >= end:
+            return
+
+
+def _load_image(f):
+    return pygame.image.load(f, f.name).convert_alpha()
+
+
+def load_image(filename):
+    """Return an image from the data directory, converted for the display.
+
+    The display mode must already be set.
+
+    """
+    return load_asset(filename, 'image', _load_image)
+
+
+def _load_level(f):
+    return pygame.image.load(f, f.name)
+
+
+def load_level(filename):
+    """Return a level image from the data directory, just as it's stored.
+
+    This is what Vid.tga_load_level wants.
+
+    """
+    return load_asset(filename, 'level', _load_level)
+
+
+def load_font(name, size):
+    """Return pygame.font.SysFont(name, size).
+
+    Finding a system font is slow, so each one is only looked up once.
+
+    """
+    key = (name, size)
+    font = _fonts.get(key)
+    if font is None:
+        start = default_timer()
+        font = _fonts[key] = pygame.font.SysFont(name, size)
+        if load_hook is not None:
+            load_hook(name, ('font', size), default_timer() - start)
+    return font
+
+
+def load_sound(filename):
+    """Return the Sound for a file in the data directory.
+
+    The mixer must already be initialized.
+
+    """
+    return load_asset(filename, 'sound', pygame.mixer.Sound)
+
+
+def preload_sounds(filenames):
+    """Load all the given sounds now so that playing them later is cheap."""
+    for filename in filenames:
+        load_sound(filename)
@@ -25,15 +25,18 @@ It contains the entry point used by the run_game.py script.
 
 import math
 import random
+import sys
+import time
 
-from pgu import tilevid, timer
+from pgu import ani, text, tilevid, timer
 import pygame
 from pygame.locals import *
 import pygame.mixer
-from pygame.mixer import Sound
 from pygame.rect import Rect
 
-from data import filepath
+from data import (filepath, finish_preloading, load_asset, load_font,
+                  load_image, load_level, load_sound, loaded, preload,
+                  preload_sounds, preload_task, preloading)
 
 __docformat__ = 'restructuredtext'
 
@@ -41,6 +44,11 @@ SCREEN_WIDTH, SCREEN_HEIGHT = 240, 240
 TILE_WIDTH, TILE_HEIGHT = 16, 16
 SPEED = 2
 FPS = 40
+SPRITEHASH_SIZE = 64  # Cell size for the sprite collision broadphase.
+ROTATION_STEPS = 64   # How many directions rotated images are drawn in.
+PRELOAD_BUDGET = 0.005  # Seconds per frame to spend finishing preloads.
+ROTATION_BATCH = 8     # How many directions to draw per preload task.
+SOUNDS = ['damaged.wav', 'explosion.wav', 'red_alert.wav', 'shooting.wav']
 
 
 class SuperSprite(tilevid.Sprite):
@@ -69,10 +77,17 @@ class SuperSprite(tilevid.Sprite):
         You can point this at different functions to do animations.  By
         default, it gets set to default_animator.
 
+    You may define:
+
+      pool
+        A SpritePool.  If you create instances using pool.get instead of
+        calling the class, they'll be recycled once they're removed.
+
     """
 
     invincible = False
     invincible_time = 5
+    pool = None
 
     def __init__(self, g, t, value, pos=None):
         """Set stuff up.
@@ -97,18 +112,29 @@ class SuperSprite(tilevid.Sprite):
             arg = pos
         else:
             arg = t.rect
-        tilevid.Sprite.__init__(self, g.images[self.default_image_name], arg)
+        ishape = g.images[self.default_image_name]
+        if hasattr(self, 'origin'):
+            # We're being recycled by a SpritePool.  Reuse our Rects, and
+            # forget anything left over from our last life.
+            tilevid.Sprite.reset(self, ishape, arg)
+            self.origin.topleft = self.rect.topleft
+            self.origin.size = self.rect.size
+            self.__dict__.pop('invincible', None)
+        else:
+            tilevid.Sprite.__init__(self, ishape, arg)
+            self.origin = pygame.Rect(self.rect)
         self.g = g
         if t is not None:
-            g.clayer[t.ty][t.tx] = 0
-        g.sprites.append(self)
+            g.set_code((t.tx, t.ty), 0)
         self.first_frame = g.frame
-        self.origin = pygame.Rect(self.rect)
-        self.groups = g.string2groups(self.default_group_name)
+        groups = self.default_group_name
+        if not self.invincible:
+            groups += ',vulnerable'
+        self.groups = g.string2groups(groups)
         self.agroups = g.string2groups(self.default_agroup_name)
+        g.sprites.append(self)  # After setting groups, so they're counted.
         self.hitcount = self.default_hitcount
-        self.blank_image = self.image.copy()
-        self.blank_image.fill((0, 0, 0, 1))
+        self.blank_image = g.get_blank_image(self.default_image_name)
         self.animator_func = self.default_animator
 
     def loop(self, g, s):
@@ -144,6 +170,21 @@ class SuperSprite(tilevid.Sprite):
     def hit(self, g, s, hitee):
         self.hit_func(hitee)
 
+    def set_invincible(self, invincible):
+        """Set self.invincible.
+
+        Sprites that aren't invincible are also in the "vulnerable" group,
+        so they can be counted without looking at every sprite.
+
+        """
+        self.invincible = invincible
+        bit = self.g.string2groups('vulnerable')
+        if invincible:
+            groups = self.groups & ~bit
+        else:
+            groups = self.groups | bit
+        self.g.sprites.regroup(self, groups)
+
     def hit_func(self, hitee):
         """We just got hit by hitee.
 
@@ -198,10 +239,10 @@ class SuperSprite(tilevid.Sprite):
                 self.default_animator()
             if f.count <= 0:
                 self.animator_func = self.default_animator
-                self.invincible = False
+                self.set_invincible(False)
 
         def task():
-            self.invincible = True
+            self.set_invincible(True)
 
         if self.default_group_name == 'player':
             play_wav('damaged.wav')
@@ -226,7 +267,7 @@ class SuperSprite(tilevid.Sprite):
                 self.after_destroyed_func()
 
         def task():
-            self.invincible = True
+            self.set_invincible(True)
 
         play_wav('explosion.wav')
         f.count = 0
@@ -274,7 +315,64 @@ class SuperSprite(tilevid.Sprite):
         try:
             self.g.sprites.remove(self)
         except ValueError:
-            pass
+            return
+        if self.pool is not None:
+            # Other sprites may still hit us this frame, so wait until
+            # the frame is over before handing ourselves out again.
+            self.g.post_frame_tasks.append(self.recycle)
+
+    def recycle(self):
+        """Give self back to self.pool."""
+        self.pool.put(self)
+
+
+class SpritePool:
+
+    """This keeps removed SuperSprites around so they can be reused.
+
+    Creating a sprite allocates several Rects and parses its groups.
+    Recycling an old one just resets it.  Use it like::
+
+        Artillery.pool = SpritePool(Artillery)
+        Artillery.pool.get(shooter, pos=pos)
+
+    """
+
+    def __init__(self, cls, max_size=256):
+        """Set stuff up.
+
+        cls
+          The SuperSprite subclass to pool.
+
+        max_size
+          The most removed instances to hold on to.
+
+        """
+        self.cls = cls
+        self.max_size = max_size
+        self.free = []
+        self.created = 0
+        self.recycled = 0
+
+    def get(self, *args, **kargs):
+        """Return an instance, recycling one if possible.
+
+        The args are what you would pass to cls.
+
+        """
+        if self.free:
+            s = self.free.pop()
+            s.__init__(*args, **kargs)
+            self.recycled += 1
+        else:
+            s = self.cls(*args, **kargs)
+            self.created += 1
+        return s
+
+    def put(self, s):
+        """Take back an instance that has been removed."""
+        if len(self.free) < self.max_size:
+            self.free.append(s)
 
 
 class Helicopter(SuperSprite):
@@ -318,7 +416,7 @@ class Player(Helicopter):
             if not hasattr(self, 'red_alert'):
                 self.red_alert = play_wav('red_alert.wav', -1)  # Repeat.
             self.handle_done()
-        keys = pygame.key.get_pressed()
+        keys = self.g.get_pressed()
         dx, dy = 0, 0
         if keys[K_UP]:
             dy -= 1
@@ -333,7 +431,8 @@ class Player(Helicopter):
         self.rect.clamp_ip(self.g.view)
         if keys[K_SPACE] and self.g.frame % 4 == 0:
             pos = (self.rect.centerx - 6, self.rect.top - 2)
-            Artillery(self, pos=pos, angle=(0.5 * math.pi), image_name="shot")
+            Artillery.pool.get(self, pos=pos, angle=(0.5 * math.pi),
+                               image_name="shot")
             play_wav('shooting.wav', 0, 20)  # Keep it short.
 
     def destroyed_func(self):
@@ -348,11 +447,9 @@ class Player(Helicopter):
         have been marked as invincible (i.e. burning turrets).
 
         """
-        for s in self.g.sprites:
-            if s.default_group_name == 'enemy' and not s.invincible:
-                break
-        else:
-            self.g.winner()
+        g = self.g
+        if not g.sprites.count(g.string2groups('enemy,vulnerable')):
+            g.winner()
 
 
 class EnemyHeli(Helicopter):
@@ -379,7 +476,7 @@ class EnemyHeli(Helicopter):
         self.move(self)
         if random.randint(0, 30) == 0 and self.hitcount > 0:
             pos = (self.rect.centerx - 6, self.rect.bottom + 2)
-            Artillery(self, pos=pos)
+            Artillery.pool.get(self, pos=pos)
 
     def destroyed_func(self):
         Helicopter.destroyed_func(self)
@@ -400,7 +497,6 @@ class GunTurret(SuperSprite):
     def __init__(self, g, t, value):
         """Save the original image."""
         SuperSprite.__init__(self, g, t, value)
-        self.orig_image = self.image
         self.orig_center = self.rect.center
 
     def loop_func(self):
@@ -410,17 +506,18 @@ class GunTurret(SuperSprite):
         dy = p_rect.y - s_rect.y
         self.rad = math.atan2(-dy, dx)
         pos = (self.rect.centerx, self.rect.centery)
-        if self.uptime() % self.shot_freq == 0 and self.hitcount > 0:
-            Artillery(self, pos=pos, angle=self.rad,
-                      speed=self.shot_speed,
-                      image_name=self.shot_image,
-                      collision_damage=self.collision_damage)
+        if (self.uptime() % self.shot_freq == 0 and self.hitcount > 0 and
+                self.g.line_of_sight(pos, p_rect.center, True)):
+            Artillery.pool.get(self, pos=pos, angle=self.rad,
+                               speed=self.shot_speed,
+                               image_name=self.shot_image,
+                               collision_damage=self.collision_damage)
 
     def default_animator(self):
         """Have the turret track the player."""
-        self.image = pygame.transform.rotate(self.orig_image,
-                                             rad_to_ccw(self.rad))
-        self.rect = self.image.get_rect()
+        self.image = self.g.get_rotated_image(self.default_image_name,
+                                              rad_to_ccw(self.rad))
+        self.rect.size = self.image.get_size()
         self.rect.center = self.orig_center
 
     def destroyed_func(self):
@@ -474,8 +571,8 @@ class Artillery(SuperSprite):
         self.collision_damage = collision_damage
         SuperSprite.__init__(self, shooter.g, t=None, value=None, pos=pos)
         orig_center = self.rect.center
-        self.image = pygame.transform.rotate(self.image, rad_to_ccw(angle))
-        self.rect = self.image.get_rect()
+        self.image = self.g.get_rotated_image(image_name, rad_to_ccw(angle))
+        self.rect.size = self.image.get_size()
         self.rect.center = orig_center
         self.dx = math.cos(angle) * speed
         self.dy = -math.sin(angle) * speed
@@ -493,6 +590,9 @@ class Artillery(SuperSprite):
         self.after_destroyed_func()
 
 
+Artillery.pool = SpritePool(Artillery)
+
+
 def rad_to_ccw(rad):
     """Convert radians to a counterclockwise angle in degrees."""
     return math.degrees(rad) + 90
@@ -524,23 +624,112 @@ def play_wav(name, *args):
     *args
       These are passed to play.
 
-    Return the sound object.
+    Return the sound object.  It's shared, so don't change its volume,
+    etc.  If there's no mixer, e.g. when running headless, return None.
 
     """
-    s = Sound(filepath(name))
+    if not pygame.mixer.get_init():
+        return None
+    s = load_sound(name)
     s.play(*args)
     return s
 
 
+def rotations_kind(shape):
+    """Return the kind load_rotations keeps rotations under in data."""
+    return ('rotations', tuple(shape), ROTATION_STEPS)
+
+
+def load_rotations(fname, shape, drawn=None):
+    """Return the image in fname drawn at every angle.
+
+    They're drawn once, and shared by everyone.  See ani.rotation.
+
+    drawn
+      If given, it's the list of them, already drawn, to keep if they
+      haven't been drawn yet.
+
+    """
+
+    def rotate(f):
+        if drawn is not None:
+            return drawn
+        return ani.image_rotations(None, None, load_image(fname), shape,
+                                   ROTATION_STEPS)
+
+    return load_asset(fname, rotations_kind(shape), rotate)
+
+
+def preload_rotations(fname, shape):
+    """Draw load_rotations(fname, shape) in preload tasks.
+
+    Each task only draws ROTATION_BATCH of them, so none of them takes
+    up more than a frame's PRELOAD_BUDGET.
+
+    """
+    angles = [i * 360.0 / ROTATION_STEPS for i in xrange(ROTATION_STEPS)]
+    drawn = []
+
+    def rotate(batch):
+        if not loaded(fname, rotations_kind(shape)):
+            drawn.extend(ani.image_rotate(None, None, load_image(fname), shape,
+                                          batch))
+
+    def finish():
+        if len(drawn) == ROTATION_STEPS:
+            load_rotations(fname, shape, drawn)
+
+    for i in xrange(0, ROTATION_STEPS, ROTATION_BATCH):
+        preload_task(lambda batch=angles[i:i + ROTATION_BATCH]: rotate(batch))
+    preload_task(finish)
+
+
+def preload_vid(cls):
+    """Start loading what the Tilevid class cls needs in the background.
+
+    Creating it later won't have to wait as long.  See data.preload.
+
+    """
+    preload(cls.tiles_file)
+    preload(cls.level_file, 'level')
+    image_data = list(cls.image_data)
+    if hasattr(cls, 'default_image_name'):
+        image_data.append((cls.default_image_name,
+                           filepath('%s.tga' % cls.default_image_name), None))
+    files = {}
+    for name, fname, shape in image_data:
+        preload(fname)
+        files[name] = fname, shape
+    for name in cls.rotated_images:
+        preload_rotations(*files[name])
+
+
+def init_mixer():
+    """Set up the mixer with as small a buffer as the platform can handle.
+
+    A smaller buffer means sounds start sooner after play is called, but
+    if it's too small the sound skips.  Windows needs a big one.
+
+    """
+    if sys.platform.startswith('win'):
+        buffer = 1024
+    else:
+        buffer = 512
+    pygame.mixer.init(44100, -16, 2, buffer)
+
+
 class SuperTilevid(tilevid.Tilevid):
 
     """This is the superclass of all the different Tilevids."""
 
     image_data = []
+    rotated_images = []
     codes_data = {}
+    scrolling = False  # Paint with scroll_update instead of paint?
     tile_data = {}
     level_file = "level-0.tga"  # If nothing else, use level-0.
     tiles_file = "tiles.tga"
+    preload_vids = []  # Names of the Tilevids that might come next.
 
     def __init__(self, screen=None, my_timer=None, prev_vid=None):
         """Set everything up.
@@ -555,20 +744,78 @@ class SuperTilevid(tilevid.Tilevid):
             if my_timer is None:
                 my_timer = prev_vid.timer
         tilevid.Tilevid.__init__(self)
+        self.layer_typecode = 'B'  # Compact rows; our tiles fit in a byte.
+        self.recorder = None
+        if prev_vid is not None:
+            self.profiler = prev_vid.profiler
+            self.recorder = prev_vid.recorder
+        self.hud_font = None
+        self.prev_positions = None
         self.screen = screen
         self.timer = my_timer
         self.view.w, self.view.h = SCREEN_WIDTH, SCREEN_HEIGHT
         self.frame = 0
-        self.tga_load_tiles(filepath(self.tiles_file),
+        self.tga_load_tiles(load_image(self.tiles_file),
                             (TILE_WIDTH, TILE_HEIGHT),
                             self.tile_data)
-        self.tga_load_level(filepath(self.level_file), bg=True)
+        self.tga_load_level(load_level(self.level_file), bg=True)
         self.bounds = pygame.Rect(TILE_WIDTH, TILE_HEIGHT,
                                   (len(self.tlayer[0]) - 2) * TILE_WIDTH,
                                   (len(self.tlayer) - 2) * TILE_HEIGHT)
         self.load_images(self.image_data)
-        self.font = pygame.font.SysFont('helvetica', 16)
+        self.load_rotations(self.rotated_images)
+        self.font = load_font('helvetica', 16)
+        self.blank_images = {}
         self.next_vid = None
+        self.post_frame_tasks = []
+        for name in self.preload_vids:
+            preload_vid(globals()[name])
+
+    def load_images(self, idata):
+        """Load images through the data module, so they're only loaded once.
+
+        The images are shared with every other Tilevid, so don't draw on
+        them.
+
+        """
+        for name, fname, shape in idata:
+            self.images[name] = load_image(fname), shape
+
+    def load_rotations(self, names):
+        """Draw each of the named images at every angle, once, up front.
+
+        Rotating an image is slow, so sprites that point somewhere get
+        their images from get_rotated_image instead.  The rotations are
+        shared with every other Tilevid, like the images.
+
+        """
+        self.rotations = {}
+        files = dict([(name, fname) for name, fname, shape in self.image_data])
+        for name in names:
+            self.rotations[name] = load_rotations(files[name],
+                                                  self.images[name][1])
+
+    def get_rotated_image(self, name, degrees):
+        """Return self.images[name] rotated counterclockwise by degrees.
+
+        The angle gets rounded to the nearest one drawn by load_rotations.
+
+        """
+        return ani.rotation(self.rotations[name], degrees)[0]
+
+    def get_blank_image(self, name):
+        """Return a blank image the size of self.images[name].
+
+        It's used to make sprites blink.  Sprites share one per image, so
+        don't draw on it.
+
+        """
+        img = self.blank_images.get(name)
+        if img is None:
+            img = self.images[name][0].copy()
+            img.fill((0, 0, 0, 1))
+            self.blank_images[name] = img
+        return img
 
     def run(self):
         """This is the main loop.
@@ -583,11 +830,23 @@ class SuperTilevid(tilevid.Tilevid):
         for this frame is taken care of.  It gets set to [] on every
         frame.
 
+        self.timer must be a timer.Clock.  The game logic runs at its
+        fixed rate, however fast frames get drawn.
+
+        If self.recorder is set, the events, keys, and steps get recorded
+        with it.  See the replay module.
+
+        Whatever has been preloaded for the next Tilevid gets finished a
+        little at a time, after each frame is shown.
+
         """
         self.quit = False
         self.pause = False
+        self.timer.reset()
         while not self.quit:
-            self.post_frame_tasks = []
+            prof = self.profiler
+            if prof:
+                prof.start('events')
             for e in pygame.event.get():
                 if e.type is QUIT:
                     self.quit = True
@@ -595,27 +854,188 @@ class SuperTilevid(tilevid.Tilevid):
                     self.quit = True
                 elif e.type is KEYDOWN and e.key == K_F9:
                     pygame.display.toggle_fullscreen()
+                elif e.type is KEYDOWN and e.key == K_F3:
+                    self.toggle_profiler_hud()
+                elif e.type is KEYDOWN and e.key == K_F4:
+                    self.toggle_profiler_trace()
                 else:
+                    if self.recorder:
+                        self.recorder.event(e)
                     self.handle_event(e)
-            if not self.pause:
-                self.pre_loop()
-                self.loop()
-                self.screen.fill((0, 0, 0))
-                self.paint(self.screen)
-                self.post_paint()
-                for f in self.post_frame_tasks:
-                    f()
+            if prof:
+                prof.stop('events')
+                prof.start('wait')
+            steps = self.timer.tick()
+            if prof:
+                prof.stop('wait')
+            if not self.pause and (steps or self.timer.interpolate):
+                for i in xrange(steps):
+                    self.step_logic()
+                    if self.next_vid is not None:
+                        break
+                self.draw(self.timer.alpha)
+                if prof:
+                    prof.start('flip')
                 pygame.display.flip()
-                self.frame += 1
-            self.timer.tick()
+                if prof:
+                    prof.stop('flip')
+                if self.recorder:
+                    self.recorder.end_frame(self)
+            if preloading():
+                if prof:
+                    prof.start('preload')
+                finish_preloading(PRELOAD_BUDGET)
+                if prof:
+                    prof.stop('preload')
+            if prof:
+                prof.tick()
             if self.next_vid is not None:
                 return self.next_vid
         return None
 
+    def step(self):
+        """Run and paint a single frame, without flipping the display."""
+        self.step_logic()
+        self.draw()
+
+    def step_logic(self):
+        """Run a single step of the game logic.
+
+        If self.profiler is set, each phase gets timed.  If the timer
+        wants interpolation, remember where everything was first.
+
+        """
+        prof = self.profiler
+        rec = self.recorder
+        self.post_frame_tasks = []
+        if rec:
+            rec.pre_step(self)
+        if getattr(self.timer, 'interpolate', False):
+            self.prev_positions = (
+                self.view.topleft,
+                dict([(id(s), s.rect.topleft) for s in self.sprites]))
+        if prof:
+            prof.start('pre_loop')
+        self.pre_loop()
+        if prof:
+            prof.stop('pre_loop')
+        self.loop()
+        if prof:
+            prof.start('post_frame_tasks')
+        for f in self.post_frame_tasks:
+            f()
+        if prof:
+            prof.stop('post_frame_tasks')
+        self.frame += 1
+        if rec:
+            rec.post_step(self)
+
+    def draw(self, alpha=0):
+        """Paint the screen, without flipping the display.
+
+        alpha
+          If it's not 0, draw the view and sprites that far (0 to 1) from
+          where they were before the last step to where they are now.
+
+        """
+        prof = self.profiler
+        moved = []
+        if alpha and self.prev_positions is not None:
+            moved = self.interpolate_positions(alpha)
+        if prof:
+            prof.start('paint')
+        if self.scrolling:
+            self.scroll_update(self.screen)
+        else:
+            self.screen.fill((0, 0, 0))
+            self.paint(self.screen)
+        if prof:
+            prof.stop('paint')
+        for rect, pos in moved:
+            rect.topleft = pos
+        if prof:
+            prof.start('post_paint')
+        self.post_paint()
+        if prof:
+            prof.stop('post_paint')
+            if prof.hud:
+                rects = prof.paint(self.screen, self.get_hud_font())
+                if self.scrolling:
+                    # paint redraws everything anyway, so only
+                    # scroll_update needs to know.
+                    self.dirty.extend(rects)
+
+    def interpolate_positions(self, alpha):
+        """Move the view and sprites back towards where they were.
+
+        Return a list of (rect, pos) to put them back afterwards.
+
+        """
+        (vx, vy), prev = self.prev_positions
+        if self.bounds is not None:
+            self.view.clamp_ip(self.bounds)  # As paint would have.
+        moved = [(self.view, self.view.topleft)]
+        self.view.x = int(round(vx + (self.view.x - vx) * alpha))
+        self.view.y = int(round(vy + (self.view.y - vy) * alpha))
+        for s in self.sprites:
+            pos = prev.get(id(s))
+            if pos is None:
+                continue
+            rect = s.rect
+            moved.append((rect, rect.topleft))
+            rect.x = int(round(pos[0] + (rect.x - pos[0]) * alpha))
+            rect.y = int(round(pos[1] + (rect.y - pos[1]) * alpha))
+        return moved
+
+    def toggle_profiler_hud(self):
+        """Show or hide the frame timing stats."""
+        if self.profiler is None:
+            self.profiler = timer.Profiler(FPS)
+        self.profiler.hud = not self.profiler.hud
+        if not self.profiler.hud and not self.profiler.tracing:
+            self.profiler = None
+
+    def toggle_profiler_trace(self):
+        """Start recording a trace, or stop and save it to the current dir.
+
+        Load the file in chrome://tracing to look at it.
+
+        """
+        if self.profiler is None:
+            self.profiler = timer.Profiler(FPS)
+        prof = self.profiler
+        if not prof.tracing:
+            prof.tracing = True
+            print 'Recording a trace.  Hit F4 again to save it.'
+        else:
+            fname = 'trace-%d.json' % time.time()
+            prof.save_trace(fname)
+            prof.tracing = False
+            print 'Saved the trace to %s.' % fname
+            if not prof.hud:
+                self.profiler = None
+
+    def get_hud_font(self):
+        """Return a small font for the profiler HUD."""
+        if self.hud_font is None:
+            self.hud_font = pygame.font.Font(None, 14)
+        return self.hud_font
+
     def handle_event(self, e):
         """Handle any uncaught events."""
         pass
 
+    def get_pressed(self):
+        """Return the state of the keys, like pygame.key.get_pressed.
+
+        Sprites read the keyboard through this, so you can script the
+        input by replacing it.
+
+        """
+        if self.recorder:
+            return self.recorder.get_pressed()
+        return pygame.key.get_pressed()
+
     def pre_loop(self):
         """This gets called before self.loop.
 
@@ -627,7 +1047,8 @@ class SuperTilevid(tilevid.Tilevid):
     def post_paint(self):
         """Do any additional painting necessary.
 
-        For instance, you might want to draw a scoreboard.
+        For instance, you might want to draw a scoreboard.  If you're
+        scrolling, add the rects you draw on to self.dirty.
 
         """
         pass
@@ -653,6 +1074,7 @@ class BasicImageTilevid(SuperTilevid):
         self.image_data = [(self.default_image_name,
                             filepath('%s.tga' % self.default_image_name),
                             (0, 0, SCREEN_WIDTH, SCREEN_HEIGHT))]
+        self.preload_vids = [self.next_vid_class_name]
         SuperTilevid.__init__(self, *args, **kargs)
 
     def handle_event(self, e):
@@ -689,6 +1111,8 @@ class LevelTilevid(SuperTilevid):
 
     """This is the Tilevid for a real, live level."""
 
+    scrolling = True
+    preload_vids = ['GameOverTilevid', 'WinnerTilevid']
     helicopter_bounds = (6, 1, 26, 31)
     image_data = [
         ('shot', filepath('shot.tga'), (1, 2, 6, 4)),
@@ -698,6 +1122,8 @@ class LevelTilevid(SuperTilevid):
         ('missle', filepath('missle.tga'), (0, 0, 9, 29)),
         ('enemy_shot', filepath('enemy_shot.tga'), (0, 0, 5, 5)),
     ]
+    rotated_images = ['shot', 'gun_turret', 'gun_bullet', 'missle_turret',
+                      'missle', 'enemy_shot']
     for i in range(2):
         image_data.extend([
             ('player_helicopter-%s' % i,
@@ -736,6 +1162,8 @@ class LevelTilevid(SuperTilevid):
         self.level = level
         self.level_file = "level-%s.tga" % level
         SuperTilevid.__init__(self, screen, my_timer, prev_vid)
+        self.use_spritehash(SPRITEHASH_SIZE)
+        self.use_chunks()
         self.view.x = 0
         self.view.y = 183 * TILE_HEIGHT
         self.run_codes(self.codes_data, (0, 183, 17, 17))
@@ -756,21 +1184,26 @@ class LevelTilevid(SuperTilevid):
 
     def draw_scoreboard(self):
 
+        blit = self.screen.blit
+        dirty = self.dirty
+        render = text.render  # The text rarely changes, so it's cached.
+
         # Draw the score.
 
-        img = self.font.render('%05d' % self.player.score, 1, (0, 0, 0))
-        self.screen.blit(img, (0 + 1, SCREEN_HEIGHT - img.get_height() + 1))
-        img = self.font.render('%05d' % self.player.score, 1, (255, 255, 255))
-        self.screen.blit(img, (0, SCREEN_HEIGHT - img.get_height()))
+        score = '%05d' % self.player.score
+        img = render(self.font, score, 1, (0, 0, 0))
+        dirty.append(blit(img, (0 + 1, SCREEN_HEIGHT - img.get_height() + 1)))
+        img = render(self.font, score, 1, (255, 255, 255))
+        dirty.append(blit(img, (0, SCREEN_HEIGHT - img.get_height())))
 
         # Add the hits remaining bar.
 
-        hits = self.font.render("#" * self.player.hitcount, 1, (0, 0, 0))
-        self.screen.blit(hits, (SCREEN_WIDTH - hits.get_width() + 1,
-                                SCREEN_HEIGHT - hits.get_height() + 1))
-        hits = self.font.render("#" * self.player.hitcount, 1, (255, 0, 0))
-        self.screen.blit(hits, (SCREEN_WIDTH - hits.get_width(),
-                                SCREEN_HEIGHT - hits.get_height()))
+        hits = render(self.font, "#" * self.player.hitcount, 1, (0, 0, 0))
+        dirty.append(blit(hits, (SCREEN_WIDTH - hits.get_width() + 1,
+                                 SCREEN_HEIGHT - hits.get_height() + 1)))
+        hits = render(self.font, "#" * self.player.hitcount, 1, (255, 0, 0))
+        dirty.append(blit(hits, (SCREEN_WIDTH - hits.get_width(),
+                                 SCREEN_HEIGHT - hits.get_height())))
 
     def game_over(self):
         """Change self.next_vid."""
@@ -781,14 +1214,28 @@ class LevelTilevid(SuperTilevid):
         self.next_vid = WinnerTilevid(prev_vid=self)
 
 
-def main():
+def main(recorder=None):
+    """Play the game.
+
+    If recorder is given, the whole game gets recorded with it.  See the
+    replay module.
+
+    """
     screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), SWSURFACE)
-    my_timer = timer.Timer(FPS)
+    my_timer = timer.Clock(FPS)
     pygame.font.init()
-    pygame.mixer.init(44100, -16, 2, 1024)  # Big buffer for Windows.
+    init_mixer()
+    preload_sounds(SOUNDS)
+    if recorder is not None:
+        random.seed(recorder.seed)
     next_vid = SplashScreenTilevid(screen, my_timer)
-    while True:
-        next_vid = next_vid.run()
-        pygame.mixer.stop()                 # Kill any music left running.
-        if next_vid is None:
-            break
+    next_vid.recorder = recorder
+    try:
+        while True:
+            next_vid = next_vid.run()
+            pygame.mixer.stop()             # Kill any music left running.
+            if next_vid is None:
+                break
+    finally:
+        if recorder is not None:
+            recorder.close()  # Even if we crashed; that's worth replaying.
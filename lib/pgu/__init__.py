@@ -1,7 +1,54 @@
 """Phil's pyGame Utilities
 
-
+<p>The submodules are imported the first time they're used, so after
+<code>import pgu</code>, <code>pgu.tilevid</code> works, and a game only
+pays for the modules it touches.</p>
 """
 __version__ = '0.10.6'
 
-# vim: set filetype=python sts=4 sw=4 noet si :
+import sys
+import types
+
+class LazyModule(types.ModuleType):
+    """a module that imports its attributes the first time they're used
+
+    <pre>LazyModule(module,attrs)</pre>
+
+    <dl>
+    <dt>module <dd>the module (usually a package) to stand in for
+    <dt>attrs <dd>{name:submodule} of the attributes to import when they're used.  If submodule is None, the attribute is the submodule called name, otherwise it's the attribute called name in it.
+    </dl>
+
+    <p>This takes the module's place in sys.modules, and returns itself.</p>
+
+    <strong>Example</strong>
+    <code>
+    sys.modules[__name__] = LazyModule(sys.modules[__name__],{'Button':'button'})
+    </code>
+    """
+    def __init__(self,module,attrs):
+        types.ModuleType.__init__(self,module.__name__,module.__doc__)
+        self.__dict__.update(module.__dict__)
+        #python 2 empties a module's globals when the module goes away, so keep it
+        self._module = module
+        self._attrs = attrs
+        sys.modules[module.__name__] = self
+
+    def __getattr__(self,name):
+        attrs = self.__dict__.get('_attrs',{})
+        if name not in attrs:
+            raise AttributeError("'module' object has no attribute '%s'"%name)
+        sub = attrs[name]
+        if sub == None:
+            value = __import__('%s.%s'%(self.__name__,name),None,None,['__name__'])
+        else:
+            value = getattr(__import__('%s.%s'%(self.__name__,sub),None,None,[name]),name)
+        setattr(self,name,value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__.keys()) | set(self._attrs.keys()))
+
+LazyModule(sys.modules[__name__],dict([(name,None) for name in [
+    'algo','ani','cache','engine','fonts','gui','hexvid','high','html','isovid',
+    'layout','text','tilevid','timer','vid']]))
@@ -3,7 +3,11 @@
 <p>please note that this file is alpha, and is subject to modification in
 future versions of pgu!</p>
 """
-print 'pgu.algo','This module is alpha, and is subject to change.'
+import heapq
+import threading
+from array import array
+from collections import deque
+from timeit import default_timer
 
 #def dist(a,b):
 #    return abs(a[0]-b[0]) + abs(a[1]-b[1])
@@ -82,6 +86,1111 @@ def astar(start,end,layer,_dist):
     return path
     
 
+STRAIGHT,DIAGONAL = 10,14 #the cost of a move, 14 is about 10*sqrt(2)
+
+class AStar:
+    """a reusable a* search over a grid
+    
+    <pre>AStar(layer,diagonals=False,corners=0)</pre>
+    
+    <dl>
+    <dt>layer<dd>a grid where zero cells are open and non-zero cells are walls, such as a vid's tlayer
+    <dt>diagonals<dd>allow diagonal moves as well as up, down, left and right
+    <dt>corners<dd>when a diagonal move goes past walls: 0 - never, 1 - when only one of the two cells beside the move is a wall, 2 - even when both are
+    </dl>
+    
+    <p>The layer is read as the search goes, so changes to it are seen by
+    the next search.  The scores and parents are kept in arrays the size
+    of the layer, which are allocated once and reused by every search,
+    so ask the same AStar for as many paths as you like.  Each AStar has
+    its own, so separate ones can search at the same time.</p>
+    
+    <p>Moves cost STRAIGHT or DIAGONAL.  When two cells look just as
+    good, the one closer to the end is tried first, which saves
+    exploring lots of equally short paths on open ground.</p>
+    
+    <strong>Example</strong>
+    <code>
+    a = AStar(tv.tlayer,diagonals=True)
+    path = a.search((1,1),(20,10))
+    </code>
+    """
+    def __init__(self,layer,diagonals=False,corners=0):
+        self.layer = layer
+        self.diagonals,self.corners = diagonals,corners
+        moves = [(0,-1,STRAIGHT),(1,0,STRAIGHT),(0,1,STRAIGHT),(-1,0,STRAIGHT)]
+        if diagonals:
+            moves += [(-1,-1,DIAGONAL),(1,-1,DIAGONAL),(-1,1,DIAGONAL),(1,1,DIAGONAL)]
+        self.moves = moves
+        self.size = None
+        self.heap = []
+        self.expanded = 0 #how many cells the last search expanded
+        self.cost = 0 #the cost of the last path found
+        
+    def _alloc(self,w,h):
+        n = w*h
+        self.size = w,h
+        self.g = array('i',[0])*n
+        self.parent = array('i',[0])*n
+        #a cell's g and parent are only good if seen is the current stamp,
+        #so nothing has to be cleared between searches
+        self.seen = array('i',[0])*n
+        self.closed = array('i',[0])*n
+        self.stamp = 0
+
+    def search(self,start,end,area=None):
+        """find a path
+        
+        <pre>AStar.search(start,end,area=None): return [list of positions]</pre>
+        
+        <dl>
+        <dt>start<dd>start position
+        <dt>end<dd>end position
+        <dt>area<dd>(x0,y0,x1,y1) to only look for paths that stay in x0 <= x < x1, y0 <= y < y1
+        </dl>
+        
+        <p>returns a list of positions from start to end, not including
+        start, like astar.  It's empty if there's no way there.</p>
+        """
+        layer = self.layer
+        w,h = len(layer[0]),len(layer)
+        if (w,h) != self.size: self._alloc(w,h)
+        if area == None: x0,y0,x1,y1 = 0,0,w,h
+        else: x0,y0,x1,y1 = area
+        sx,sy = start
+        ex,ey = end
+        self.expanded = 0
+        if sx < x0 or sy < y0 or sx >= x1 or sy >= y1: return [] #start outside of layer
+        if ex < x0 or ey < y0 or ex >= x1 or ey >= y1: return [] #end outside of layer
+        if layer[sy][sx]: return [] #start is blocked
+        if layer[ey][ex]: return [] #end is blocked
+        
+        self.stamp += 1
+        if self.stamp >= 0x7fffffff: self._alloc(w,h); self.stamp = 1
+        stamp = self.stamp
+        g,parent,seen,closed = self.g,self.parent,self.seen,self.closed
+        moves,diagonals,corners = self.moves,self.diagonals,self.corners
+        heap = self.heap
+        del heap[:]
+        push,pop = heapq.heappush,heapq.heappop
+        
+        #heap entries are single ints, ((f*m)+h)*n+cell, so they sort by f,
+        #then by h, and pushing doesn't make a tuple
+        n = w*h
+        m = DIAGONAL*(w+h)+1
+        s,e = sy*w+sx,ey*w+ex
+        dx,dy = abs(sx-ex),abs(sy-ey)
+        hh = STRAIGHT*(dx+dy)
+        if diagonals: hh += (DIAGONAL-2*STRAIGHT)*min(dx,dy)
+        seen[s] = stamp
+        g[s] = 0
+        parent[s] = -1
+        push(heap,(hh*m+hh)*n+s)
+        expanded = 0
+        while heap:
+            i = pop(heap)%n
+            if closed[i] == stamp: continue
+            closed[i] = stamp
+            expanded += 1
+            if i == e: break
+            gi = g[i]
+            y = i/w
+            x = i-y*w
+            row = layer[y]
+            for mx,my,cost in moves:
+                nx,ny = x+mx,y+my
+                if nx < x0 or ny < y0 or nx >= x1 or ny >= y1: continue
+                if layer[ny][nx]: continue
+                if mx and my:
+                    a,b = row[nx],layer[ny][x]
+                    if (a or b) and (corners == 0 or (a and b and corners < 2)): continue
+                j = ny*w+nx
+                ng = gi+cost
+                if seen[j] == stamp and (closed[j] == stamp or ng >= g[j]): continue
+                seen[j] = stamp
+                g[j] = ng
+                parent[j] = i
+                dx,dy = abs(nx-ex),abs(ny-ey)
+                hh = STRAIGHT*(dx+dy)
+                if diagonals: hh += (DIAGONAL-2*STRAIGHT)*min(dx,dy)
+                push(heap,((ng+hh)*m+hh)*n+j)
+        self.expanded = expanded
+        del heap[:]
+        
+        if closed[e] != stamp: return []
+        self.cost = g[e]
+        path = []
+        i = e
+        while i != s:
+            y = i/w
+            path.append((i-y*w,y))
+            i = parent[i]
+        path.reverse()
+        return path
+    
+
+#the moves a FlowField can point in, the first four are up, right, down, left
+DIRECTIONS = [(0,-1),(1,0),(0,1),(-1,0),(-1,-1),(1,-1),(-1,1),(1,1)]
+_BACK = [2,3,0,1,7,6,5,4] #DIRECTIONS[_BACK[k]] is the opposite of DIRECTIONS[k]
+UNREACHABLE = 0x7fffffff
+
+class FlowField:
+    """the way to a goal from every cell of a grid
+    
+    <pre>FlowField(layer,goal=None,diagonals=False,corners=0,walls=None,slack=0)</pre>
+    
+    <dl>
+    <dt>layer<dd>a grid of cells, such as a vid's tlayer
+    <dt>goal<dd>the (x,y) cell everything heads for
+    <dt>diagonals,corners<dd>the moves allowed, as for AStar
+    <dt>walls<dd>the values of the cells that are walls, or None if every non-zero cell is a wall
+    <dt>slack<dd>how many times the goal may move to a neighboring cell before the field is worked out again, see set_goal
+    </dl>
+    
+    <p>One search from the goal finds the way from everywhere, so any
+    number of sprites can head for the goal by looking up their own
+    cell with direction, instead of each searching with astar.  The
+    distances and directions are kept in compact arrays, dist and dirs,
+    indexed by y*w+x.</p>
+    
+    <p>When a cell changes between wall and open, only the cells whose
+    way changes are worked out again.  Call tile_changed(pos) after
+    changing a cell, and set_goal to move the goal.  watch(vid) makes
+    vid.set call tile_changed for you.  If you change the layer some
+    other way, call recompute.</p>
+    
+    <strong>Example</strong>
+    <code>
+    field = FlowField(tv.tlayer,(px,py),walls=[1,2])
+    field.watch(tv)
+    #then, for each sprite
+    d = field.direction((x,y))
+    if d != None: dx,dy = d
+    </code>
+    """
+    def __init__(self,layer,goal=None,diagonals=False,corners=0,walls=None,slack=0):
+        self.layer = layer
+        self.diagonals,self.corners,self.walls = diagonals,corners,walls
+        self.slack = slack
+        self.trail = [] #where the goal was, while it's been slack
+        self.moved = 0 #the cost of the goal's moves along the trail
+        self.moves = [(dx,dy,STRAIGHT) for dx,dy in DIRECTIONS[:4]]
+        if diagonals: self.moves += [(dx,dy,DIAGONAL) for dx,dy in DIRECTIONS[4:]]
+        self.size = None
+        self.goal = goal
+        self.touched = 0 #how many cells the last change worked out again
+        self.recompute()
+        
+    def watch(self,vid):
+        """keep up with changes vid.set makes to the layer
+        
+        <pre>FlowField.watch(vid)</pre>
+        """
+        vid.watchers.append(self.tile_changed)
+        
+    def _blocked(self,v):
+        if self.walls == None: return v != 0
+        return v in self.walls
+        
+    def recompute(self):
+        """work the whole field out again
+        
+        <pre>FlowField.recompute()</pre>
+        """
+        layer = self.layer
+        w,h = len(layer[0]),len(layer)
+        n = w*h
+        if (w,h) != self.size:
+            self.size = w,h
+            self._unreached = array('i',[UNREACHABLE])*n
+            self._nowhere = array('b',[-1])*n
+            self.dist = array('i',self._unreached)
+            self.dirs = array('b',self._nowhere)
+            self.passable = array('B',[0])*n
+        else:
+            self.dist[:] = self._unreached
+            self.dirs[:] = self._nowhere
+        self.trail = []
+        self.moved = 0
+        passable,walls = self.passable,self.walls
+        i = 0
+        for row in layer:
+            if walls == None:
+                for v in row:
+                    passable[i] = not v
+                    i += 1
+            else:
+                for v in row:
+                    passable[i] = v not in walls
+                    i += 1
+        self.touched = 0
+        i = self._index(self.goal)
+        if i != None and passable[i]:
+            self.dist[i] = 0
+            self.touched = self._relax([i])
+        
+    def _index(self,pos):
+        if pos == None: return None
+        x,y = pos
+        w,h = self.size
+        if x < 0 or y < 0 or x >= w or y >= h: return None
+        return y*w+x
+        
+    def _legal(self,x,y,mx,my):
+        #can you move diagonally from x,y past the corners?
+        w = self.size[0]
+        a,b = self.passable[y*w+x+mx],self.passable[(y+my)*w+x]
+        return (a and b) or (self.corners != 0 and (a or b or self.corners == 2))
+        
+    def _relax(self,heap):
+        #dijkstra, outwards from the cells on the heap, which hold d*n+i
+        dist,dirs,passable = self.dist,self.dirs,self.passable
+        moves,corners = self.moves,self.corners
+        w,h = self.size
+        n = w*h
+        push,pop = heapq.heappush,heapq.heappop
+        heapq.heapify(heap)
+        count = 0
+        while heap:
+            d,i = divmod(pop(heap),n)
+            if d != dist[i]: continue
+            count += 1
+            y = i/w
+            x = i-y*w
+            k = 0
+            for mx,my,cost in moves:
+                k += 1
+                nx,ny = x+mx,y+my
+                if nx < 0 or ny < 0 or nx >= w or ny >= h: continue
+                j = ny*w+nx
+                if not passable[j]: continue
+                nd = d+cost
+                if nd >= dist[j]: continue
+                if mx and my:
+                    a,b = passable[y*w+nx],passable[ny*w+x]
+                    if (not a or not b) and (corners == 0 or (not a and not b and corners < 2)): continue
+                dist[j] = nd
+                dirs[j] = _BACK[k-1]
+                push(heap,nd*n+j)
+        return count
+        
+    def set_goal(self,goal):
+        """move the goal
+        
+        <pre>FlowField.set_goal(goal)</pre>
+        
+        <p>If it's moved to a neighboring cell, only the cells whose way
+        changes are worked out again.  Otherwise it's the same as
+        recompute.  On open ground, though, the distance to the goal
+        changes almost everywhere when it moves.  So the first slack
+        times in a row it moves to a neighbor, the old goal just points
+        at the new one instead, and nothing else is touched.  The way
+        from some cells may then be up to two moves longer than it has
+        to be for each of those times.</p>
+        """
+        old,self.goal = self.goal,goal
+        if goal == old: return
+        i,o = self._index(goal),self._index(old)
+        if i == None or o == None or not self.passable[i] or self.dirs[o] != -1 or self.dist[o] == UNREACHABLE or max(abs(goal[0]-old[0]),abs(goal[1]-old[1])) > 1:
+            self.recompute()
+            return
+        dx,dy = goal[0]-old[0],goal[1]-old[1]
+        if dx and dy and (not self.diagonals or not self._legal(old[0],old[1],dx,dy)):
+            self.recompute()
+            return
+        if len(self.trail) < self.slack:
+            self.dirs[o] = DIRECTIONS.index((dx,dy))
+            self.dirs[i] = -1
+            self.trail.append(old)
+            self.moved += DIAGONAL if dx and dy else STRAIGHT
+            self.touched = 2
+            return
+        if self.trail:
+            #the trail doesn't have the distances right
+            self.recompute()
+            return
+        #with both as goals, things can only get closer
+        self.dist[i] = 0
+        self.dirs[i] = -1
+        self.touched = self._relax([i])
+        #then letting go of the old one can only take things further away
+        self.touched += self._invalidate([o])
+        
+    def _invalidate(self,roots):
+        #forget the way from the roots and from everything whose way went
+        #through them, and work it out again from the cells around them
+        dist,dirs,passable = self.dist,self.dirs,self.passable
+        moves = self.moves
+        w,h = self.size
+        n = w*h
+        seen = set(roots)
+        cells = list(roots)
+        for c in cells:
+            y = c/w
+            x = c-y*w
+            k = 0
+            for mx,my,cost in moves:
+                k += 1
+                nx,ny = x+mx,y+my
+                if nx < 0 or ny < 0 or nx >= w or ny >= h: continue
+                j = ny*w+nx
+                if dirs[j] == _BACK[k-1] and j not in seen:
+                    seen.add(j)
+                    cells.append(j)
+        for c in cells:
+            dist[c] = UNREACHABLE
+            dirs[c] = -1
+        goal = self._index(self.goal)
+        heap = []
+        for c in cells:
+            if not passable[c]: continue
+            if c == goal:
+                dist[c] = 0
+                heap.append(c)
+                continue
+            y = c/w
+            x = c-y*w
+            k = 0
+            best = UNREACHABLE
+            for mx,my,cost in moves:
+                k += 1
+                nx,ny = x+mx,y+my
+                if nx < 0 or ny < 0 or nx >= w or ny >= h: continue
+                j = ny*w+nx
+                if dist[j] == UNREACHABLE or dist[j]+cost >= best: continue
+                if mx and my and not self._legal(x,y,mx,my): continue
+                best = dist[j]+cost
+                dirs[c] = k-1
+            if best != UNREACHABLE:
+                dist[c] = best
+                heap.append(best*n+c)
+        return self._relax(heap)
+        
+    def tile_changed(self,pos):
+        """work out the cells whose way changed because the cell at pos did
+        
+        <pre>FlowField.tile_changed(pos)</pre>
+        """
+        i = self._index(pos)
+        if i == None: return
+        x,y = pos
+        passable = self.passable
+        open = not self._blocked(self.layer[y][x])
+        if passable[i] == open: return
+        passable[i] = open
+        if self.trail:
+            #the trail doesn't have the distances right
+            self.recompute()
+            return
+        w,h = self.size
+        n = w*h
+        if not open:
+            roots = [i]
+            if self.diagonals and self.corners < 2:
+                #diagonal moves past its corners might not be allowed now
+                for mx,my in DIRECTIONS:
+                    qx,qy = x+mx,y+my
+                    if qx < 0 or qy < 0 or qx >= w or qy >= h: continue
+                    k = self.dirs[qy*w+qx]
+                    if k < 4: continue
+                    dx,dy = DIRECTIONS[k]
+                    if not self._legal(qx,qy,dx,dy): roots.append(qy*w+qx)
+            self.touched = self._invalidate(roots)
+            return
+        #things can only get closer, through it or past its corners
+        heap = []
+        if i == self._index(self.goal):
+            self.dist[i] = 0
+            self.dirs[i] = -1
+            heap.append(i)
+        for mx,my in DIRECTIONS:
+            qx,qy = x+mx,y+my
+            if qx < 0 or qy < 0 or qx >= w or qy >= h: continue
+            j = qy*w+qx
+            if self.dist[j] != UNREACHABLE: heap.append(self.dist[j]*n+j)
+        self.touched = self._relax(heap)
+        
+    def direction(self,pos):
+        """return the way to go from a cell
+        
+        <pre>FlowField.direction(pos): return (dx,dy)</pre>
+        
+        <p>returns one of DIRECTIONS, or None at the goal, at a wall, or
+        if there's no way to the goal.</p>
+        """
+        i = self._index(pos)
+        if i == None: return None
+        k = self.dirs[i]
+        if k < 0: return None
+        return DIRECTIONS[k]
+        
+    def distance(self,pos):
+        """return how far the goal is from a cell
+        
+        <pre>FlowField.distance(pos): return distance</pre>
+        
+        <p>returns the cost of the way there, in STRAIGHT per move, or
+        None if there's no way there.  While the goal is moving along
+        its trail (see set_goal) it may be a little more than the way
+        direction shows.</p>
+        """
+        i = self._index(pos)
+        if i == None or self.dist[i] == UNREACHABLE: return None
+        if pos == self.goal: return 0
+        return self.dist[i]+self.moved
+    
+
+class HPAStar:
+    """hierarchical a* for big grids
+    
+    <pre>HPAStar(layer,cluster=16,diagonals=False,corners=0)</pre>
+    
+    <dl>
+    <dt>layer<dd>a grid where zero cells are open and non-zero cells are walls
+    <dt>cluster<dd>the width and height in cells of each cluster
+    <dt>diagonals,corners<dd>the moves allowed, as for AStar
+    </dl>
+    
+    <p>The layer is split into square clusters.  Where the open cells
+    along the edge between two clusters let you cross, there are
+    entrances: one in the middle of a short opening, one at each end of
+    a long one.  A small graph joins each cluster's entrances to each
+    other.  When a cluster is worked out, it's flooded from each of its
+    entrances, which gives the cost of those edges, and the cost and way
+    from the entrance to every cell in the cluster.  So joining the start
+    and end to the graph, and refining a path, are just lookups, and a
+    search only has to look at the graph.  The path found is close to
+    the shortest, but not always the shortest.</p>
+    
+    <p>That isn't quick enough for sub-millisecond searches in Python.
+    On a random 256x256 layer with 25% walls, after build, bench-astar.py
+    measures about 3ms per search (half take under 1.2ms, but the
+    longest paths take 15 to 30ms), where AStar takes about 20ms, and
+    refine about 0.1 to 0.3ms.  build takes about 2s.</p>
+    
+    <p>Clusters are worked out the first time a search needs them.
+    After a cell changes, call tile_changed(pos), or have vid.set do it
+    for you with watch(vid), and only its cluster, and the neighbor
+    across the edge if it's on one, are worked out again.</p>
+    
+    <strong>Example</strong>
+    <code>
+    h = HPAStar(layer,diagonals=True)
+    path = h.path((1,1),(200,180))
+    </code>
+    """
+    def __init__(self,layer,cluster=16,diagonals=False,corners=0):
+        self.layer = layer
+        self.cluster = cluster
+        self.astar = AStar(layer,diagonals,corners)
+        self.moves,self.diagonals,self.corners = self.astar.moves,diagonals,corners
+        self.w,self.h = len(layer[0]),len(layer)
+        self.cw,self.ch = (self.w+cluster-1)/cluster,(self.h+cluster-1)/cluster
+        self.borders = {} #(cx,cy,across) to [list of (cell,cell) entrances]
+        self.edges = {} #cluster to {entrance cell:[list of (cell,cost)]}
+        self.floods = {} #cluster to {entrance cell:(dist,parent)}, see _flood
+        self.graph = {} #entrance cell to its list in edges, for every cluster
+        self.parts = None #by cell, which part of the graph an entrance is in
+        self.marks = [] #by cell, the cost from each landmark to an entrance
+        self.expanded = 0 #how many graph nodes the last search expanded
+        
+    def watch(self,vid):
+        """keep up with changes vid.set makes to the layer
+        
+        <pre>HPAStar.watch(vid)</pre>
+        """
+        vid.watchers.append(self.tile_changed)
+        
+    def build(self):
+        """work out every cluster now, instead of when searches need them
+        
+        <pre>HPAStar.build()</pre>
+        
+        <p>This also works out which entrances can get to each other, so
+        search gives up straight away when there's no path, and the cost
+        from a few landmarks to every entrance, which tells search which
+        way to go, so it looks at far fewer entrances.  A change to a
+        cell throws those away, and searches are slower until build is
+        called again.</p>
+        """
+        for ci in xrange(0,self.cw*self.ch): self._cluster(ci)
+        self._landmarks()
+        
+    def _landmarks(self):
+        #number the parts of the graph that can't get to each other, and
+        #flood the biggest part from the entrances nearest the corners and
+        #the middles of the sides of the layer
+        w,h,graph = self.w,self.h,self.graph
+        n = w*h
+        parts = array('i',[-1])*n
+        sizes = []
+        for i in graph:
+            if parts[i] != -1: continue
+            k = len(sizes)
+            parts[i] = k
+            todo = [i]
+            size = 0
+            while todo:
+                size += 1
+                for j,cost in graph[todo.pop()]:
+                    if parts[j] == -1:
+                        parts[j] = k
+                        todo.append(j)
+            sizes.append(size)
+        self.parts,self.marks = parts,[]
+        if not sizes: return
+        big = sizes.index(max(sizes))
+        nodes = [i for i in graph if parts[i] == big]
+        push,pop = heapq.heappush,heapq.heappop
+        for px,py in ((0,0),(w/2,0),(w-1,0),(w-1,h/2),
+                (w-1,h-1),(w/2,h-1),(0,h-1),(0,h/2)):
+            best = None
+            for i in nodes:
+                y = i/w
+                d = abs(i-y*w-px)+abs(y-py)
+                if best == None or d < best: best,mark = d,i
+            dist = array('i',[UNREACHABLE])*n
+            dist[mark] = 0
+            heap = [mark]
+            while heap:
+                d,i = divmod(pop(heap),n)
+                if d != dist[i]: continue
+                for j,cost in graph[i]:
+                    nd = d+cost
+                    if nd < dist[j]:
+                        dist[j] = nd
+                        push(heap,nd*n+j)
+            self.marks.append(dist)
+        
+    def tile_changed(self,pos):
+        """forget the clusters a change to the cell at pos affects
+        
+        <pre>HPAStar.tile_changed(pos)</pre>
+        """
+        x,y = pos
+        c = self.cluster
+        cx,cy = x/c,y/c
+        keys = []
+        if x%c == c-1: keys.append((cx,cy,True))
+        if x%c == 0: keys.append((cx-1,cy,True))
+        if y%c == c-1: keys.append((cx,cy,False))
+        if y%c == 0:
+            keys.append((cx,cy-1,False))
+            if x%c == c-1: keys.append((cx,cy-1,True))
+            if x%c == 0: keys.append((cx-1,cy-1,True))
+        forget = set([(cx,cy)])
+        for key in keys:
+            if self.borders.pop(key,None) == None: continue
+            kx,ky,across = key
+            forget.update([(kx,ky),(kx,ky+1)])
+            if across: forget.update([(kx+1,ky),(kx+1,ky+1)])
+        if forget: self.parts,self.marks = None,[]
+        for cx,cy in forget:
+            ci = cy*self.cw+cx
+            for i in self.edges.pop(ci,{}): del self.graph[i]
+            self.floods.pop(ci,None)
+        
+    def _area(self,cx,cy):
+        c = self.cluster
+        return cx*c,cy*c,min((cx+1)*c,self.w),min((cy+1)*c,self.h)
+        
+    def _border(self,key):
+        #the entrances, as (cell,cell,cost), across the right edge of
+        #cluster cx,cy if across, otherwise across the bottom edge
+        r = self.borders.get(key)
+        if r != None: return r
+        cx,cy,across = key
+        layer,w,h = self.layer,self.w,self.h
+        x0,y0,x1,y1 = self._area(cx,cy)
+        if across: cells = [((x1-1,y),(x1,y)) for y in xrange(y0,y1)]
+        else: cells = [((x,y1-1),(x,y1)) for x in xrange(x0,x1)]
+        r = []
+        run = []
+        for a,b in cells+[(None,None)]:
+            if a != None and not layer[a[1]][a[0]] and not layer[b[1]][b[0]]:
+                run.append((a[1]*w+a[0],b[1]*w+b[0],STRAIGHT))
+                continue
+            if len(run) >= 6: r.extend([run[0],run[-1]])
+            elif run: r.append(run[len(run)/2])
+            run = []
+        if self.diagonals and self.corners == 2:
+            #squeezing diagonally between two walls is the only way across
+            #that doesn't go past an entrance
+            for (ax,ay),(bx,by) in cells:
+                if across: ends = [((ax,ay),(bx,by+1)),((ax,ay+1),(bx,by))]
+                elif bx+1 < x1: ends = [((ax,ay),(bx+1,by)),((ax+1,ay),(bx,by))]
+                else: continue
+                for (ax,ay),(bx,by) in ends:
+                    if ay >= h or by >= h: continue
+                    if layer[ay][ax] or layer[by][bx]: continue
+                    if layer[ay][bx] and layer[by][ax]:
+                        r.append((ay*w+ax,by*w+bx,DIAGONAL))
+        self.borders[key] = r
+        return r
+        
+    def _cluster(self,ci):
+        #the entrances of a cluster, and the graph's edges from them
+        edges = self.edges.get(ci)
+        if edges != None: return edges
+        cw,ch,w,c = self.cw,self.ch,self.w,self.cluster
+        cy = ci/cw
+        cx = ci-cy*cw
+        edges = {}
+        keys = []
+        if cx < cw-1: keys.extend([(cx,cy,True),(cx,cy-1,True)])
+        if cx > 0: keys.extend([(cx-1,cy,True),(cx-1,cy-1,True)])
+        if cy < ch-1: keys.append((cx,cy,False))
+        if cy > 0: keys.append((cx,cy-1,False))
+        for key in keys:
+            if key[1] < 0: continue
+            for a,b,cost in self._border(key):
+                for i,j in ((a,b),(b,a)):
+                    y = i/w
+                    if y/c == cy and (i-y*w)/c == cx:
+                        edges.setdefault(i,[]).append((j,cost))
+        #a flood from each entrance gives its cost to every cell of the
+        #cluster, so the edges to the other entrances, and later the cost
+        #from a start or to an end, are just looked up
+        area = self._area(cx,cy)
+        links = self._links(area)
+        floods = {}
+        for i in edges: floods[i] = self._flood(i,area,links)
+        nodes = edges.keys()
+        for i in nodes:
+            dist = floods[i][0]
+            for j in nodes:
+                d = dist[self._local(j,area)]
+                if j != i and d != UNREACHABLE: edges[i].append((j,d))
+        self.edges[ci] = edges
+        self.floods[ci] = floods
+        self.graph.update(edges)
+        return edges
+        
+    def _local(self,i,area):
+        #the index of cell i in the arrays of a flood of area
+        x0,y0,x1,y1 = area
+        y = i/self.w
+        return (y-y0)*(x1-x0)+i-y*self.w-x0
+        
+    def _links(self,area):
+        #for each cell of area, by its local index, the (cell,cost) moves
+        #from it that stay in the area
+        layer,moves,corners = self.layer,self.moves,self.corners
+        x0,y0,x1,y1 = area
+        aw = x1-x0
+        links = []
+        for y in xrange(y0,y1):
+            row = layer[y]
+            for x in xrange(x0,x1):
+                r = []
+                links.append(r)
+                if row[x]: continue
+                for mx,my,cost in moves:
+                    nx,ny = x+mx,y+my
+                    if nx < x0 or ny < y0 or nx >= x1 or ny >= y1: continue
+                    if layer[ny][nx]: continue
+                    if mx and my:
+                        a,b = row[nx],layer[ny][x]
+                        if (a or b) and (corners == 0 or (a and b and corners < 2)): continue
+                    r.append(((ny-y0)*aw+nx-x0,cost))
+        return links
+        
+    def _flood(self,start,area,links):
+        #dijkstra from start to every cell of area.  Returns (dist,parent)
+        #arrays by local index: the cost from start, or UNREACHABLE, and
+        #the next cell on the way back to start, or -1
+        n = len(links)
+        s = self._local(start,area)
+        dist = array('i',[UNREACHABLE])*n
+        parent = array('i',[-1])*n
+        dist[s] = 0
+        if not self.diagonals:
+            #every move costs the same, so breadth first will do
+            todo = deque([s])
+            while todo:
+                i = todo.popleft()
+                d = dist[i]+STRAIGHT
+                for j,cost in links[i]:
+                    if dist[j] == UNREACHABLE:
+                        dist[j] = d
+                        parent[j] = i
+                        todo.append(j)
+            return dist,parent
+        heap = [s]
+        push,pop = heapq.heappush,heapq.heappop
+        while heap:
+            d,i = divmod(pop(heap),n)
+            if d != dist[i]: continue
+            for j,cost in links[i]:
+                nd = d+cost
+                if nd < dist[j]:
+                    dist[j] = nd
+                    parent[j] = i
+                    push(heap,nd*n+j)
+        return dist,parent
+        
+    def _reach(self,i,ci):
+        #(entrance,cost) for each entrance of cluster ci that cell i can
+        #get to without leaving it
+        self._cluster(ci)
+        cy = ci/self.cw
+        k = self._local(i,self._area(ci-cy*self.cw,cy))
+        r = []
+        for j,(dist,parent) in self.floods[ci].iteritems():
+            d = dist[k]
+            if d != UNREACHABLE: r.append((j,d))
+        return r
+        
+    def search(self,start,end):
+        """find the entrances a path goes through
+        
+        <pre>HPAStar.search(start,end): return [list of positions]</pre>
+        
+        <p>returns start, the entrances the path goes through, and end,
+        or an empty list if there's no way there.  Pass it to refine
+        for the whole path.</p>
+        """
+        layer,w,h,c,cw = self.layer,self.w,self.h,self.cluster,self.cw
+        sx,sy = start
+        ex,ey = end
+        self.expanded = 0
+        if sx < 0 or sy < 0 or sx >= w or sy >= h: return [] #start outside of layer
+        if ex < 0 or ey < 0 or ex >= w or ey >= h: return [] #end outside of layer
+        if layer[sy][sx] or layer[ey][ex]: return [] #start or end is blocked
+        s,e = sy*w+sx,ey*w+ex
+        if s == e: return [start,end]
+        sc,ec = (sy/c)*cw+sx/c,(ey/c)*cw+ex/c
+        starts = self._reach(s,sc)
+        if s in self.edges[sc]: starts += self.edges[sc][s]
+        ends = dict(self._reach(e,ec))
+        a = self.astar
+        if sc == ec and a.search(start,end,self._area(sx/c,sy/c)):
+            starts.append((e,a.cost))
+        elif not starts or not ends: return []
+        elif self.parts != None:
+            #the entrances a cell can get to inside its cluster can all get
+            #to each other, so they're in the same part
+            if self.parts[starts[0][0]] != self.parts[ends.keys()[0]]: return []
+        
+        #for each landmark, the cost from it to end is between lo and hi,
+        #and the most the cost from an entrance to end can be less than
+        #is the heuristic.  The four that say the most about start are used
+        active = []
+        for dist in self.marks:
+            if not ends or dist[ends.keys()[0]] == UNREACHABLE: continue
+            lo = max([dist[j]-d for j,d in ends.iteritems()])
+            hi = min([dist[j]+d for j,d in ends.iteritems()])
+            slo = max([dist[j]-d for j,d in starts])
+            shi = min([dist[j]+d for j,d in starts])
+            active.append((max(lo-shi,slo-hi),dist,lo,hi))
+        active.sort(reverse=True)
+        active = [(dist,lo,hi) for hs,dist,lo,hi in active[:4]]
+        
+        #a* over the graph, in the AStar's arrays, which are indexed by
+        #cell like the graph is
+        if (w,h) != a.size: a._alloc(w,h)
+        a.stamp += 1
+        if a.stamp >= 0x7fffffff: a._alloc(w,h); a.stamp = 1
+        stamp = a.stamp
+        g,parent,seen,closed = a.g,a.parent,a.seen,a.closed
+        graph = self.graph
+        n = w*h
+        m = DIAGONAL*(w+h)+1
+        diagonals = self.diagonals
+        push,pop = heapq.heappush,heapq.heappop
+        seen[s] = stamp
+        g[s] = 0
+        parent[s] = -1
+        heap = [s]
+        expanded = 0
+        while heap:
+            i = pop(heap)%n
+            if closed[i] == stamp: continue
+            closed[i] = stamp
+            expanded += 1
+            if i == e: break
+            if i == s: nbrs = starts
+            else:
+                nbrs = graph.get(i)
+                if nbrs == None:
+                    y = i/w
+                    nbrs = self._cluster((y/c)*cw+(i-y*w)/c)[i]
+                if i in ends: nbrs = nbrs+[(e,ends[i])]
+            gi = g[i]
+            for j,cost in nbrs:
+                ng = gi+cost
+                if seen[j] == stamp and (closed[j] == stamp or ng >= g[j]): continue
+                seen[j] = stamp
+                g[j] = ng
+                parent[j] = i
+                y = j/w
+                dx,dy = abs(j-y*w-ex),abs(y-ey)
+                hh = STRAIGHT*(dx+dy)
+                if diagonals: hh += (DIAGONAL-2*STRAIGHT)*min(dx,dy)
+                if j != e:
+                    for dist,lo,hi in active:
+                        d = dist[j]
+                        if lo-d > hh: hh = lo-d
+                        elif d-hi > hh: hh = d-hi
+                push(heap,((ng+hh)*m+hh)*n+j)
+        self.expanded = expanded
+        if closed[e] != stamp: return []
+        r = []
+        i = e
+        while i != -1:
+            y = i/w
+            r.append((i-y*w,y))
+            i = parent[i]
+        r.reverse()
+        return r
+        
+    def _trail(self,a,b,ci):
+        #the cells from a, not included, to b, following the flood from b
+        #back to it, or None if the flood doesn't reach a
+        cy = ci/self.cw
+        x0,y0,x1,y1 = area = self._area(ci-cy*self.cw,cy)
+        aw = x1-x0
+        dist,parent = self.floods[ci][b]
+        i = self._local(a,area)
+        if dist[i] == UNREACHABLE: return None
+        r = []
+        i = parent[i]
+        while i != -1:
+            y = i/aw
+            r.append((x0+i-y*aw,y0+y))
+            i = parent[i]
+        return r
+        
+    def refine(self,waypoints):
+        """walk the whole path through the entrances search found
+        
+        <pre>HPAStar.refine(waypoints): return generator of positions</pre>
+        
+        <p>yields the positions from the first waypoint to the last, not
+        including the first, like astar.  The steps to and from entrances
+        are looked up in the floods worked out with the clusters, so it's
+        quick, and each step is only looked up when it's reached.</p>
+        """
+        w,c,cw = self.w,self.cluster,self.cw
+        for k in xrange(1,len(waypoints)):
+            (ax,ay),(bx,by) = waypoints[k-1],waypoints[k]
+            cx,cy = ax/c,ay/c
+            if (cx,cy) != (bx/c,by/c): #across an edge
+                yield bx,by
+                continue
+            ci = cy*cw+cx
+            a,b = ay*w+ax,by*w+bx
+            floods = self.floods.get(ci)
+            if floods == None:
+                self._cluster(ci)
+                floods = self.floods[ci]
+            steps = None
+            if b in floods: steps = self._trail(a,b,ci)
+            elif a in floods:
+                steps = self._trail(b,a,ci)
+                if steps != None:
+                    steps.reverse()
+                    steps = steps[1:]+[(bx,by)]
+            if steps == None: #the start to the end, or a cell has changed
+                steps = self.astar.search((ax,ay),(bx,by),self._area(cx,cy))
+            for pos in steps: yield pos
+        
+    def path(self,start,end):
+        """find a path
+        
+        <pre>HPAStar.path(start,end): return [list of positions]</pre>
+        
+        <p>returns a list of positions from start to end, not including
+        start, like astar.  It's empty if there's no way there.</p>
+        """
+        return list(self.refine(self.search(start,end)))
+    
+
+class PathRequest:
+    """a path asked for from a PathQueue
+    
+    <strong>Attributes</strong>
+    <dl>
+    <dt>start,end <dd>where the path is from and to
+    <dt>done <dd>whether it's been found yet
+    <dt>path <dd>the path, as the search function returned it, once done
+    </dl>
+    """
+    def __init__(self,start,end,frame):
+        self.start,self.end = start,end
+        self.done = False
+        self.path = None
+        self.callbacks = []
+        self.time = default_timer()
+        self.frame = frame
+
+class PathQueue:
+    """paths asked for now, and found over the next frames
+    
+    <pre>PathQueue(search,budget=0.002)</pre>
+    
+    <dl>
+    <dt>search <dd>a function search(start,end) that returns a path, such as AStar(layer).search or HPAStar(layer).path
+    <dt>budget <dd>the most seconds run may spend searching each frame
+    </dl>
+    
+    <p>Sprites ask for paths with request, and get them in a later
+    frame, so lots of sprites wanting new paths at once doesn't make
+    a frame late.  Asking for a path that's already been asked for,
+    and isn't found yet, gets the same PathRequest back.</p>
+    
+    <p>Run it once a frame.  You usually don't create this directly, see
+    Vid.use_paths, which runs it in Vid.loop.</p>
+    
+    <strong>Attributes</strong>
+    <dl>
+    <dt>requested, found, shared <dd>counters: requests made, paths found,
+        and requests answered with one that was already waiting
+    <dt>latency <dd>seconds from request to found, for the last 256 found
+    </dl>
+    """
+    def __init__(self,search,budget=0.002):
+        self.search = search
+        self.budget = budget
+        self.waiting = deque()
+        self.pending = {} #(start,end) to the PathRequest
+        self.frame = 0
+        self.requested = self.found = self.shared = 0
+        self.latency = deque(maxlen=256)
+        self.frames = deque(maxlen=256)
+        self.worker = self.worker_search = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._todo = deque() #handed to the worker
+        self._finished = deque() #(PathRequest,path) found by the worker
+        
+    def request(self,start,end,callback=None):
+        """ask for a path
+        
+        <pre>PathQueue.request(start,end,callback=None): return PathRequest</pre>
+        
+        <dl>
+        <dt>start,end <dd>positions to pass to the search function
+        <dt>callback <dd>a function callback(request) to call when it's found
+        </dl>
+        """
+        self.requested += 1
+        key = (start,end)
+        r = self.pending.get(key)
+        if r == None:
+            r = self.pending[key] = PathRequest(start,end,self.frame)
+            self.waiting.append(r)
+        else: self.shared += 1
+        if callback != None: r.callbacks.append(callback)
+        return r
+        
+    def use_worker(self,search):
+        """send what doesn't fit in the budget to a worker thread
+        
+        <pre>PathQueue.use_worker(search)</pre>
+        
+        <dl>
+        <dt>search <dd>a search function for the worker to use, over its own copy of the layer, such as AStar([row[:] for row in layer]).search.  Pass None to stop using the worker.
+        </dl>
+        
+        <p>The worker's copy doesn't change when the layer does, so call
+        this again with a new copy after changing the layer.  Python only
+        runs one thread at a time, so the worker still takes time from
+        the game, a little at a time, between frames and in them.</p>
+        """
+        self._lock.acquire()
+        try:
+            self.worker_search = search
+            if search == None:
+                #take back what it hasn't started on
+                self._todo.reverse()
+                self.waiting.extendleft(self._todo)
+                self._todo.clear()
+                self._wake.set()
+            elif self.worker == None:
+                self.worker = threading.Thread(target=self._work,name='paths')
+                self.worker.setDaemon(True)
+                self.worker.start()
+        finally:
+            self._lock.release()
+        
+    def _work(self):
+        while True:
+            self._wake.wait()
+            self._lock.acquire()
+            try:
+                search = self.worker_search
+                if search == None or not self._todo:
+                    self._wake.clear()
+                    if search == None:
+                        self.worker = None
+                        return
+                    continue
+                r = self._todo.popleft()
+            finally:
+                self._lock.release()
+            path = search(r.start,r.end)
+            self._finished.append((r,path))
+        
+    def run(self,budget=None):
+        """search for waiting paths, for up to budget seconds
+        
+        <pre>PathQueue.run(budget=None)</pre>
+        
+        <p>budget defaults to self.budget.  At least one path is searched
+        for, so something always gets done.  If there's a worker, the
+        rest are handed to it, and what it's found is passed on.  The
+        callbacks are called from here, never from the worker.</p>
+        """
+        if budget == None: budget = self.budget
+        self.frame += 1
+        while self._finished:
+            r,path = self._finished.popleft()
+            self._finish(r,path)
+        end = default_timer()+budget
+        waiting,search = self.waiting,self.search
+        while waiting:
+            r = waiting.popleft()
+            self._finish(r,search(r.start,r.end))
+            if default_timer() >= end: break
+        if waiting and self.worker_search != None:
+            self._lock.acquire()
+            try:
+                self._todo.extend(waiting)
+                waiting.clear()
+                self._wake.set()
+            finally:
+                self._lock.release()
+        
+    def _finish(self,r,path):
+        r.path = path
+        r.done = True
+        del self.pending[(r.start,r.end)]
+        self.found += 1
+        self.latency.append(default_timer()-r.time)
+        self.frames.append(self.frame-r.frame)
+        for f in r.callbacks: f(r)
+        
+    def __len__(self):
+        return len(self.pending)
+        
+    def stats(self):
+        """Return a dict of how the queue is doing.
+        
+        <pre>PathQueue.stats(): return dict</pre>
+        
+        <p>depth is how many requests are waiting, and latency and frames
+        are the average and most seconds and frames recent requests
+        waited.</p>
+        """
+        latency,frames = list(self.latency),list(self.frames)
+        n = max(len(latency),1)
+        return {'depth':len(self.pending),'requested':self.requested,
+            'found':self.found,'shared':self.shared,
+            'latency':(sum(latency)/n,max(latency or [0])),
+            'frames':(sum(frames)/float(n),max(frames or [0]))}
+    
+
 def getline(a,b):
     """returns a path of points from a to b
     
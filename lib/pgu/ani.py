@@ -4,8 +4,6 @@
 future versions of pgu!</p>
 """
 
-print 'pgu.ani','This module is alpha, and is subject to change.'
-
 import math
 import pygame
 
@@ -52,10 +50,10 @@ def ani_load(tv,name,img,size,shape,parts):
 def image_rotate(tv,name,img,shape,angles,diff=0):
     """rotate an image and put it into tv.images
     
-    <pre>image_rotate(tv,name,image,shape,angles,diff=0)</pre>
+    <pre>image_rotate(tv,name,image,shape,angles,diff=0): return [list of (image,shape)]</pre>
     
     <dl>
-    <dt>tv <dd>vid to load into
+    <dt>tv <dd>vid to load into, or None to only return the images
     <dt>name <dd>prefix name to give the images
     <dt>image <dd>image to load anis from
     <dt>shape <dd>shape fimage (usually a subset of 0,0,w,h) used for collision detection
@@ -66,6 +64,7 @@ def image_rotate(tv,name,img,shape,angles,diff=0):
     w1,h1 = img.get_width(),img.get_height()
     shape = pygame.Rect(shape)
     ps = shape.topleft,shape.topright,shape.bottomleft,shape.bottomright
+    r_ = []
     for a in angles:
         img2 = pygame.transform.rotate(img,a+diff)
         w2,h2 = img2.get_width(),img2.get_height()
@@ -85,6 +84,40 @@ def image_rotate(tv,name,img,shape,angles,diff=0):
         r = pygame.Rect(minx,miny,maxx-minx,maxy-miny)
         #print r
         #((ww-w)/2,(hh-h)/2,w,h)
-        tv.images["%s.%d"%(name,a)] = img2,r
-        
+        if tv != None: tv.images["%s.%d"%(name,a)] = img2,r
+        r_.append((img2,r))
+    return r_
+
+def image_rotations(tv,name,img,shape,steps=64,diff=0):
+    """pre-render an image at evenly spaced angles, for use with rotation
+    
+    <pre>image_rotations(tv,name,image,shape,steps=64,diff=0): return [list of (image,shape)]</pre>
+    
+    <dl>
+    <dt>tv <dd>vid to load into, or None to only return the images
+    <dt>name <dd>prefix name to give the images
+    <dt>image <dd>image to rotate
+    <dt>shape <dd>shape of image (usually a subset of 0,0,w,h) used for collision detection
+    <dt>steps <dd>how many angles to render, spread evenly around the circle (at most 360)
+    <dt>diff <dd>a number to add to the angles, to correct for source image not actually being at 0 degrees
+    </dl>
+    
+    <p>the images are put into tv.images by image_rotate, and also returned
+    in order of angle, so that rotation(rotations,angle) can find one without
+    doing any transforming.</p>
+    """
+    angles = [i*360.0/steps for i in xrange(0,steps)]
+    return image_rotate(tv,name,img,shape,angles,diff)
 
+def rotation(rotations,angle):
+    """look up the pre-rendered rotation nearest to an angle
+    
+    <pre>rotation(rotations,angle): return image,shape</pre>
+    
+    <dl>
+    <dt>rotations <dd>a list returned by image_rotations
+    <dt>angle <dd>the angle wanted, in degrees
+    </dl>
+    """
+    n = len(rotations)
+    return rotations[int(round(angle*n/360.0))%n]
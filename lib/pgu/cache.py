@@ -0,0 +1,84 @@
+"""A cache of surfaces, limited by how many bytes they take up.
+
+<p>This is what tilevid.ChunkCache and text.TextCache keep their
+surfaces in.</p>
+"""
+from collections import OrderedDict
+
+class SurfaceCache:
+    """A least recently used cache of surfaces.
+
+    <pre>SurfaceCache(limit=4194304)</pre>
+
+    <dl>
+    <dt>limit <dd>the most bytes of surfaces to keep.  The least recently
+              used ones are thrown away to stay under it.
+    </dl>
+
+    <strong>Attributes</strong>
+    <dl>
+    <dt>surfaces <dd>an OrderedDict of key:surface, least recently used first
+    <dt>bytes <dd>bytes of surfaces held right now
+    <dt>hits, misses, evictions <dd>counters, for tuning limit
+    </dl>
+    """
+    def __init__(self,limit=4194304):
+        self.limit = limit
+        self.surfaces = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self,k):
+        """Return the surface kept under k, or None, and count a hit or miss.
+
+        <pre>SurfaceCache.lookup(k): return surface</pre>
+        """
+        img = self.surfaces.pop(k,None)
+        if img != None:
+            self.hits += 1
+            self.surfaces[k] = img
+            return img
+        self.misses += 1
+        return None
+
+    def add(self,k,img):
+        """Keep a surface under k, throwing away old ones to make room.
+
+        <pre>SurfaceCache.add(k,img): return img</pre>
+        """
+        self.discard(k)
+        n = img.get_pitch()*img.get_height()
+        while self.surfaces and self.bytes+n > self.limit:
+            k2,old = self.surfaces.popitem(last=False)
+            self.bytes -= old.get_pitch()*old.get_height()
+            self.evictions += 1
+        self.surfaces[k] = img
+        self.bytes += n
+        return img
+
+    def discard(self,k):
+        """Throw away the surface kept under k, if there is one.
+
+        <pre>SurfaceCache.discard(k)</pre>
+        """
+        img = self.surfaces.pop(k,None)
+        if img != None: self.bytes -= img.get_pitch()*img.get_height()
+
+    def clear(self):
+        """Throw away every surface.
+
+        <pre>SurfaceCache.clear()</pre>
+        """
+        self.surfaces.clear()
+        self.bytes = 0
+
+    def stats(self):
+        """Return a dict of how the cache is doing.
+
+        <pre>SurfaceCache.stats(): return dict</pre>
+        """
+        return {'surfaces':len(self.surfaces),'bytes':self.bytes,
+            'limit':self.limit,'hits':self.hits,'misses':self.misses,
+            'evictions':self.evictions}
@@ -4,11 +4,11 @@
 future versions of pgu!</p>
 """
 
-print 'pgu.fonts','This module is alpha, and is subject to change.'
-
 import pygame
 from pygame.locals import *
 
+from pgu import text as _text
+
 class TileFont:
     """Creates an instance of the TileFont class.  Interface compatible with pygame.Font
     
@@ -36,6 +36,7 @@ class TileFont:
         self.scale = scale
         
         self.chars = {}
+        self.cells = {}
         x,y = 0,0
         self.sensitive = sensitive
         if not self.sensitive: hints = hints.lower()
@@ -43,6 +44,7 @@ class TileFont:
             if c not in ('\r','\n','\t'):
                 img = self.image.subsurface(x,y,tw,th)
                 self.chars[c] = img
+                self.cells[c] = x/tw,y/th
                 x += tw
                 if x >= w: x,y = 0,y+th
                 
@@ -52,10 +54,37 @@ class TileFont:
         tw,th = self.scale
         return len(text)*tw,th
         
+    def atlas(self,color):
+        """Return (image,rects): the whole font image colored and scaled, and
+        a dict of the rect of each character in it.
+        
+        <pre>TileFont.atlas(color): return image,rects</pre>
+        
+        <p>Each color is only done once.</p>
+        """
+        color = tuple(color)
+        r = self.colors.get(color)
+        if r != None: return r
+        img = _colorize(self.image.convert_alpha(),color)
+        tw,th = self._size
+        sw,sh = self.scale
+        if (sw,sh) != (tw,th):
+            w,h = img.get_size()
+            big = pygame.Surface((w/tw*sw,(h+th-1)/th*sh)).convert_alpha()
+            big.fill((0,0,0,0))
+            for cx,cy in self.cells.values():
+                glyph = img.subsurface(cx*tw,cy*th,tw,th)
+                #add to the blank atlas, to copy without blending
+                big.blit(pygame.transform.scale(glyph,(sw,sh)),(cx*sw,cy*sh),None,BLEND_RGBA_ADD)
+            img = big
+        rects = {}
+        for c,(cx,cy) in self.cells.items(): rects[c] = pygame.Rect(cx*sw,cy*sh,sw,sh)
+        r = self.colors[color] = img,rects
+        return r
+        
     def render(self,text,antialias=0,color=(255,255,255),background=None):
         size = self.size(text)
-        scale = self.scale
-        tw,th = self._size
+        sw = self.scale[0]
         if background == None:
             s = pygame.Surface(size).convert_alpha()
             s.fill((0,0,0,0))
@@ -65,26 +94,54 @@ class TileFont:
             
         if not self.sensitive: text = text.lower()
         
-        if color not in self.colors: self.colors[color] = {}
-        colored = self.colors[color]
-        
-        x,y = 0,0
+        img,rects = self.atlas(color)
+        seq = []
+        x = 0
         for c in text:
-            if c in self.chars:
-                if c not in colored:
-                    img = self.chars[c].convert_alpha()
-                    for yy in xrange(0,th):
-                        for xx in xrange(0,tw):
-                            r,g,b,a = img.get_at((xx,yy))
-                            if a > 128:
-                                img.set_at((xx,yy),color)
-                    colored[c] = img
-                img = colored[c]
-                if scale != (tw,th): img = pygame.transform.scale(img,scale)
-                s.blit(img,(x,y))
-            x += scale[0]
+            r = rects.get(c)
+            if r != None: seq.append((img,(x,0),r))
+            x += sw
+        if _blits: s.blits(seq,0)
+        else:
+            for i,pos,r in seq: s.blit(i,pos,r)
         return s
-        
+
+_blits = hasattr(pygame.Surface,'blits')
+
+def _colorize(img,color):
+    #Color the pixels of img that are more than half opaque, like
+    #   if a > 128: img.set_at((x,y),color)
+    #for every pixel, but with a few whole surface blends instead.
+    #Changes img, and returns it.
+    r,g,b = color[:3]
+    alpha = 255
+    if len(color) > 3: alpha = color[3]
+    size = img.get_size()
+    
+    #m is (0,0,0,255) where a > 128, and (0,0,0,0) elsewhere
+    m = img.copy()
+    m.fill((255,255,255,128),None,BLEND_RGBA_SUB)
+    for i in xrange(8): m.blit(m.copy(),(0,0),None,BLEND_RGBA_ADD)
+    
+    #blitting m onto black gives solid masks to add and subtract
+    on = pygame.Surface(size)
+    on.fill((0,0,0))
+    on.blit(_add(m,(255,255,255,0)),(0,0))
+    fg = pygame.Surface(size)
+    fg.fill((0,0,0))
+    fg.blit(_add(m,(r,g,b,0)),(0,0))
+    
+    img.blit(on,(0,0),None,BLEND_SUB)
+    img.blit(fg,(0,0),None,BLEND_ADD)
+    img.blit(m,(0,0),None,BLEND_RGBA_SUB)
+    m.fill((0,0,0,255-alpha),None,BLEND_RGBA_SUB)
+    img.blit(m,(0,0),None,BLEND_RGBA_ADD)
+    return img
+
+def _add(img,color):
+    img = img.copy()
+    img.fill(color,None,BLEND_RGBA_ADD)
+    return img
         
 class BorderFont: 
     """a decorator for normal fonts, adds a border. Interface compatible with pygame.Font.
@@ -108,23 +165,6 @@ class BorderFont:
         return w+s*2,h+s*2
         
     def render(self,text,antialias=0,color=(255,255,255),background=None):
-        size = self.size(text)
-        
-        if background == None:
-            s = pygame.Surface(size).convert_alpha()
-            s.fill((0,0,0,0))
-        else:
-            s = pygame.Surface(size).convert()
-            s.fill(background)
-            
-        bg = self.font.render(text,antialias,self.color)
-        fg = self.font.render(text,antialias,color)
-        
-        si = self._size
-        dirs = [(-1,-1),(-1,0),(-1,1),(0,-1),(0,1),(1,-1),(1,0),(1,1)]
-        for dx,dy in dirs: s.blit(bg,(si+dx*si,si+dy*si))
-        s.blit(fg,(si,si))
-
-        return s
-
-        
+        """Render, through the shared text cache.  Don't draw on the result."""
+        return _text.cache.render(self.font,text,antialias,color,background,
+            self._size,self.color)
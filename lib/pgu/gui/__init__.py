@@ -1,31 +1,43 @@
 import pygame
 from pygame.locals import *
 
-from theme import Theme
-from style import Style
-from widget import Widget
-from surface import subsurface, ProxySurface
 from const import *
 
-from container import Container
-from app import App, Desktop
-from table import Table
-from document import Document
-#html
-from area import SlideBox, ScrollArea, List 
+#everything else is imported the first time it's used, see pgu.LazyModule
+_attrs = {}
+for _module,_names in [
+    ('theme',['Theme']),
+    ('style',['Style']),
+    ('widget',['Widget']),
+    ('surface',['subsurface','ProxySurface']),
 
-from form import Form
-from group import Group
+    ('container',['Container']),
+    ('app',['App','Desktop']),
+    ('table',['Table']),
+    ('document',['Document']),
+    #html
+    ('area',['SlideBox','ScrollArea','List']),
 
-from basic import Spacer, Color, Label, Image
-from button import Icon, Button, Switch, Checkbox, Radio, Tool, Link
-from input import Input, Password
-from keysym import Keysym
-from slider import VSlider, HSlider, VScrollBar, HScrollBar
-from select import Select
-from misc import ProgressBar
+    ('form',['Form']),
+    ('group',['Group']),
 
-from menus import Menus
-from dialog import Dialog, FileDialog
+    ('basic',['Spacer','Color','Label','Image']),
+    ('button',['Icon','Button','Switch','Checkbox','Radio','Tool','Link']),
+    ('input',['Input','Password']),
+    ('keysym',['Keysym']),
+    ('slider',['VSlider','HSlider','VScrollBar','HScrollBar']),
+    ('select',['Select']),
+    ('misc',['ProgressBar']),
 
-from deprecated import Toolbox, action_open, action_setvalue, action_quit, action_exec
\ No newline at end of file
+    ('menus',['Menus']),
+    ('dialog',['Dialog','FileDialog']),
+
+    ('deprecated',['Toolbox','action_open','action_setvalue','action_quit','action_exec']),
+    ]:
+    for _name in _names: _attrs[_name] = _module
+
+__all__ = [_name for _name in globals().keys() if not _name.startswith('_')] + _attrs.keys()
+
+import sys as _sys
+from pgu import LazyModule as _LazyModule
+_LazyModule(_sys.modules[__name__],_attrs)
@@ -3,6 +3,8 @@
 
 import pygame
 
+from pgu import text
+
 from const import *
 import widget
 
@@ -74,7 +76,7 @@ class Label(widget.Widget):
         self.style.width, self.style.height = self.font.size(self.value)
     
     def paint(self,s):
-        s.blit(self.font.render(self.value, 1, self.style.color),(0,0))
+        s.blit(text.render(self.font,self.value,1,self.style.color),(0,0))
 
 class Image(widget.Widget):
     """An image.
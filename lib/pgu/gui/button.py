@@ -3,6 +3,8 @@
 
 from pygame.locals import *
 
+from pgu import text
+
 from const import *
 import widget, surface
 import basic
@@ -347,5 +349,5 @@ class Link(_button):
         self.style.width, self.style.height = self.font.size(self.value)
     
     def paint(self,s):
-        s.blit(self.font.render(self.value, 1, self.style.color),(0,0))
+        s.blit(text.render(self.font,self.value,1,self.style.color),(0,0))
 
@@ -3,6 +3,8 @@
 import pygame
 from pygame.locals import *
 
+from pgu import text
+
 from const import *
 import widget
 
@@ -50,7 +52,7 @@ class Input(widget.Widget):
         if x < 0: self.vpos -= -x
         if x+cs > s.get_width(): self.vpos += x+cs-s.get_width()
         
-        s.blit(self.font.render(self.value, 1, self.style.color),(-self.vpos,0))
+        s.blit(text.render(self.font,self.value,1,self.style.color),(-self.vpos,0))
         
         if self.container.myfocus is self:
             w,h = self.font.size(self.value[0:self.pos])
@@ -154,7 +156,7 @@ class Password(Input):
         if x < 0: self.vpos -= -x
         if x+cs > s.get_width(): self.vpos += x+cs-s.get_width()
         
-        s.blit(self.font.render(show, 1, self.style.color),(-self.vpos,0))
+        s.blit(text.render(self.font,show,1,self.style.color),(-self.vpos,0))
         
         if self.container.myfocus is self:
             #w,h = self.font.size(self.value[0:self.pos])            
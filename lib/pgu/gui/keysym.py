@@ -3,6 +3,8 @@
 import pygame
 from pygame.locals import *
 
+from pgu import text
+
 from const import *
 import widget
 
@@ -60,7 +62,7 @@ class Keysym(widget.Widget):
         for p in pygame.key.name(self.value).split(): name += p.capitalize()+" "
         #r.x = self.style.padding_left;
         #r.y = self.style.padding_bottom;
-        s.blit(self.style.font.render(name, 1, self.style.color), r)
+        s.blit(text.render(self.style.font,name,1,self.style.color), r)
     
     def __setattr__(self,k,v):
         if k == 'value' and v != None:
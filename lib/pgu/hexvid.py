@@ -9,8 +9,6 @@ help would be greatly appreciated!</p>
 future versions of pgu!</p>
 
 """
-print 'pgu.hexvid','This module is alpha, and is subject to change.'
-
 from pgu.vid import *
 import pygame
 
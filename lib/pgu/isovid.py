@@ -8,91 +8,341 @@ greatly appreciated!</p>
 future versions of pgu!</p>
 
 """
-print 'pgu.isovid','This module is alpha, and is subject to change.'
-
 from pgu.vid import *
+from pgu.tilevid import ChunkCache
 import pygame
 
-class Isovid(Vid):
-    """Create an iso vid engine.  See [[vid]]"""
-    def update(self,screen):
-        return self.paint(screen)
+class IsoChunkCache(ChunkCache):
+    """A cache of pre-rendered blocks of tiles for an Isovid.
     
-    def paint(self,screen):
-        sw,sh = screen.get_width(),screen.get_height()
-        
-        tlayer = self.tlayer
-        blayer = self.blayer
-        zlayer = self.zlayer
-        w,h = len(tlayer[0]),len(tlayer)
+    <pre>IsoChunkCache(g,size=(8,16),limit=8388608)</pre>
+    
+    <dl>
+    <dt>g <dd>the Isovid
+    <dt>size <dd>w,h of each chunk.  w is in base_w wide columns, h in
+              diagonal rows of tiles (the rows with the same tx+ty, which are
+              drawn in the same place in the depth order.)
+    <dt>limit <dd>the most bytes of surfaces to keep
+    </dl>
+    
+    <p>A chunk holds every tile of its rows that reaches into its columns,
+    blayer and tlayer, already drawn on top of each other with their zlayer
+    offsets, on a see-through surface.  Chunks are tall enough for the
+    tallest tile and the highest and lowest zlayer value, worked out the
+    first time one is rendered after a clear.</p>
+    
+    <p>You usually don't create this directly, see Isovid.use_chunks.  See
+    ChunkCache for the attributes.</p>
+    """
+    def __init__(self,g,size=(8,16),limit=8388608):
+        ChunkCache.__init__(self,size,limit)
+        self.g = g
+        self._extent = None
+    
+    def extent(self,g):
+        """Return top,height of every chunk, top from the y of its first row.
         
-        iso_w,iso_h,iso_z,tile_w,tile_h,base_w,base_h = self.iso_w,self.iso_h,self.iso_z,self.tile_w,self.tile_h,self.base_w,self.base_h
+        <pre>IsoChunkCache.extent(g): return top,height</pre>
+        """
+        if self._extent == None:
+            zs = [(min(row),max(row)) for row in g.zlayer]
+            z1,z2 = min([a for a,b in zs])*g.iso_z,max([b for a,b in zs])*g.iso_z
+            z1,z2 = min(z1,z2),max(z1,z2)
+            th = max([t.image_h for t in g.tiles if t != None and t.image != None])
+            top = min(0,g.base_h-th)+z1
+            bottom = (self.size[1]-1)*(g.base_h/2)+max(th,g.base_h)+z2
+            self._extent = top,bottom-top
+        return self._extent
+    
+    def render(self,g,cx,cy):
+        top,height = self.extent(g)
+        cw,ch = self.size
+        cw *= g.base_w
+        ox,oy = cx*cw,cy*ch*(g.base_h/2)+top
+        img = pygame.Surface((cw,height),pygame.SRCALPHA,32).convert_alpha()
+        img.fill((0,0,0,0))
+        g._tiles(img,cy*ch,(cy+1)*ch,ox,ox+cw,ox,oy)
+        return img
+    
+    def invalidate(self,pos):
+        """Throw away the chunks holding the tile at pos.
         
-        base_h2 = base_h/2
-        base_w2 = base_w/2
+        <pre>IsoChunkCache.invalidate(pos)</pre>
+        """
+        g = self.g
+        cw,ch = self.size
+        cw *= g.base_w
+        x,y = pos
+        left = (x-y-1)*(g.base_w/2)
+        for cx in xrange(left/cw,(left+g.tile_w-1)/cw+1):
+            self.discard((cx,(x+y)/ch))
+    
+    def clear(self):
+        ChunkCache.clear(self)
+        self._extent = None
+
+def _merge(rects):
+    #union overlapping rects, so nothing is painted twice
+    r = []
+    for a in rects:
+        i = a.collidelist(r)
+        while i != -1:
+            a = a.union(r.pop(i))
+            i = a.collidelist(r)
+        r.append(a)
+    return r
+
+class Isovid(Vid):
+    """Create an iso vid engine.  See [[vid]]
+    
+    <p>Tiles are drawn one diagonal row (the tiles with the same tx+ty) at a
+    time, back to front, and each Sprite is drawn right after the row
+    just above its center, so the tiles in front of it cover it.</p>
+    
+    <strong>Attributes</strong>
+    <dl>
+    <dt>depths <dd>{row:[sprites]} of the Sprites by the row they are drawn
+            after.  paint and update keep it current, moving only the
+            Sprites that have changed rows.
+    <dt>chunks <dd>an IsoChunkCache of pre-rendered tiles, or None (the
+            default.)  See use_chunks.
+    </dl>
+    """
+    chunks = None
+    
+    def __init__(self):
+        Vid.__init__(self)
+        self.depths = {}
+        self._depth = {} #id(sprite):row
+        self._reach = 0,0
+    
+    def use_chunks(self,size=(8,16),limit=8388608):
+        """Paint tiles from a cache of pre-rendered chunks.
         
-        bot = tile_h/base_h2
-        todo_max = sh/base_h2+bot
-        todo = [[] for y in xrange(0,todo_max)]
+        <p>A full screen paint then takes a few big blits per band of rows,
+        and only the tiles in the rows after a Sprite, under that Sprite,
+        are drawn one at a time.  Chunks holding a tile changed with .set()
+        are rendered again, and loading a level or tiles throws them all
+        away.  If you change the layers directly, or the zlayer at all,
+        call .chunks.clear().  Pass size=None to stop using
+        chunks.</p>
         
-        self.view.w,self.view.h = sw,sh
-        view = self.view
-        adj = self.adj = pygame.Rect(-self.view.x,-self.view.y,0,0)
+        <p>Chunks are made by drawing the tiles onto each other first, so
+        tiles with partly see-through pixels may blend a little differently
+        than without them.  Colorkeyed tiles look the same.</p>
         
-        for s in self.sprites:
-            self.sprite_calc_irect(s)
-            x,y = self.iso_to_view((s.rect.centerx,s.rect.centery))
-            v = (y+adj.y)/base_h2 - 1
-            if v >= 0 and v < todo_max:
-                todo[v].append((s.image,s.irect))
-            #else: print 'doesnt fit',v
-                
-        w,h = len(tlayer[0]),len(tlayer)
-        tiles = self.tiles
+        <pre>Isovid.use_chunks(size=(8,16),limit=8388608)</pre>
         
-        #""
+        <dl>
+        <dt>size <dd>w,h of each chunk, see IsoChunkCache
+        <dt>limit <dd>the most bytes of chunk surfaces to keep around
+        </dl>
+        """
+        if size == None: self.chunks = None
+        else: self.chunks = IsoChunkCache(self,size,limit)
+    
+    def set(self,pos,v):
+        Vid.set(self,pos,v)
+        if self.chunks != None: self.chunks.invalidate(pos)
+    
+    def _clamp(self,screen):
+        self.view.w,self.view.h = screen.get_width(),screen.get_height()
         if self.bounds == None:
+            w,h = self.size
             tmp,y1 = self.tile_to_view((0,0))
             x1,tmp = self.tile_to_view((0,h+1))
             tmp,y2 = self.tile_to_view((w+1,h+1))
             x2,tmp = self.tile_to_view((w+1,0))
             self.bounds = pygame.Rect(x1,y1,x2-x1,y2-y1)
-        #""
-        
-        if self.bounds != None: self.view.clamp_ip(self.bounds)
-
-        ox,oy = self.screen_to_tile((0,0))
-        sx,sy = self.iso_to_view((ox*iso_w,oy*iso_h))
-        dx,dy = sx - self.view.x,sy - self.view.y
-        
-        for i2 in xrange(-bot,self.view.h/base_h2+bot):
-            tx,ty = ox + i2/2 + i2%2,oy + i2/2
-            x,y = (i2%2)*base_w2 + dx,i2*base_h2 + dy
-            
-            #to adjust for the -1 in i1
-            x,tx,ty = x-base_w,tx-1,ty+1
-            for i1 in xrange(-1,self.view.w/base_w+2): #NOTE: not sure why +2
-                if ty >= 0 and ty < h and tx >= 0 and tx < w:
-                    z = zlayer[ty][tx]*iso_z
-                    if blayer != None:
-                        n = blayer[ty][tx]
-                        if n != 0:
-                            t = tiles[n]
-                            if t != None and t.image != None:
-                                screen.blit(t.image,(x-base_w2,y+z))
-                    n = tlayer[ty][tx]
+        self.view.clamp_ip(self.bounds)
+        self.adj = pygame.Rect(-self.view.x,-self.view.y,0,0)
+    
+    def _sort(self):
+        #refile the Sprites that have changed rows, and return the removed ones
+        depths,depth = self.depths,self._depth
+        removed = self.sprites.removed
+        self.sprites.removed = []
+        for s in removed:
+            d = depth.pop(id(s),None)
+            if d != None:
+                row = depths[d]
+                row.remove(s)
+                if not row: del depths[d]
+        base_h2 = self.base_h/2
+        top,bottom = 0,0
+        for s in self.sprites:
+            self.sprite_calc_irect(s)
+            r = s.irect
+            r.w,r.h = s.image.get_width(),s.image.get_height()
+            x,y = self.iso_to_view((s.rect.centerx,s.rect.centery))
+            d = y/base_h2 - 1
+            top,bottom = min(top,r.top-d*base_h2),max(bottom,r.bottom-d*base_h2)
+            old = depth.get(id(s))
+            if old == d: continue
+            if old != None:
+                row = depths[old]
+                row.remove(s)
+                if not row: del depths[old]
+            depth[id(s)] = d
+            row = depths.get(d)
+            if row == None: depths[d] = [s]
+            else: row.append(s)
+        #how far above and below the y of their rows Sprites reach
+        self._reach = top,bottom
+        return removed
+    
+    def _tiles(self,s,d1,d2,x1,x2,ox,oy):
+        #blit the tiles in rows d1 to d2 that might reach view x1 to x2 onto
+        #s, with the view position ox,oy at its top left
+        tlayer,blayer,zlayer,tiles = self.tlayer,self.blayer,self.zlayer,self.tiles
+        w,h = self.size
+        base_h,base_w2,iso_z = self.base_h,self.base_w/2,self.iso_z
+        base_h2 = base_h/2
+        blit = s.blit
+        a,b = (x1-self.tile_w)/base_w2+1,x2/base_w2+1
+        for d in xrange(d1,d2):
+            y = d*base_h2-oy
+            for tx in xrange(max(0,d-h+1,(a+d)/2),min(w,d+1,(b+d)/2+1)):
+                ty = d-tx
+                x = (tx-ty-1)*base_w2-ox
+                z = zlayer[ty][tx]*iso_z
+                if blayer != None:
+                    n = blayer[ty][tx]
                     if n != 0:
                         t = tiles[n]
                         if t != None and t.image != None:
-                            screen.blit(t.image,(x-base_w2,y-(t.image_h-base_h)+z))
-            
-                tx += 1
-                ty -= 1
-                x += base_w
-            for img,irect in todo[y/base_h2]:
-                screen.blit(img,(irect.x+adj.x,irect.y+adj.y))
-
-        return [pygame.Rect(0,0,screen.get_width(),screen.get_height())]
+                            blit(t.image,(x,y+z))
+                n = tlayer[ty][tx]
+                if n != 0:
+                    t = tiles[n]
+                    if t != None and t.image != None:
+                        blit(t.image,(x,y-(t.image_h-base_h)+z))
+    
+    def _draw(self,screen,r):
+        #draw everything under screen rect r, which the screen is clipped to
+        w,h = self.size
+        ox,oy = self.view.x,self.view.y
+        tile_h,base_h2 = self.tile_h,self.base_h/2
+        depths = self.depths
+        blit = screen.blit
+        x1,y1,x2,y2 = r.left+ox,r.top+oy,r.right+ox,r.bottom+oy
+        rows = w+h-1
+        #the rows with Sprites that might be in r
+        above,below = self._reach
+        s1,s2 = (y1-below)/base_h2,(y2-above)/base_h2+1
+        if self.chunks == None:
+            t1,t2 = max(0,(y1-tile_h)/base_h2),min(rows,(y2+tile_h)/base_h2+1)
+            for d in xrange(min(s1,t1),max(s2,t2)):
+                if t1 <= d < t2: self._tiles(screen,d,d+1,x1,x2,ox,oy)
+                if s1 <= d < s2:
+                    for s in depths.get(d,()):
+                        sr = s.irect.move(-ox,-oy)
+                        if sr.colliderect(r): blit(s.image,sr)
+            return
+        #with chunks, each Sprite is drawn over its band, and then the rows
+        #after it in the band are drawn again, but only where it is.  If that
+        #would take more blits than drawing the band without its chunks, the
+        #band is drawn like that instead.
+        chunks = self.chunks
+        cw,ch = chunks.size
+        cw *= self.base_w
+        bh = ch*base_h2
+        top,height = chunks.extent(self)
+        get = chunks.get
+        c1 = max(x1,-h*self.base_w/2)/cw
+        c2 = (min(x2,w*self.base_w/2+self.tile_w)-1)/cw+1
+        cost = ch*((x2-x1+self.tile_w)/self.base_w+1)
+        t1,t2 = max(0,(y1-top-height)/bh),min((rows-1)/ch+1,(y2-top)/bh+1)
+        for b in xrange(min(t1,s1/ch),max(t2,(s2-1)/ch+1)):
+            first,last = b*ch,(b+1)*ch
+            todo,n = [],0
+            for d in xrange(max(first,s1),min(last,s2)):
+                for s in depths.get(d,()):
+                    sr = s.irect.move(-ox,-oy).clip(r)
+                    if sr.w == 0 or sr.h == 0: continue
+                    d2 = min(last,rows,(sr.bottom+oy-top)/base_h2+1)
+                    todo.append((d,d2,s,sr))
+                    n += max(0,d2-d-1)*((sr.w+self.tile_w)/self.base_w+1)
+            if not t1 <= b < t2:
+                for d,d2,s,sr in todo: blit(s.image,s.irect.move(-ox,-oy))
+                continue
+            if n > cost:
+                for d in xrange(first,last):
+                    self._tiles(screen,d,d+1,x1,x2,ox,oy)
+                    for s in depths.get(d,()): blit(s.image,s.irect.move(-ox,-oy))
+                continue
+            for c in xrange(c1,c2):
+                blit(get(self,c,b),(c*cw-ox,b*bh+top-oy))
+            for d,d2,s,sr in todo:
+                blit(s.image,s.irect.move(-ox,-oy))
+                screen.set_clip(sr)
+                self._tiles(screen,d+1,d2,sr.left+ox,sr.right+ox,ox,oy)
+                screen.set_clip(r)
+    
+    def _drawn(self):
+        #remember what was drawn, for the next update
+        alayer = self.alayer
+        for x,y in self.updates: alayer[y][x] = 0
+        self.updates = []
+        self.dirty = []
+        for s in self.sprites:
+            s.updated = 0
+            s._irect = pygame.Rect(s.irect)
+            s._image = s.image
+        self._view = pygame.Rect(self.view)
+    
+    def paint(self,screen):
+        self._clamp(screen)
+        self._sort()
+        r = pygame.Rect(0,0,screen.get_width(),screen.get_height())
+        clip = screen.get_clip()
+        screen.set_clip(r)
+        self._draw(screen,r)
+        screen.set_clip(clip)
+        self._drawn()
+        return [r]
+    
+    def update(self,screen):
+        """Update the screen, redrawing only what has changed.
+        
+        <p>That is where Sprites were and are, if they have moved or been
+        removed or changed image, the tiles changed with .set(), and the
+        rects in .dirty.  Those places are painted black, and then everything
+        in them is drawn again.  If the view has moved, or the screen
+        changed size, this paints the whole screen.</p>
+        
+        <pre>Isovid.update(screen): return [updates]</pre>
+        """
+        self._clamp(screen)
+        view,_view = self.view,self._view
+        if view.x != _view.x or view.y != _view.y or view.size != _view.size:
+            return self.paint(screen)
+        
+        ox,oy = view.x,view.y
+        us = [s._irect for s in self._sort()]
+        for s in self.sprites:
+            if (s.updated or s.image != s._image
+                    or s.irect.x != s._irect.x or s.irect.y != s._irect.y):
+                us.append(s._irect)
+                us.append(s.irect)
+        base_h,base_w2,tile_h = self.base_h,self.base_w/2,self.tile_h
+        zlayer = self.zlayer
+        for x,y in self.updates:
+            top = (x+y)*(base_h/2)+min(0,base_h-tile_h)+zlayer[y][x]*self.iso_z
+            us.append(pygame.Rect((x-y-1)*base_w2,top,self.tile_w,max(tile_h,base_h)-min(0,base_h-tile_h)))
+        us = [u.move(-ox,-oy) for u in us]
+        us.extend(self.dirty)
+        sr = pygame.Rect(0,0,screen.get_width(),screen.get_height())
+        us = _merge([u.clip(sr) for u in us if u.colliderect(sr)])
+        
+        clip = screen.get_clip()
+        for r in us:
+            screen.set_clip(r)
+            screen.fill((0,0,0))
+            self._draw(screen,r)
+        screen.set_clip(clip)
+        self._drawn()
+        return us
         
     def iso_to_view(self,pos):
         tlayer = self.tlayer
@@ -141,6 +391,7 @@ class Isovid(Vid):
         self.tile_w,self.tile_h = size
         self.iso_w,self.iso_h,self.iso_z = self.tile_w,self.tile_w,1
         self.base_w,self.base_h = self.tile_w,self.tile_w/2
+        if self.chunks != None: self.chunks.clear()
     
 
         
@@ -151,6 +402,7 @@ class Isovid(Vid):
         w,h = len(tlayer[0]),len(tlayer)
         
         self.zlayer = [[0 for x in xrange(0,w)] for y in xrange(0,h)]
+        if self.chunks != None: self.chunks.clear()
 
         
 
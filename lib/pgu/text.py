@@ -1,16 +1,84 @@
 """a collection of text rendering functions
+
+<p>Rendering text is slow, so everything here goes through a shared
+TextCache.  Text that doesn't change is only rendered once.</p>
 """
+import pygame
+from pgu.cache import SurfaceCache
+
+class TextCache(SurfaceCache):
+    """A cache of rendered text, shared by everyone who draws text.
+    
+    <pre>TextCache(limit=2097152)</pre>
+    
+    <dl>
+    <dt>limit <dd>the most bytes of surfaces to keep.  The least recently
+              used ones are thrown away to stay under it.
+    </dl>
+    
+    <p>The surfaces handed out are shared, so don't draw on them.  You
+    usually use the module's cache, through render.  See
+    cache.SurfaceCache for the attributes.</p>
+    """
+    def __init__(self,limit=2097152):
+        SurfaceCache.__init__(self,limit)
+        
+    def render(self,font,text,antialias,color,background=None,border=0,bcolor=(0,0,0)):
+        """Return font.render(text,antialias,color,background), from the cache
+        if possible.
+        
+        <pre>TextCache.render(font,text,antialias,color,background=None,border=0,bcolor=(0,0,0)): return surface</pre>
+        
+        <dl>
+        <dt>border <dd>if not 0, the text is drawn with a border this wide
+                   in bcolor, like fonts.BorderFont.  The surface is that
+                   much bigger on every side.
+        </dl>
+        """
+        #pygame.Color isn't hashable
+        color = tuple(color)
+        if background != None: background = tuple(background)
+        if border: bcolor = tuple(bcolor)
+        k = font,text,antialias,color,background,border,bcolor
+        img = self.lookup(k)
+        if img != None: return img
+        if border: img = self._render_border(font,text,antialias,color,background,border,bcolor)
+        elif background != None: img = font.render(text,antialias,color,background)
+        else: img = font.render(text,antialias,color)
+        return self.add(k,img)
+        
+    def _render_border(self,font,text,antialias,color,background,si,bcolor):
+        w,h = font.size(text)
+        size = w+si*2,h+si*2
+        if background == None:
+            s = pygame.Surface(size).convert_alpha()
+            s.fill((0,0,0,0))
+        else:
+            s = pygame.Surface(size).convert()
+            s.fill(background)
+        bg = self.render(font,text,antialias,bcolor)
+        fg = self.render(font,text,antialias,color)
+        dirs = [(-1,-1),(-1,0),(-1,1),(0,-1),(0,1),(1,-1),(1,0),(1,1)]
+        for dx,dy in dirs: s.blit(bg,(si+dx*si,si+dy*si))
+        s.blit(fg,(si,si))
+        return s
+        
+cache = TextCache()
+
+def render(font,text,antialias,color,background=None,border=0,bcolor=(0,0,0)):
+    """render text using the shared cache.  Don't draw on the result.
+    
+    <pre>render(font,text,antialias,color,background=None,border=0,bcolor=(0,0,0)): return surface</pre>
+    """
+    return cache.render(font,text,antialias,color,background,border,bcolor)
+
 def write(s,font,pos,color,text,border=1):
     """write text to a surface with a black border
     
     <pre>write(s,font,pos,color,text,border=1)</pre>
     """
-    i = font.render(text,1,(0,0,0))
-    si = border
-    dirs = [(-1,-1),(-1,0),(-1,1),(0,-1),(0,1),(1,-1),(1,0),(1,1)]
-    for dx,dy in dirs: s.blit(i,(pos[0]+dx*si,pos[1]+dy*si))
-    i = font.render(text,1,color)
-    s.blit(i,pos)
+    i = cache.render(font,text,1,color,None,border)
+    s.blit(i,(pos[0]-border,pos[1]-border))
 
 def writec(s,font,color,text,border=1):
     """write centered text to a surface with a black border
@@ -29,12 +97,11 @@ def writepre(s,font,rect,color,text):
     """
     r,c,txt = rect,color,text
     txt = txt.replace("\t","        ")
-    i = font.render(" ",1,c)
-    sw,sh = i.get_width(),i.get_height()
+    sw,sh = font.size(" ")
     y = r.top
     for sentence in txt.split("\n"):
         x = r.left
-        i = font.render(sentence,1,c)
+        i = cache.render(font,sentence,1,c)
         s.blit(i,(x,y))
         y += sh
 
@@ -45,13 +112,12 @@ def writewrap(s,font,rect,color,text):
     """
     r,c,txt = rect,color,text
     txt = txt.replace("\t","        ")
-    i = font.render(" ",1,c)
-    sw,sh = i.get_width(),i.get_height()
+    sw,sh = font.size(" ")
     y = r.top
     for sentence in txt.split("\n"):
         x = r.left
         for word in sentence.split(" "):
-            i = font.render(word,1,c)
+            i = cache.render(font,word,1,c)
             iw,ih = i.get_width(),i.get_height()
             if x+iw > r.right: x,y = r.left,y+sh
             s.blit(i,(x,y))
@@ -2,9 +2,125 @@
 
 from pgu.vid import *
 import pygame
+from pgu.cache import SurfaceCache
+
+class ChunkCache(SurfaceCache):
+    """A cache of pre-rendered blocks of tiles for a Tilevid.
+    
+    <pre>ChunkCache(size=(16,16),limit=4194304)</pre>
+    
+    <dl>
+    <dt>size <dd>w,h in Tiles of each chunk
+    <dt>limit <dd>the most bytes of surfaces to keep.  The least recently
+              used chunks are thrown away to stay under it.
+    </dl>
+    
+    <p>You usually don't create this directly, see Tilevid.use_chunks.  See
+    cache.SurfaceCache for the attributes.</p>
+    """
+    def __init__(self,size=(16,16),limit=4194304):
+        SurfaceCache.__init__(self,limit)
+        self.size = size
+        
+    def get(self,g,cx,cy):
+        """Return the surface for chunk cx,cy, rendering it if need be.
+        
+        <pre>ChunkCache.get(g,cx,cy): return surface</pre>
+        """
+        img = self.lookup((cx,cy))
+        if img != None: return img
+        return self.add((cx,cy),self.render(g,cx,cy))
+        
+    def render(self,g,cx,cy):
+        tiles = g.tiles
+        tw,th = tiles[0].image_w,tiles[0].image_h
+        cw,ch = self.size
+        w,h = g.size
+        tlayer,blayer = g.tlayer,g.blayer
+        img = pygame.Surface((cw*tw,ch*th)).convert()
+        img.fill((0,0,0))
+        blit = img.blit
+        for y in xrange(cy*ch,min(h,(cy+1)*ch)):
+            trow = tlayer[y]
+            if blayer != None: brow = blayer[y]
+            yy = (y-cy*ch)*th
+            for x in xrange(cx*cw,min(w,(cx+1)*cw)):
+                xx = (x-cx*cw)*tw
+                if blayer != None: blit(tiles[brow[x]].image,(xx,yy))
+                blit(tiles[trow[x]].image,(xx,yy))
+        return img
+        
+    def invalidate(self,pos):
+        """Throw away the chunk holding the tile at pos.
+        
+        <pre>ChunkCache.invalidate(pos)</pre>
+        """
+        cw,ch = self.size
+        self.discard((pos[0]/cw,pos[1]/ch))
 
 class Tilevid(Vid):
     """Based on [[vid]] -- see for reference."""
+    chunks = None
+    
+    def use_chunks(self,size=(16,16),limit=4194304):
+        """Paint tiles from a cache of pre-rendered chunks.
+        
+        <p>A full screen paint then takes a few big blits instead of two
+        per tile.  Chunks holding a tile changed with .set() are rendered
+        again, and loading a level or tiles throws them all away.  If you
+        change the layers directly, call .chunks.clear().  Pass size=None
+        to stop using chunks.  With chunks, empty spots are painted black
+        instead of being left alone.</p>
+        
+        <pre>Tilevid.use_chunks(size=(16,16),limit=4194304)</pre>
+        
+        <dl>
+        <dt>size <dd>w,h in Tiles of each chunk
+        <dt>limit <dd>the most bytes of chunk surfaces to keep around
+        </dl>
+        """
+        if size == None: self.chunks = None
+        else: self.chunks = ChunkCache(size,limit)
+    
+    def set(self,pos,v):
+        Vid.set(self,pos,v)
+        if self.chunks != None: self.chunks.invalidate(pos)
+    
+    def resize(self,size,bg=0):
+        Vid.resize(self,size,bg)
+        if self.chunks != None: self.chunks.clear()
+    
+    def tga_load_level(self,fname,bg=0):
+        Vid.tga_load_level(self,fname,bg)
+        if self.chunks != None: self.chunks.clear()
+    
+    def tga_load_tiles(self,fname,size,tdata={}):
+        Vid.tga_load_tiles(self,fname,size,tdata)
+        if self.chunks != None: self.chunks.clear()
+    
+    def _blit_chunks(self,s,r):
+        #draw the tiles under screen rect r onto s, using the chunk cache
+        tiles = self.tiles
+        tw,th = tiles[0].image_w,tiles[0].image_h
+        cw,ch = self.chunks.size
+        cw,ch = cw*tw,ch*th
+        w,h = self.size
+        ox,oy = self.view.x,self.view.y
+        get = self.chunks.get
+        blit = s.blit
+        x1,y1 = max(0,ox+r.left),max(0,oy+r.top)
+        x2,y2 = min(w*tw,ox+r.right),min(h*th,oy+r.bottom)
+        if x1 >= x2 or y1 >= y2: return
+        for cy in xrange(y1/ch,(y2-1)/ch+1):
+            for cx in xrange(x1/cw,(x2-1)/cw+1):
+                img = get(self,cx,cy)
+                area = Rect(cx*cw,cy*ch,cw,ch).clip(Rect(x1,y1,x2-x1,y2-y1))
+                blit(img,(area.x-ox,area.y-oy),area.move(-cx*cw,-cy*ch))
+        alayer = self.alayer
+        for y in xrange(y1/th,(y2-1)/th+1):
+            arow = alayer[y]
+            for x in xrange(x1/tw,(x2-1)/tw+1): arow[x] = 0
+    
     def paint(self,s):
         sw,sh = s.get_width(),s.get_height()
         self.view.w,self.view.h = sw,sh
@@ -26,7 +142,9 @@ class Tilevid(Vid):
         my = (oy+sh)/th
         if (oy+sh)%th: my += 1
         
-        if blayer != None:
+        if self.chunks != None:
+            self._blit_chunks(s,Rect(0,0,sw,sh))
+        elif blayer != None:
             for y in xrange(oy/th,my):
                 if y >=0 and y < h:
                     trow = tlayer[y]
@@ -65,6 +183,9 @@ class Tilevid(Vid):
             s._irect = Rect(s.irect)
             #s._rect = Rect(s.rect)
 
+        #everything was repainted, so removed Sprites have been erased
+        self.sprites.removed = []
+        if self.updates: self._bg = None
         self.updates = []
         self._view = pygame.Rect(self.view)
         return [Rect(0,0,sw,sh)]
@@ -164,9 +285,119 @@ class Tilevid(Vid):
                 s._irect = Rect(s.irect)
                 s._image = s.image
                 
+        if self.updates: self._bg = None
         self.updates = []
         return us
 
+    _bg = None
+    
+    def scroll_update(self,s):
+        """Update the screen, cheaply, while the view is scrolling.
+        
+        <pre>Tilevid.scroll_update(screen): return [updates]</pre>
+        
+        <dl>
+        <dt>screen <dd>a pygame.Surface to paint to
+        </dl>
+        
+        <p>The tiles of the last frame are kept on a background surface.
+        When the view moves, the background is shifted and only the
+        newly exposed rows and columns of tiles are drawn, then it is
+        blitted to the screen in one go.  When the view stays put, only
+        the places where Sprites were, along with any screen rects you
+        added to .dirty, are restored from the background.  Either way
+        the Sprites are then drawn on top.  The screen must not be
+        changed between calls, except for the parts listed in .dirty.</p>
+        
+        <p>returns a list of updated rectangles.</p>
+        """
+        sw,sh = s.get_width(),s.get_height()
+        self.view.w,self.view.h = sw,sh
+        if self.bounds != None: self.view.clamp_ip(self.bounds)
+        ox,oy = self.view.x,self.view.y
+        
+        bg = self._bg
+        full = 0
+        if bg == None or bg.get_size() != (sw,sh):
+            bg = self._bg = pygame.Surface((sw,sh)).convert()
+            self._paint_tiles(bg,Rect(0,0,sw,sh))
+            full = 1
+        else:
+            bx,by = self._bgview
+            dx,dy = ox-bx,oy-by
+            if abs(dx) >= sw or abs(dy) >= sh:
+                self._paint_tiles(bg,Rect(0,0,sw,sh))
+                full = 1
+            elif dx or dy:
+                bg.scroll(-dx,-dy)
+                if dy > 0: self._paint_tiles(bg,Rect(0,sh-dy,sw,dy))
+                elif dy < 0: self._paint_tiles(bg,Rect(0,0,sw,-dy))
+                if dx > 0: self._paint_tiles(bg,Rect(sw-dx,0,dx,sh))
+                elif dx < 0: self._paint_tiles(bg,Rect(0,0,-dx,sh))
+                full = 1
+        self._bgview = ox,oy
+        
+        tiles = self.tiles
+        tw,th = tiles[0].image_w,tiles[0].image_h
+        us = []
+        #tiles changed with .set()
+        for x,y in self.updates:
+            r = Rect(x*tw-ox,y*th-oy,tw,th)
+            self._paint_tiles(bg,r)
+            us.append(r)
+        self.updates = []
+        us.extend(self.dirty)
+        
+        sprites = self.sprites
+        blit = s.blit
+        if full:
+            blit(bg,(0,0))
+            us = [Rect(0,0,sw,sh)]
+        else:
+            for sp in self.sprites.removed + list(sprites):
+                us.append(sp._irect.move(-ox,-oy))
+            for r in us: blit(bg,r,r)
+        self.dirty = []
+        self.sprites.removed = []
+        
+        for sp in sprites:
+            irect = sp.irect
+            irect.x = sp.rect.x-sp.shape.x
+            irect.y = sp.rect.y-sp.shape.y
+            #the image may have been swapped for one of a different size
+            irect.size = sp.image.get_size()
+            blit(sp.image,(irect.x-ox,irect.y-oy))
+            sp.updated = 0
+            sp._irect.topleft = irect.topleft
+            sp._irect.size = irect.size
+            sp._image = sp.image
+            if not full: us.append(irect.move(-ox,-oy))
+        
+        self._view = pygame.Rect(self.view)
+        return us
+    
+    def _paint_tiles(self,bg,r):
+        #draw the tiles under screen rect r onto bg, clipped to r
+        tiles = self.tiles
+        tw,th = tiles[0].image_w,tiles[0].image_h
+        w,h = self.size
+        tlayer,blayer,alayer = self.tlayer,self.blayer,self.alayer
+        ox,oy = self.view.x,self.view.y
+        blit = bg.blit
+        bg.fill((0,0,0),r)
+        if self.chunks != None: return self._blit_chunks(bg,r)
+        bg.set_clip(r)
+        for y in xrange(max(0,(oy+r.top)/th),min(h,(oy+r.bottom-1)/th+1)):
+            trow,arow = tlayer[y],alayer[y]
+            if blayer != None: brow = blayer[y]
+            yy = y*th-oy
+            for x in xrange(max(0,(ox+r.left)/tw),min(w,(ox+r.right-1)/tw+1)):
+                xx = x*tw-ox
+                if blayer != None: blit(tiles[brow[x]].image,(xx,yy))
+                blit(tiles[trow[x]].image,(xx,yy))
+                arow[x] = 0
+        bg.set_clip(None)
+    
     def view_to_tile(self,pos):
         x,y = pos
         tiles = self.tiles
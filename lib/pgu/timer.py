@@ -2,6 +2,9 @@
 """
 
 import pygame
+import time
+from collections import deque
+from timeit import default_timer
 
 class Timer:
     """A timer for games with set-rate FPS.
@@ -33,6 +36,82 @@ class Timer:
             self.nt = pygame.time.get_ticks()+self.wait
 
 
+class Clock:
+    """A fixed timestep clock, so game logic runs at a set rate no matter
+    how fast frames can be drawn.
+    
+    <pre>Clock(fps,render_fps=None,max_steps=5)</pre>
+    
+    <dl>
+    <dt>fps <dd>how many logic steps to run per second
+    <dt>render_fps <dd>how many frames to draw per second.  Defaults to fps.
+    <dt>max_steps <dd>the most logic steps to run for one drawn frame.  If
+            the game falls further behind than that, the rest of the time is
+            dropped and the game slows down, instead of spending ever longer
+            catching up.
+    </dl>
+    
+    <p>Call tick() once per drawn frame.  It waits until it is time to draw,
+    then returns how many logic steps to run first.  After that, .alpha is
+    how far (0 to 1) the time to draw is between the last step and the
+    next one, for interpolating positions.  Only bother with that if
+    .interpolate is set, which is when frames are drawn faster than logic
+    steps are run.</p>
+    
+    <strong>Attributes</strong>
+    <dl>
+    <dt>alpha <dd>see above
+    <dt>skipped <dd>total number of logic steps dropped to keep up
+    </dl>
+    """
+    def __init__(self,fps,render_fps=None,max_steps=5):
+        if render_fps == None: render_fps = fps
+        self.step = 1.0/fps
+        self.render_step = 1.0/render_fps
+        self.max_steps = max_steps
+        self.interpolate = render_fps > fps
+        self.skipped = 0
+        self.reset()
+        
+    def reset(self):
+        """Forget about any time that has passed, eg. after loading a level.
+        
+        <pre>Clock.reset()</pre>
+        """
+        self.t = default_timer()
+        self.next = self.t
+        #start half a step ahead, so that when drawing and logic run at the
+        #same rate each tick runs exactly one step instead of hovering on
+        #the edge between 0 and 2.
+        self.acc = self.step*1.5
+        self.alpha = 0.0
+        
+    def tick(self):
+        """Wait until the next frame is due.  Call this once per frame.
+        
+        <pre>Clock.tick(): return steps</pre>
+        """
+        t = default_timer()
+        if t < self.next:
+            #sleep for most of it, and spin for the last bit, since sleep
+            #isn't very exact
+            if self.next-t > 0.002: time.sleep(self.next-t-0.002)
+            while t < self.next: t = default_timer()
+            self.next += self.render_step
+        else:
+            self.next = t+self.render_step
+        self.acc += t-self.t
+        self.t = t
+        
+        steps = int(self.acc/self.step)
+        self.acc -= steps*self.step
+        if steps > self.max_steps:
+            self.skipped += steps-self.max_steps
+            steps = self.max_steps
+        self.alpha = self.acc/self.step
+        return steps
+
+
 class Speedometer:
     """A timer replacement that returns out FPS once a second.
     <pre>Speedometer()</pre>
@@ -63,6 +142,160 @@ class Speedometer:
         pygame.time.wait(0) #NOTE: not sure why, but you gotta call this now and again
         return r
 
+
+class Profiler:
+    """Times the phases of each frame, and keeps rolling stats about them.
+    
+    <pre>Profiler(fps=0,size=600)</pre>
+    
+    <dl>
+    <dt>fps <dd>the frame rate you are aiming for, used to count dropped
+            frames.  0 means don't count them.
+    <dt>size <dd>how many frames of history to keep stats for
+    </dl>
+    
+    <p>Wrap each phase of a frame in start(name) and stop(name), and call
+    tick() once at the end of every frame.  Like Speedometer, tick()
+    returns the FPS once a second.  The engine only does this when a
+    Vid's .profiler is set, so there is no cost when it is None.</p>
+    
+    <strong>Attributes</strong>
+    <dl>
+    <dt>fps <dd>always set to the current FPS
+    <dt>dropped <dd>total number of frames that took longer than 1/fps
+    <dt>hud <dd>set to 1 if the stats should be painted on the screen
+    <dt>tracing <dd>set to 1 to record every phase for save_trace
+    </dl>
+    """
+    def __init__(self,fps=0,size=600):
+        self.budget = 0
+        if fps: self.budget = 1.0/fps
+        self.size = size
+        self.phases = []
+        self.history = {'frame':deque(maxlen=size)}
+        self.current = {}
+        self.starts = {}
+        self.hud = 0
+        self.tracing = 0
+        self.events = []
+        self.max_events = 200000
+        self.dropped = 0
+        self.fps = 0
+        self.frames = 0
+        self.total = 0
+        self._lines = None
+        self.t0 = default_timer()
+        self.st = self.ft = self.t0
+        
+    def start(self,name):
+        """Start timing a phase.
+        
+        <pre>Profiler.start(name)</pre>
+        """
+        self.starts[name] = default_timer()
+        
+    def stop(self,name):
+        """Stop timing a phase.
+        
+        <pre>Profiler.stop(name)</pre>
+        """
+        t = default_timer()
+        st = self.starts[name]
+        if name not in self.current:
+            self.current[name] = 0.0
+            if name not in self.history:
+                self.history[name] = deque(maxlen=self.size)
+                self.phases.append(name)
+        self.current[name] += t-st
+        if self.tracing and len(self.events) < self.max_events:
+            self.events.append((name,st,t-st))
+            
+    def tick(self):
+        """Finish the frame.  Call this once per frame.
+        
+        <pre>Profiler.tick(): return fps or None</pre>
+        """
+        t = default_timer()
+        dt = t-self.ft
+        self.ft = t
+        self.history['frame'].append(dt)
+        if self.budget and dt > self.budget: self.dropped += 1
+        for name in self.phases:
+            self.history[name].append(self.current.get(name,0.0))
+        self.current = {}
+        if self.tracing and len(self.events) < self.max_events:
+            self.events.append(('frame',t-dt,dt))
+        
+        r = None
+        self.frames += 1
+        if t-self.st >= 1.0:
+            r = self.fps = self.frames
+            self.frames = 0
+            self.st += 1.0
+        self.total += 1
+        if self.total%10 == 0: self._lines = None
+        return r
+    
+    def stats(self):
+        """Return stats, in ms, for the frames in the history.
+        
+        <pre>Profiler.stats(): return {name:(p50,p95,p99,max)}, info</pre>
+        
+        <p>info is a dict with fps, the number of dropped frames in the
+        history, the total dropped, and the jitter (the standard deviation
+        of the frame time, in ms).</p>
+        """
+        r = {}
+        for name in ['frame']+self.phases:
+            v = sorted(self.history[name])
+            if not v: continue
+            n = len(v)
+            r[name] = tuple([v[min(n-1,int(n*p))]*1000.0 for p in (0.5,0.95,0.99)]) + (v[-1]*1000.0,)
+        frames = self.history['frame']
+        jitter = 0.0
+        if frames:
+            mean = sum(frames)/len(frames)
+            jitter = (sum([(f-mean)**2 for f in frames])/len(frames))**0.5*1000.0
+        recent = 0
+        if self.budget: recent = len([f for f in frames if f > self.budget])
+        info = {'fps':self.fps,'dropped':recent,'total_dropped':self.dropped,
+            'jitter':jitter}
+        return r,info
+    
+    def paint(self,s,font,pos=(0,0),color=(255,255,0)):
+        """Paint the stats onto a surface.  They are recomputed every 10 frames.
+        
+        <pre>Profiler.paint(s,font,pos=(0,0),color=(255,255,0)): return [updates]</pre>
+        """
+        if self._lines == None:
+            r,info = self.stats()
+            self._lines = [font.render(l,1,color,(0,0,0)) for l in 
+                ['%d fps  dropped %d  jitter %.1fms'%(info['fps'],info['dropped'],info['jitter']),
+                '%-16s %6s %6s %6s'%('ms','p50','p95','p99')] + 
+                ['%-16s %6.2f %6.2f %6.2f'%((name,)+r[name][:3]) 
+                    for name in ['frame']+self.phases if name in r]]
+        x,y = pos
+        us = []
+        for img in self._lines:
+            us.append(s.blit(img,(x,y)))
+            y += img.get_height()
+        return us
+    
+    def save_trace(self,fname):
+        """Save the recorded phases as a Chrome trace (chrome://tracing).
+        
+        <pre>Profiler.save_trace(fname)</pre>
+        """
+        import json
+        t0 = self.t0
+        events = [{'name':name,'cat':'frame','ph':'X','pid':1,'tid':1,
+            'ts':int((st-t0)*1000000),'dur':int(dt*1000000)} 
+            for name,st,dt in self.events]
+        f = open(fname,'w')
+        try: json.dump({'traceEvents':events,'displayTimeUnit':'ms'},f)
+        finally: f.close()
+        self.events = []
+
             
 
 # vim: set filetype=python sts=4 sw=4 noet si :
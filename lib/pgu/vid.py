@@ -24,6 +24,8 @@ import pygame
 from pygame.rect import Rect
 from pygame.locals import *
 import math
+from array import array
+from bisect import bisect_left, insort
 
 class Sprite:
     """The object used for Sprites.
@@ -66,6 +68,38 @@ class Sprite:
         self.agroups = 0
         self.updated = 1
         
+    def reset(self,ishape,pos):
+        """Reset the Sprite as if it had just been created.
+        
+        <p>The Sprite's Rects are reused, so this is a cheap way to recycle
+        a Sprite that has been removed instead of making a new one.</p>
+        
+        <pre>Sprite.reset(ishape,pos)</pre>
+        
+        <dl>
+        <dt>ishape <dd>an image, or an image, rectstyle.
+        <dt>pos <dd>new (x,y) position of the Sprite.
+        </dl>
+        """
+        if not isinstance(ishape, tuple):
+            ishape = ishape,None
+        image,shape = ishape
+        if shape == None:
+            shape = pygame.Rect(0,0,image.get_width(),image.get_height())
+        if isinstance(shape, tuple): shape = pygame.Rect(shape)
+        self.image = image
+        self._image = self.image
+        self.shape = shape
+        iw,ih = image.get_width(),image.get_height()
+        for r in (self.rect,self._rect):
+            r.x,r.y,r.w,r.h = pos[0],pos[1],shape.w,shape.h
+        #_irect is left alone, it's where the Sprite was last drawn
+        self.irect.x,self.irect.y = pos[0]-shape.x,pos[1]-shape.y
+        self.irect.w,self.irect.h = iw,ih
+        self.groups = 0
+        self.agroups = 0
+        self.updated = 1
+        
     def setimage(self,ishape):
         """Set the image of the Sprite.
         
@@ -114,19 +148,343 @@ class Tile:
             self.image_w = v.get_width()
         self.__dict__[k] = v
 
-class _Sprites(list):
+class SpriteHash:
+    """A uniform grid used as a broadphase for Sprite-Sprite collisions.
+    
+    <pre>SpriteHash(size=64)</pre>
+    
+    <dl>
+    <dt>size <dd>the width and height in pixels of each cell of the grid
+    </dl>
+    
+    <p>Each Sprite is filed under every cell its rect overlaps, once for
+    each of its groups, so a collision test only needs to look at the
+    Sprites of the groups it can hit in the cells under its own rect.
+    Sprites in no groups can't be hit, so they aren't filed at all.  You
+    usually don't create this directly, see Vid.use_spritehash.</p>
+    
+    <strong>Attributes</strong>
+    <dl>
+    <dt>scan <dd>a group is only looked up in the grid if it has at least
+             this many members and at least this many Sprites can hit it.
+             Otherwise it's quicker to test them all, like Vid does
+             without a grid.
+    </dl>
+    """
+    def __init__(self,size=64):
+        self.size = size
+        self.scan = 16
+        self.cells = {}
+        self.keys = {}
+        self.frozen = 0
+        self.pending = {}
+        
+    #Sprites are filed by id(), since hashing and comparing old style
+    #instances is slow.  Cells are keyed by (group,x,y), and keys holds
+    #the (x1,y1,x2,y2,groups) each Sprite is filed under.
+        
+    def _key(self,rect):
+        size = self.size
+        x1,y1 = rect.left/size,rect.top/size
+        x2 = max(rect.left,rect.right-1)/size
+        y2 = max(rect.top,rect.bottom-1)/size
+        return x1,y1,x2,y2
+        
+    def _file(self,s,k):
+        cells = self.cells
+        i = id(s)
+        x1,y1,x2,y2,g = k
+        n = 1
+        while g:
+            if (g&1)!=0:
+                for y in xrange(y1,y2+1):
+                    for x in xrange(x1,x2+1):
+                        c = cells.get((n,x,y))
+                        if c == None: c = cells[(n,x,y)] = {}
+                        c[i] = s
+            g >>= 1
+            n <<= 1
+        self.keys[i] = k
+    
+    def _unfile(self,s):
+        cells = self.cells
+        i = id(s)
+        x1,y1,x2,y2,g = self.keys.pop(i)
+        n = 1
+        while g:
+            if (g&1)!=0:
+                for y in xrange(y1,y2+1):
+                    for x in xrange(x1,x2+1):
+                        c = cells[(n,x,y)]
+                        del c[i]
+                        if not c: del cells[(n,x,y)]
+            g >>= 1
+            n <<= 1
+        
+    def add(self,s):
+        """Add a Sprite to the grid.
+        
+        <pre>SpriteHash.add(s)</pre>
+        """
+        self.pending.pop(id(s),None)
+        if id(s) in self.keys: self._unfile(s)
+        self._file(s,self._key(s.rect)+(s.groups,))
+        
+    def remove(self,s):
+        """Remove a Sprite from the grid.
+        
+        <p>While the grid is frozen (during Vid.loop_spritehits) removals
+        are put off until it is thawed, so Sprites removed by a hit
+        handler can still be hit for the rest of the frame.</p>
+        
+        <pre>SpriteHash.remove(s)</pre>
+        """
+        if self.frozen: 
+            self.pending[id(s)] = s
+            return
+        if id(s) in self.keys: self._unfile(s)
+        
+    def move(self,s):
+        """Refile a Sprite if it has moved into different cells, or changed
+        groups.
+        
+        <p>While the grid is frozen, Sprites stay filed under the groups
+        they were in when it was frozen, since that's who loop_spritehits
+        tests them against for the rest of the frame.</p>
+        
+        <pre>SpriteHash.move(s)</pre>
+        """
+        old = self.keys.get(id(s))
+        if self.frozen and old != None: g = old[4]
+        else: g = s.groups
+        k = self._key(s.rect)+(g,)
+        if old == k: return
+        if old != None: self._unfile(s)
+        self._file(s,k)
+        
+    def freeze(self):
+        self.frozen = 1
+        
+    def thaw(self):
+        self.frozen = 0
+        pending = self.pending
+        self.pending = {}
+        for s in pending.values(): self.remove(s)
+        
+    def query(self,rect,n):
+        """Return a dict of id:Sprite for the Sprites of group n in the cells
+        under rect.
+        
+        <p>n is the value of a single group, from Vid.groups.  Don't change
+        the dict.</p>
+        
+        <pre>SpriteHash.query(rect,n): return {id:sprite}</pre>
+        """
+        cells = self.cells
+        x1,y1,x2,y2 = self._key(rect)
+        if x1 == x2 and y1 == y2: return cells.get((n,x1,y1),{})
+        r = {}
+        for y in xrange(y1,y2+1):
+            for x in xrange(x1,x2+1):
+                c = cells.get((n,x,y))
+                if c != None: r.update(c)
+        return r
+
+class _Sprites:
+    """The Sprites of a Vid.  It acts like a list you can only append to
+    and remove from, in constant time.
+    
+    <p>Removed Sprites leave a hole that gets skipped, and the holes are
+    squeezed out once there are enough of them, so the order never
+    changes.  It also keeps track of which Sprites are in each group, so
+    counting them doesn't need a loop over all the Sprites.  If you change
+    the groups of a Sprite after adding it, use regroup to have count and
+    group see it right away.  Otherwise Vid.loop_sprites notices, before
+    and after each Sprite's loop.</p>
+    
+    <strong>Attributes</strong>
+    <dl>
+    <dt>removed <dd>the Sprites removed since the last paint
+    <dt>hash <dd>a SpriteHash kept up to date with the Sprites, or None
+    </dl>
+    """
     def __init__(self):
-        list.__init__(self)
+        self.items = []
+        self.index = {}
+        self.holes = 0
+        self.frozen = 0
+        self.pending = []
         self.removed = []
+        self.hash = None
+        self.members = {}
+        self.counts = {}
+        self._groups = {}
+        
+    #Sprites are looked up by id(), and compared with "is", since hashing
+    #and comparing old style instances is slow.
+    
+    def _file(self,v,groups):
+        i = id(v)
+        self._groups[i] = groups
+        self.counts[groups] = self.counts.get(groups,0)+1
+        n = 1
+        while groups:
+            if (groups&1)!=0: 
+                m = self.members.get(n)
+                if m == None: m = self.members[n] = {}
+                m[i] = v
+            groups >>= 1
+            n <<= 1
+    
+    def _unfile(self,v):
+        i = id(v)
+        groups = self._groups.pop(i)
+        c = self.counts[groups]-1
+        if c: self.counts[groups] = c
+        else: del self.counts[groups]
+        n = 1
+        while groups:
+            if (groups&1)!=0: del self.members[n][i]
+            groups >>= 1
+            n <<= 1
         
     def append(self,v):
-        list.append(self,v)
+        """Add a Sprite to the end.
+        
+        <pre>_Sprites.append(v)</pre>
+        """
         v.updated = 1
+        if id(v) in self.index: return
+        self.index[id(v)] = len(self.items)
+        self.items.append(v)
+        self._file(v,v.groups)
+        if self.hash != None: self.hash.add(v)
+        
+    def extend(self,vs):
+        for v in vs: self.append(v)
         
     def remove(self,v):
-        list.remove(self,v)
+        """Remove a Sprite.  Raises ValueError if it isn't here.
+        
+        <pre>_Sprites.remove(v)</pre>
+        """
+        n = self.index.pop(id(v),None)
+        if n == None: raise ValueError('_Sprites.remove(v): v not in sprites')
+        self._unfile(v)
+        if self.frozen: self.pending.append(n)
+        else: self.items[n] = None
+        self.holes += 1
         v.updated = 1
         self.removed.append(v)
+        if self.hash != None: self.hash.remove(v)
+        
+    def regroup(self,v,groups):
+        """Change the groups of a Sprite.
+        
+        <pre>_Sprites.regroup(v,groups)</pre>
+        """
+        if id(v) in self.index and self._groups[id(v)] != groups:
+            self._unfile(v)
+            self._file(v,groups)
+        v.groups = groups
+        
+    def refile(self,v):
+        """File a Sprite under its groups again, if they have changed.
+        
+        <pre>_Sprites.refile(v)</pre>
+        """
+        groups = self._groups.get(id(v))
+        if groups != None and groups != v.groups:
+            self._unfile(v)
+            self._file(v,v.groups)
+        
+    def count(self,groups):
+        """Count the Sprites that are in all of the given groups.
+        
+        <p>This takes time for each different combination of groups the
+        Sprites are in, not for each Sprite.</p>
+        
+        <pre>_Sprites.count(groups): return n</pre>
+        """
+        if groups == 0: return len(self.index)
+        n = 0
+        for g,c in self.counts.iteritems():
+            if (g&groups) == groups: n += c
+        return n
+        
+    def group(self,n):
+        """Return a dict of id:Sprite for the Sprites in group n.
+        
+        <p>n is the value of a single group, from Vid.groups.  Don't change
+        the dict.</p>
+        
+        <pre>_Sprites.group(n): return {id:sprite}</pre>
+        """
+        return self.members.get(n,{})
+        
+    def freeze(self):
+        """Put off filling in the holes left by removed Sprites.
+        
+        <p>Use each() rather than calling this yourself.</p>
+        """
+        self.frozen += 1
+        
+    def thaw(self):
+        self.frozen -= 1
+        if self.frozen: return
+        items = self.items
+        for n in self.pending: items[n] = None
+        self.pending = []
+        if self.holes > 32 and self.holes*2 > len(items): self._squeeze()
+        
+    def _squeeze(self):
+        items = [v for v in self.items if v is not None]
+        index = {}
+        n = 0
+        for v in items:
+            index[id(v)] = n
+            n += 1
+        self.items,self.index,self.holes = items,index,0
+        
+    def each(self):
+        """Iterate over the Sprites as they were when it started.
+        
+        <p>This is like iterating over a copy, without making one: Sprites
+        removed along the way are still visited, and Sprites added along
+        the way are not.</p>
+        
+        <pre>_Sprites.each(): return iterator</pre>
+        """
+        self.freeze()
+        try:
+            items = self.items
+            for n in xrange(len(items)):
+                v = items[n]
+                if v is not None: yield v
+        finally:
+            self.thaw()
+        
+    def __iter__(self):
+        if self.pending:
+            index = self.index
+            return (v for n,v in enumerate(self.items) 
+                if v is not None and index.get(id(v)) == n)
+        return (v for v in self.items if v is not None)
+        
+    def __len__(self):
+        return len(self.index)
+        
+    def __contains__(self,v):
+        return id(v) in self.index
+        
+    def __getitem__(self,n):
+        if not self.holes: return self.items[n]
+        size = len(self.index)
+        if n < 0: n += size
+        if n < 0 or n >= size: raise IndexError('_Sprites index out of range')
+        for v in self:
+            if n == 0: return v
+            n -= 1
         
 class Vid:
     """An engine for rendering Sprites and Tiles.
@@ -135,8 +493,9 @@ class Vid:
     
     <strong>Attributes</strong>
     <dl>
-    <dt>sprites <dd>a list of the Sprites to be displayed.  You may append and
-               remove Sprites from it.
+    <dt>sprites <dd>the Sprites to be displayed.  You may append and
+               remove Sprites from it, and iterate over it like a list.
+               See _Sprites.
     <dt>images  <dd>a dict for images to be put in.  
     <dt>size    <dd>the width, height in Tiles of the layers.  Do not modify.
     <dt>view    <dd>a pygame.Rect of the viewed area.  You may change .x, .y,
@@ -146,9 +505,30 @@ class Vid:
                 as not viewable.
     <dt>tlayer  <dd>the foreground tiles layer
     <dt>clayer  <dd>the code layer (optional)
+    <dt>codeindex <dd>for each row of the clayer, a sorted list of the x
+            positions holding a non-zero code, or None if there is no
+            index.  tga_load_level builds it, and set_code keeps it
+            current.  If you change the clayer directly, call index_codes.
     <dt>blayer  <dd>the background tiles layer (optional)
     <dt>groups  <dd>a hash of group names to group values (32 groups max, as a tile/sprites 
             membership in a group is determined by the bits in an integer)
+    <dt>dirty   <dd>a list of screen rects you have drawn over yourself, eg. with
+            a scoreboard.  Renderers that only redraw what has changed, like
+            Tilevid.scroll_update, will restore them next time.
+    <dt>profiler <dd>a timer.Profiler to time each phase of loop() with, or
+            None (the default.)
+    <dt>layer_typecode <dd>None (the default) to store each layer row as a
+            list, or an array module typecode such as 'B' to store each row
+            as a compact array.  Set it before calling resize or
+            tga_load_level.  Either way layers are indexed layer[y][x].
+    <dt>watchers <dd>a list of functions f(pos) to call after set changes a
+            tile in the tlayer, for things that keep track of the tiles, like
+            algo.FlowField.
+    <dt>paths <dd>an algo.PathQueue that loop runs each frame, or None (the
+            default.)  See use_paths.
+    <dt>opaque <dd>the tlayer values that block line_of_sight, or None (the
+            default) for the values whose Tiles have agroups, that is, the
+            Tiles sprites can hit.
     </dl>
     """
     
@@ -162,8 +542,65 @@ class Vid:
         self._view = pygame.Rect(self.view)
         self.bounds = None
         self.updates = []
+        self.dirty = []
+        self.profiler = None
         self.groups = {}
+        self._strgroups = {}
+        self.layer_typecode = None
+        self.watchers = []
+        self.paths = None
+        self.opaque = None
+        self._sight = {} #line_of_sight answers cached this frame
+        self._blocks = None #for each tile value, whether it's opaque
     
+    def use_spritehash(self,size=64):
+        """Use a SpriteHash as a broadphase for Sprite-Sprite collisions.
+        
+        <p>Without it, every Sprite is tested against every member of the
+        groups it can hit, which gets slow when there are hundreds of
+        Sprites.  With it, that's still done for the groups that are small,
+        or that few Sprites can hit, see SpriteHash.scan.  Hits are reported
+        in the same order either way, even when a hit handler moves the two
+        Sprites in the hit.  If it moves some other Sprite, that one is only
+        refiled by the next loop_spritehits.  Pass size=None to go back to
+        testing everything.</p>
+        
+        <pre>Vid.use_spritehash(size=64)</pre>
+        
+        <dl>
+        <dt>size <dd>the size in pixels of a grid cell.  Somewhat bigger than
+                 your typical Sprite is a good choice.
+        </dl>
+        """
+        if size == None:
+            self.sprites.hash = None
+            return
+        h = SpriteHash(size)
+        for s in self.sprites: h.add(s)
+        self.sprites.hash = h
+        
+    def use_paths(self,search,budget=0.002):
+        """Find the paths Sprites ask for a bit at a time, in loop.
+        
+        <p>Sprites ask with self.paths.request(start,end), and get the
+        path in a later frame.  Each frame, loop spends up to budget
+        seconds finding them.  Pass search=None to stop.  See
+        algo.PathQueue.</p>
+        
+        <pre>Vid.use_paths(search,budget=0.002): return PathQueue</pre>
+        
+        <dl>
+        <dt>search <dd>a function search(start,end) that returns a path, such
+                 as algo.AStar(self.tlayer).search
+        <dt>budget <dd>the most seconds to spend on paths each frame
+        </dl>
+        """
+        from pgu import algo
+        if search == None:
+            self.paths = None
+            return None
+        self.paths = algo.PathQueue(search,budget)
+        return self.paths
         
     def resize(self,size,bg=0):
         """Resize the layers.
@@ -178,13 +615,14 @@ class Vid:
         """
         self.size = size
         w,h = size
-        self.layers = [[[0 for x in xrange(0,w)] for y in xrange(0,h)]
-            for z in xrange(0,4)]
+        blank = self._row([0]*w)
+        self.layers = [[blank[:] for y in xrange(0,h)] for z in xrange(0,4)]
         self.tlayer = self.layers[0]
         self.blayer = self.layers[1]
         if not bg: self.blayer = None
         self.clayer = self.layers[2]
         self.alayer = self.layers[3]
+        self.codeindex = None
         
         self.view.x, self.view.y = 0,0
         self._view.x, self.view.y = 0,0
@@ -192,6 +630,15 @@ class Vid:
         
         self.updates = []
     
+    def _row(self,data):
+        #data is a list of ints or a string of bytes
+        tc = self.layer_typecode
+        if tc == None:
+            if isinstance(data,list): return data
+            return list(bytearray(data))
+        if tc == 'B' or isinstance(data,list): return array(tc,data)
+        return array(tc,bytearray(data))
+    
     def set(self,pos,v):
         """Set a tile in the foreground to a value.
         
@@ -200,6 +647,8 @@ class Vid:
         the tlayer will not guarantee updates unless you are using .paint()
         </p>
         
+        <p>It also tells the watchers.</p>
+        
         <pre>Vid.set(pos,v)</pre>
         
         <dl>
@@ -211,6 +660,39 @@ class Vid:
         self.tlayer[pos[1]][pos[0]] = v
         self.alayer[pos[1]][pos[0]] = 1
         self.updates.append(pos)
+        if self._sight: self._sight.clear()
+        for f in self.watchers: f(pos)
+        
+    def set_code(self,pos,v):
+        """Set a code in the clayer to a value.
+        
+        <p>Use this method to change codes, as it will keep the codeindex
+        current.</p>
+        
+        <pre>Vid.set_code(pos,v)</pre>
+        
+        <dl>
+        <dt>pos <dd>(x,y) of tile
+        <dt>v <dd>value
+        </dl>
+        """
+        x,y = pos
+        row = self.clayer[y]
+        if row[x] == v: return
+        was = row[x]
+        row[x] = v
+        if self.codeindex == None: return
+        xs = self.codeindex[y]
+        if was == 0: insort(xs,x)
+        elif v == 0: del xs[bisect_left(xs,x)]
+    
+    def index_codes(self):
+        """Build the codeindex from the clayer.
+        
+        <pre>Vid.index_codes()</pre>
+        """
+        self.codeindex = [[x for x,n in enumerate(row) if n != 0] 
+            for row in self.clayer]
         
     def get(self,pos):
         """Get the tlayer at pos.
@@ -223,6 +705,118 @@ class Vid:
         """
         return self.tlayer[pos[1]][pos[0]]
     
+    def sight_line(self,a,b):
+        """Walk the tiles a line passes through.
+        
+        <pre>Vid.sight_line(a,b): return generator of (x,y)</pre>
+        
+        <dl>
+        <dt>a <dd>(x,y) in pixels of one end
+        <dt>b <dd>(x,y) in pixels of the other end
+        </dl>
+        
+        <p>yields the position of every tile the line passes through,
+        from a's to b's, one step left, right, up or down at a time.
+        Nothing is built up front, so you can stop as soon as you have
+        seen enough.  Tiles off the edges of the layers are included.</p>
+        """
+        tw,th = self.tiles[0].image_w,self.tiles[0].image_h
+        x0,y0 = a
+        x1,y1 = b
+        tx,ty = x0//tw,y0//th
+        ex,ey = x1//tw,y1//th
+        yield tx,ty
+        #how far it is from the middle of the pixel along x and y to the
+        #next tile edge, doubled to keep it whole, and compared by
+        #multiplying instead of dividing
+        adx,ady = abs(x1-x0),abs(y1-y0)
+        if x1 > x0: sx,nx = 1,2*(tx+1)*tw-2*x0-1
+        else: sx,nx = -1,2*x0+1-2*tx*tw
+        if y1 > y0: sy,ny = 1,2*(ty+1)*th-2*y0-1
+        else: sy,ny = -1,2*y0+1-2*ty*th
+        for _ in xrange(abs(ex-tx)+abs(ey-ty)):
+            if ady == 0 or (adx != 0 and nx*ady <= ny*adx):
+                tx += sx
+                nx += 2*tw
+            else:
+                ty += sy
+                ny += 2*th
+            yield tx,ty
+    
+    def _opaque(self):
+        blocks = self._blocks
+        if blocks == None:
+            if self.opaque == None:
+                blocks = [t != None and t.agroups != 0 for t in self.tiles]
+            else:
+                opaque = self.opaque
+                blocks = [v in opaque for v in xrange(0,len(self.tiles))]
+            self._blocks = blocks
+        return blocks
+    
+    def line_of_sight(self,a,b,cache=False):
+        """Check whether anything opaque is between two points.
+        
+        <pre>Vid.line_of_sight(a,b,cache=False): return True or False</pre>
+        
+        <dl>
+        <dt>a <dd>(x,y) in pixels of one end
+        <dt>b <dd>(x,y) in pixels of the other end
+        <dt>cache <dd>remember the answer, and give it again for the rest of
+            this frame to anyone who asks about the same pair of tiles
+        </dl>
+        
+        <p>returns False if a Tile in between is opaque (see the opaque
+        attribute.)  The tiles a and b are in don't count, so a turret in
+        a wall can still see out.  It stops walking the line at the first
+        opaque Tile.</p>
+        """
+        if cache:
+            tw,th = self.tiles[0].image_w,self.tiles[0].image_h
+            key = (a[0]//tw,a[1]//th,b[0]//tw,b[1]//th)
+            r = self._sight.get(key)
+            if r != None: return r
+        r = self._clear(a,b,self._opaque())
+        if cache: self._sight[key] = r
+        return r
+    
+    def lines_of_sight(self,pairs,cache=True):
+        """Check line_of_sight for lots of pairs of points at once.
+        
+        <pre>Vid.lines_of_sight(pairs,cache=True): return [list of True or False]</pre>
+        
+        <dl>
+        <dt>pairs <dd>a list of (a,b) pairs of (x,y) points in pixels
+        <dt>cache <dd>as for line_of_sight, but on by default, so pairs in the
+            same pair of tiles are only checked once.
+        </dl>
+        """
+        blocks = self._opaque()
+        tw,th = self.tiles[0].image_w,self.tiles[0].image_h
+        sight = self._sight
+        r = []
+        for a,b in pairs:
+            if cache:
+                key = (a[0]//tw,a[1]//th,b[0]//tw,b[1]//th)
+                v = sight.get(key)
+                if v == None: v = sight[key] = self._clear(a,b,blocks)
+            else: v = self._clear(a,b,blocks)
+            r.append(v)
+        return r
+    
+    def _clear(self,a,b,blocks):
+        layer = self.tlayer
+        w,h = self.size
+        line = self.sight_line(a,b)
+        line.next()
+        between = None #the tile before, which is between a and b if the line goes on
+        for pos in line:
+            if between != None:
+                x,y = between
+                if 0 <= x < w and 0 <= y < h and blocks[layer[y][x]]: return False
+            between = pos
+        return True
+    
     def paint(self,s):
         """Paint the screen.
         
@@ -265,16 +859,21 @@ class Vid:
         else: img = fname
         w,h = img.get_width(),img.get_height()
         self.resize((w,h),bg)
-        for y in range(0,h):
-            for x in range(0,w):
-                t,b,c,_a = img.get_at((x,y))
-                self.tlayer[y][x] = t
-                if bg: self.blayer[y][x] = b
-                self.clayer[y][x] = c
+        #pull the whole image at once, then split out the channels
+        data = pygame.image.tostring(img,'RGBA')
+        for layer,n in ((self.tlayer,0),(self.blayer,1),(self.clayer,2)):
+            if layer == None: continue
+            chan = data[n::4]
+            for y in xrange(0,h):
+                layer[y] = self._row(chan[y*w:(y+1)*w])
+        self.index_codes()
                 
     def tga_save_level(self,fname):
         """Save a TGA level.
         
+        <p>Each tile and code is saved as one byte, so every value in the
+        layers must be from 0 to 255, or ValueError is raised.</p>
+        
         <pre>Vid.tga_save_level(fname)</pre>
         
         <dl>
@@ -282,17 +881,20 @@ class Vid:
         </dl>
         """
         w,h = self.size
+        #interleave the layers into one RGB string
+        data = bytearray(w*h*3)
+        for layer,n,name in ((self.tlayer,0,'tlayer'),(self.blayer,1,'blayer'),(self.clayer,2,'clayer')):
+            if layer == None: continue
+            chan = bytearray()
+            for y,row in enumerate(layer):
+                if min(row) < 0 or max(row) > 255:
+                    raise ValueError('Vid.tga_save_level: the %s has a value that is not from 0 to 255 in row %d'%(name,y))
+                chan.extend(bytearray(row))
+            data[n::3] = chan
+        #the same 32 bit surface as always, so the file comes out the same
         img = pygame.Surface((w,h),SWSURFACE,32)
         img.fill((0,0,0,0))
-        for y in range(0,h):
-            for x in range(0,w):
-                t = self.tlayer[y][x]
-                b = 0
-                if self.blayer:
-                    b = self.blayer[y][x]
-                c = self.clayer[y][x]
-                _a = 0
-                img.set_at((x,y),(t,b,c,_a))
+        img.blit(pygame.image.fromstring(bytes(data),(w,h),'RGB'),(0,0))
         pygame.image.save(img,fname)
                 
                 
@@ -351,17 +953,26 @@ class Vid:
                  their codes run
         </dl>
         """
-        tw,th = self.tiles[0].image.get_width(),self.tiles[0].image.get_height()
+        tw,th = self.tiles[0].image_w,self.tiles[0].image_h
 
         x1,y1,w,h = rect
         clayer = self.clayer
+        index = self.codeindex
         t = Tile()
         for y in range(y1,y1+h):
-            for x in range(x1,x1+w):
+            if index == None: xs = range(x1,x1+w)
+            else:
+                #only visit the cells that hold a code
+                if y < 0 or y >= len(index): continue
+                xs = index[y]
+                if not xs: continue
+                xs = xs[bisect_left(xs,x1):bisect_left(xs,x1+w)]
+            for x in xs:
                 n = clayer[y][x]
                 if n in cdata:
                     fnc,value = cdata[n]
                     t.tx,t.ty = x,y
+                    #a new rect each time, since handlers may keep it
                     t.rect = pygame.Rect(x*tw,y*th,tw,th)
                     fnc(self,t,value)
 
@@ -372,7 +983,10 @@ class Vid:
         <pre>Vid.string2groups(str): return groups</pre>
         """
         if str == None: return 0
-        return self.list2groups(str.split(","))
+        #a group never changes its bit, so the result can be remembered
+        v = self._strgroups.get(str)
+        if v == None: v = self._strgroups[str] = self.list2groups(str.split(","))
+        return v
 
     def list2groups(self,igroups):
         """Convert a list to groups.
@@ -408,18 +1022,38 @@ class Vid:
     def loop(self):
         """Update and hit testing loop.  Run this once per frame.
         <pre>Vid.loop()</pre>
+        
+        <p>It also forgets the line_of_sight answers cached last frame, and
+        runs the paths, if there are any.</p>
         """
-        self.loop_sprites() #sprites may move
-        self.loop_tilehits() #sprites move
-        self.loop_spritehits() #no sprites should move
+        if self._sight: self._sight.clear()
+        self._blocks = None
+        prof = self.profiler
+        if prof == None:
+            if self.paths != None: self.paths.run() #paths asked for last frame
+            self.loop_sprites() #sprites may move
+            self.loop_tilehits() #sprites move
+            self.loop_spritehits() #no sprites should move
+        else:
+            if self.paths != None:
+                prof.start('paths')
+                self.paths.run()
+                prof.stop('paths')
+            for name in ('loop_sprites','loop_tilehits','loop_spritehits'):
+                prof.start(name)
+                getattr(self,name)()
+                prof.stop(name)
         for s in self.sprites:
             s._rect = pygame.Rect(s.rect)
         
     def loop_sprites(self):
-        as_ = self.sprites[:]
-        for s in as_:
+        sprites = self.sprites
+        refile = sprites.refile
+        for s in sprites.each():
+            refile(s)
             if hasattr(s,'loop'):
                 s.loop(self,s)
+                refile(s)
 
     def loop_tilehits(self):
         tiles = self.tiles
@@ -427,8 +1061,7 @@ class Vid:
 
         layer = self.layers[0]
 
-        as_ = self.sprites[:]
-        for s in as_:
+        for s in self.sprites.each():
             self._tilehits(s)
     
     def _tilehits(self,s):
@@ -514,8 +1147,10 @@ class Vid:
 
 
     def loop_spritehits(self):
-        as_ = self.sprites[:]
+        if self.sprites.hash != None: 
+            return self._hashed_spritehits(self.sprites,self.sprites.hash)
         
+        as_ = list(self.sprites)
         groups = {}
         for n in range(0,31):
             groups[1<<n] = []
@@ -545,6 +1180,91 @@ class Vid:
                     n <<= 1
 
 
+    def _hashed_spritehits(self,sprites,h):
+        #same hits, in the same order, as the brute force loop above.  The
+        #groups that are big, and that many Sprites can hit, are looked up
+        #in the grid, and a Sprite is only tested against the members under
+        #it that it overlaps.  The rest are tested like above.  The two
+        #Sprites in a hit are refiled after it, and if it moved s, what s
+        #overlaps is looked up again.
+        as_ = list(sprites)
+        groups = {}
+        hitters = {}
+        for s in as_:
+            g = s.groups
+            n = 1
+            while g:
+                if (g&1)!=0:
+                    m = groups.get(n)
+                    if m == None: m = groups[n] = []
+                    m.append(s)
+                g >>= 1
+                n <<= 1
+            g = s.agroups
+            n = 1
+            while g:
+                if (g&1)!=0: hitters[n] = hitters.get(n,0)+1
+                g >>= 1
+                n <<= 1
+        
+        grid = 0
+        for n,m in groups.iteritems():
+            if len(m) >= h.scan and hitters.get(n,0) >= h.scan: grid |= n
+        
+        #the grid Sprites' places in as_, and their groups at the start.  A
+        #Sprite is only found in a group it was in at the start, like above.
+        order = {}
+        start = {}
+        if grid:
+            i = 0
+            for s in as_:
+                if (s.groups&grid)!=0:
+                    h.move(s)
+                    order[id(s)] = i
+                    start[id(s)] = s.groups
+                i += 1
+        
+        def overlaps(s,n):
+            collide = s.rect.colliderect
+            near = [(order[k],b) for k,b in h.query(s.rect,n).iteritems()
+                if collide(b.rect) and b is not s 
+                and k in order and (start[k]&n)!=0]
+            near.sort()
+            return near
+        
+        h.freeze()
+        try:
+            for s in as_:
+                g = s.agroups
+                n = 1
+                while g:
+                    if (g&1)!=0 and (grid&n)!=0:
+                        near = overlaps(s,n)
+                        j = 0
+                        while j < len(near):
+                            i,b = near[j]
+                            j += 1
+                            if ((s.agroups & b.groups)!=0 
+                                    and s.rect.colliderect(b.rect)):
+                                r = tuple(s.rect)
+                                s.hit(self,s,b)
+                                h.move(b)
+                                if id(s) in order: h.move(s)
+                                if tuple(s.rect) != r:
+                                    near = overlaps(s,n)
+                                    j = bisect_left(near,(i+1,))
+                    elif (g&1)!=0 and n in groups:
+                        for b in groups[n]:
+                            if (s is not b and (s.agroups & b.groups)!=0
+                                    and s.rect.colliderect(b.rect)):
+                                s.hit(self,s,b)
+                                if id(b) in order: h.move(b)
+                                if id(s) in order: h.move(s)
+                    g >>= 1
+                    n <<= 1
+        finally:
+            h.thaw()
+    
     def screen_to_tile(self,pos):
         """Convert a screen position to a tile position.
         <pre>Vid.screen_to_tile(pos): return pos</pre>
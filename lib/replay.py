@@ -0,0 +1,286 @@
+# Copyright 2007 Adam Ulvi, Shannon Behrens
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""This records games and plays them back.
+
+Record a game with ``python run_game.py --record FILE``, and play it
+back with ``python run_game.py --replay FILE [--no-draw]``.
+
+A recording has the random seed, the keys that were held down during
+each step of the game logic, and the events the game handled.  Playing
+it back runs the same steps without a window, sound, or waiting for the
+timer, so it goes as fast as the machine allows, and then prints how
+long the frames took.  If --no-draw is given, only the game logic is
+run.
+
+After every step, a hash of the game's state is recorded.  Playing the
+recording back checks the hash, so if the game no longer does what it
+did when it was recorded, you'll hear about the first step that's
+different.
+
+The file is a short header followed by a zlib compressed stream of
+records.  Each record starts with one of these letters:
+
+  K
+    The keys held down changed.  A short with a bit for each key in the
+    header that's down.
+
+  E
+    An event was handled.  A short with the type and an int with the
+    key.
+
+  S
+    A step of the game logic ran.  An int with the state hash.
+
+  F
+    The frame was drawn.  If the Tilevid has a next_vid, it's time to
+    switch to it.
+
+"""
+
+import os
+import random
+import struct
+import sys
+import time
+import zlib
+from array import array
+
+import pygame
+from pygame.locals import *
+
+import main
+from pgu import timer
+
+__docformat__ = 'restructuredtext'
+
+MAGIC = 'HCRP'
+VERSION = 1
+HEADER = '>4sBIB'  # Followed by an int for each key.
+EVENT_TYPES = (KEYDOWN, KEYUP)
+KEYS = [K_UP, K_DOWN, K_LEFT, K_RIGHT, K_SPACE]  # What sprites look at.
+
+
+def state_hash(v):
+    """Return a 32 bit hash of the state of the game in the vid v.
+
+    It covers the frame, the view, and the class, position, and hitcount
+    of every sprite.
+
+    """
+    names = [v.__class__.__name__]
+    a = array('i', [v.frame, v.view.x, v.view.y, len(v.sprites)])
+    for s in v.sprites:
+        names.append(s.__class__.__name__)
+        a.extend(s.rect)
+        a.append(getattr(s, 'hitcount', 0))
+    if sys.byteorder == 'big':
+        a.byteswap()  # Hash the same bytes everywhere.
+    return zlib.crc32(' '.join(names) + a.tostring()) & 0xffffffff
+
+
+class Keys:
+
+    """The keys held down, in a form that looks like pygame.key.get_pressed.
+
+    mask has a bit set for each of the keys that's down.
+
+    """
+
+    def __init__(self, keys, mask=0):
+        self.bits = dict([(key, 1 << i) for i, key in enumerate(keys)])
+        self.mask = mask
+
+    def __getitem__(self, key):
+        return bool(self.mask & self.bits.get(key, 0))
+
+
+class Recorder:
+
+    """Record a game to a file.
+
+    Give it to main.main.  The Tilevids call pre_step and post_step around
+    every step, event for every event they handle, and end_frame after
+    drawing.  Call close when the game is over.
+
+    """
+
+    def __init__(self, fname, seed=None, keys=KEYS):
+        if seed is None:
+            seed = random.randrange(1 << 32)
+        self.seed = seed
+        self.f = open(fname, 'wb')
+        self.f.write(struct.pack(HEADER, MAGIC, VERSION, seed, len(keys)))
+        self.f.write(struct.pack('>%dI' % len(keys), *keys))
+        self.z = zlib.compressobj(9)
+        self.keys = Keys(keys)
+        self.dirty = False
+
+    def write(self, data):
+        self.f.write(self.z.compress(data))
+        self.dirty = True
+
+    def get_pressed(self):
+        """Return the keys held down during this step."""
+        return self.keys
+
+    def event(self, e):
+        if e.type in EVENT_TYPES:
+            self.write(struct.pack('>cHI', 'E', e.type, e.key))
+
+    def pre_step(self, v):
+        state = pygame.key.get_pressed()
+        mask = 0
+        for key, bit in self.keys.bits.iteritems():
+            if state[key]:
+                mask |= bit
+        if mask != self.keys.mask:
+            self.keys.mask = mask
+            self.write(struct.pack('>cH', 'K', mask))
+
+    def post_step(self, v):
+        self.write(struct.pack('>cI', 'S', state_hash(v)))
+
+    def end_frame(self, v):
+        # Frames where nothing happened can't change anything.
+        if self.dirty:
+            self.write('F')
+            self.dirty = False
+
+    def close(self):
+        self.f.write(self.z.flush())
+        self.f.close()
+
+
+def read(fname):
+    """Return (seed, keys, records) for a recording.
+
+    records is a list of (letter, value).  The value is the mask for K,
+    an Event for E, the hash for S, and None for F.
+
+    """
+    f = open(fname, 'rb')
+    try:
+        magic, version, seed, n = struct.unpack(
+            HEADER, f.read(struct.calcsize(HEADER)))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('%s is not a version %d recording' % (fname,
+                                                                    VERSION))
+        keys = struct.unpack('>%dI' % n, f.read(4 * n))
+        data = f.read()
+    finally:
+        f.close()
+    data = zlib.decompress(data)
+    records = []
+    i = 0
+    while i < len(data):
+        c = data[i]
+        i += 1
+        if c == 'K':
+            records.append((c, struct.unpack_from('>H', data, i)[0]))
+            i += 2
+        elif c == 'E':
+            etype, key = struct.unpack_from('>HI', data, i)
+            records.append((c, pygame.event.Event(etype, key=key, mod=0)))
+            i += 6
+        elif c == 'S':
+            records.append((c, struct.unpack_from('>I', data, i)[0]))
+            i += 4
+        elif c == 'F':
+            records.append((c, None))
+        else:
+            raise ValueError('%s is corrupt at byte %d' % (fname, i - 1))
+    return seed, keys, records
+
+
+class Divergence(Exception):
+
+    """The game didn't do what it did when it was recorded."""
+
+
+def play(fname, screen, draw=True, profiler=None):
+    """Play back a recording as fast as possible.
+
+    Return (steps, frames, seconds, slowest), where slowest is
+    (seconds, step) for the slowest frame.  Raise Divergence if a state
+    hash doesn't match.
+
+    """
+    seed, keys, records = read(fname)
+    random.seed(seed)
+    keys = Keys(keys)
+    v = main.SplashScreenTilevid(screen, timer.Timer(0))
+    v.profiler = profiler
+    v.get_pressed = lambda: keys
+    steps = frames = 0
+    slowest = (0.0, 0)
+    start = frame_start = time.time()
+    for c, value in records:
+        if c == 'K':
+            keys.mask = value
+        elif c == 'E':
+            v.handle_event(value)
+        elif c == 'S':
+            v.step_logic()
+            steps += 1
+            h = state_hash(v)
+            if h != value:
+                raise Divergence('Step %d of %s: expected state %08x, got '
+                                 '%08x' % (steps, fname, value, h))
+        else:
+            if draw:
+                v.draw()
+            elif v.bounds is not None:
+                v.view.clamp_ip(v.bounds)  # Painting would have done this.
+            if profiler:
+                profiler.tick()
+            frames += 1
+            t = time.time()
+            slowest = max(slowest, (t - frame_start, steps))
+            frame_start = t
+            if v.next_vid is not None:
+                v = v.next_vid
+                v.get_pressed = lambda: keys
+    return steps, frames, time.time() - start, slowest
+
+
+def main_(args):
+    """Play back the recording named in args."""
+    draw = '--no-draw' not in args
+    args = [arg for arg in args if arg != '--no-draw']
+    if len(args) != 1:
+        print 'Usage: python run_game.py --replay FILE [--no-draw]'
+        sys.exit(1)
+    # Only playing back runs headless; --record needs the real window,
+    # keyboard and sound, so importing this module mustn't set these.
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    pygame.display.init()
+    pygame.font.init()
+    screen = pygame.display.set_mode((main.SCREEN_WIDTH, main.SCREEN_HEIGHT))
+    prof = timer.Profiler(0, size=1 << 20)
+    try:
+        steps, frames, secs, slowest = play(args[0], screen, draw, prof)
+    except Divergence, e:
+        print e
+        sys.exit(1)
+    print 'steps %d, frames %d, %.2fs, %.1f frames per second' % (
+        steps, frames, secs, frames / secs)
+    print 'slowest frame %.3fms, ending at step %d' % (
+        slowest[0] * 1000.0, slowest[1])
+    stats, info = prof.stats()
+    print '%-18s %9s %9s %9s %9s' % ('ms', 'p50', 'p95', 'p99', 'max')
+    for name in ['frame'] + prof.phases:
+        print '%-18s %9.3f %9.3f %9.3f %9.3f' % ((name,) + stats[name])
@@ -0,0 +1,156 @@
+# Copyright 2007 Adam Ulvi, Shannon Behrens
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""This reports where the time goes while the game starts.
+
+Run it with ``python run_game.py --startup-report``.
+
+It starts the game the way main.main does, up to showing the first
+frame, and then makes the level the way pressing return would.  Then it
+prints a timeline of every module imported, every asset loaded, and
+every step along the way, with when it started and how long it took, in
+milliseconds.  Nested entries are indented under what caused them.  The
+time of an entry includes everything indented under it.
+
+It opens a real window and mixer.  Set SDL_VIDEODRIVER=dummy and
+SDL_AUDIODRIVER=dummy to run it without them.
+
+"""
+
+import __builtin__
+import sys
+from timeit import default_timer
+
+__docformat__ = 'restructuredtext'
+
+
+def module_count():
+    """Return how many modules have been imported.
+
+    Python 2 leaves a None in sys.modules for every implicit relative
+    import that turned out to be absolute, so those don't count.
+
+    """
+    return len(sys.modules) - sys.modules.values().count(None)
+
+
+class Timeline:
+
+    """Record imports, asset loads, and steps, with when they happened."""
+
+    def __init__(self):
+        self.start = default_timer()
+        self.entries = []  # [start, seconds, depth, kind, label]
+        self.depth = 0
+        self.real_import = None
+
+    def begin(self, kind, label):
+        """Start an entry, and return it so it can be ended."""
+        entry = [default_timer(), None, self.depth, kind, label]
+        self.entries.append(entry)
+        self.depth += 1
+        return entry
+
+    def end(self, entry):
+        self.depth -= 1
+        entry[1] = default_timer() - entry[0]
+
+    def step(self, label, f, *args):
+        """Return f(*args), and record how long it took."""
+        entry = self.begin('step', label)
+        try:
+            return f(*args)
+        finally:
+            self.end(entry)
+
+    def load_hook(self, filename, kind, seconds):
+        """Record an asset load.  See data.load_hook."""
+        if isinstance(kind, tuple):
+            kind = ' '.join(map(str, kind))
+        self.entries.append([default_timer() - seconds, seconds, self.depth,
+                             'load', '%s (%s)' % (filename, kind)])
+
+    def hook_imports(self):
+        """Record every import that imports something new from now on."""
+        self.real_import = __builtin__.__import__
+        __builtin__.__import__ = self.timed_import
+
+    def unhook_imports(self):
+        __builtin__.__import__ = self.real_import
+
+    def timed_import(self, name, *args, **kargs):
+        count = module_count()
+        entry = self.begin('import', name)
+        try:
+            return self.real_import(name, *args, **kargs)
+        finally:
+            self.end(entry)
+            if module_count() == count:
+                # It was already imported, so nothing under it was either.
+                self.entries.remove(entry)
+
+    def report(self):
+        """Print the timeline, and the totals."""
+        entries = sorted(self.entries)
+        print '%9s %9s  %s' % ('at', 'took', 'what')
+        for start, seconds, depth, kind, label in entries:
+            print '%9.1f %9.1f  %s%s %s' % (
+                (start - self.start) * 1000.0, seconds * 1000.0,
+                '  ' * depth, kind, label)
+        print
+        for kind in ['import', 'load']:
+            # Only add up the outermost ones, so nothing counts twice.
+            total, end, count = 0.0, None, 0
+            for start, seconds, depth, k, label in entries:
+                if k != kind:
+                    continue
+                count += 1
+                if end is None or start >= end:
+                    total += seconds
+                    end = start + seconds
+            print '%-7s %9.1fms for %d' % (kind, total * 1000.0, count)
+
+
+def main_(args):
+    """Start the game, print the report, and quit."""
+    if args:
+        print 'Usage: python run_game.py --startup-report'
+        sys.exit(1)
+    timeline = Timeline()
+    timeline.hook_imports()
+    try:
+        import pygame
+        import data
+        data.load_hook = timeline.load_hook
+        import main
+    finally:
+        timeline.unhook_imports()
+    from pgu import timer
+    screen = timeline.step('set_mode', pygame.display.set_mode,
+                           (main.SCREEN_WIDTH, main.SCREEN_HEIGHT),
+                           pygame.SWSURFACE)
+    timeline.step('font.init', pygame.font.init)
+    timeline.step('init_mixer', main.init_mixer)
+    timeline.step('preload_sounds', main.preload_sounds, main.SOUNDS)
+    v = timeline.step('SplashScreenTilevid', main.SplashScreenTilevid,
+                      screen, timer.Clock(main.FPS))
+    timeline.step('first frame', v.draw)
+    timeline.step('flip', pygame.display.flip)
+    first_frame = default_timer()
+    timeline.step('finish_preloading', data.finish_preloading)
+    timeline.step('LevelTilevid', main.LevelTilevid, None, None, v)
+    timeline.report()
+    print 'the first frame was shown after %.1fms' % (
+        (first_frame - timeline.start) * 1000.0)
@@ -28,5 +28,19 @@ except:
     # Probably running inside py2exe which doesn't set __file__.
     pass
 
-import main
-main.main()
+if '--benchmark' in sys.argv:
+    import bench
+    bench.main_(sys.argv[sys.argv.index('--benchmark') + 1:])
+elif '--replay' in sys.argv:
+    import replay
+    replay.main_(sys.argv[sys.argv.index('--replay') + 1:])
+elif '--startup-report' in sys.argv:
+    import startup
+    startup.main_(sys.argv[sys.argv.index('--startup-report') + 1:])
+elif '--record' in sys.argv:
+    import main
+    import replay
+    main.main(replay.Recorder(sys.argv[sys.argv.index('--record') + 1]))
+else:
+    import main
+    main.main()
@@ -0,0 +1,49 @@
+# Copyright 2007 Adam Ulvi, Shannon Behrens
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for lib/replay.py."""
+
+import os
+import subprocess
+import sys
+import unittest
+
+__docformat__ = 'restructuredtext'
+
+LIBDIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                      os.pardir, 'lib')
+
+
+class ImportTest(unittest.TestCase):
+
+    def test_import_leaves_sdl_drivers_alone(self):
+        # --record imports replay before opening the window, so importing
+        # it mustn't make the game run on the dummy drivers.  It's run in
+        # a fresh interpreter, since pygame may already be imported here.
+        env = dict(os.environ)
+        env.pop('SDL_VIDEODRIVER', None)
+        env.pop('SDL_AUDIODRIVER', None)
+        code = ('import os, replay; '
+                'print os.environ.get("SDL_VIDEODRIVER"), '
+                'os.environ.get("SDL_AUDIODRIVER")')
+        p = subprocess.Popen([sys.executable, '-c', code], cwd=LIBDIR,
+                             env=env, stdout=subprocess.PIPE)
+        out = p.communicate()[0]
+        self.assertEqual(p.returncode, 0)
+        self.assertEqual(out.split()[-2:], ['None', 'None'])
+
+
+if __name__ == '__main__':
+    unittest.main()